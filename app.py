@@ -1,8 +1,10 @@
+import os
 from database.db import initialize_db
 from datetime import timedelta
-from flask import Flask, abort, jsonify, make_response
+from flask import Flask, abort, current_app, jsonify, make_response
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt
-from flask_restful import Api, reqparse, Resource
+from flask_restful import Api, Resource
+from resources.BatchResources import BatchResource
 from resources.DonationResources import (
     DonationListingResource,
     DonationFormResource,
@@ -19,103 +21,192 @@ from resources.RecipientResources import (
     ComplianceStatusResource,
 )
 from resources.UserResources import Users
+from services.RevocationServices import create_revocation_store, token_expiry
 from services.UserService import *
+from utils.Auth import identity_claims
 from utils.JSONEncoder import MongoEngineJSONEncoder
+from utils.Metrics import metrics_response
+from utils.QueryStats import summary as query_summary
+from utils.StructuredLogging import configure_logging
+from utils.Validation import Field, Schema
+
 
-app = Flask(__name__)
-app.config["MONGODB_SETTINGS"] = {
-    "db": "app-donation",
-    "host": "mongodb://localhost:27017/app-donation",
-}
-app.config['JWT_SECRET_KEY'] = "random-key"
-app.config['PROPAGATE_EXCEPTIONS'] = True
-app.config["JWT_BLACKLIST_ENABLED"] = True
-app.config["JWT_BLACKLIST_TOKEN_CHECKS"] = ["access", "refresh"]
-jwt = JWTManager(app)
-initialize_db(app)
-app.json_encoder = MongoEngineJSONEncoder
-api = Api(app)
-blacklist = set()
-
-@jwt.token_in_blocklist_loader
 def check_if_token_in_blacklist(jwt_header, jwt_payload):
     jti = jwt_payload["jti"]
-    return jti in blacklist
+    return current_app.extensions["revocation_store"].is_revoked(jti)
 
 
-login_parser = reqparse.RequestParser()
-login_parser.add_argument("email", type=str, default="")
-login_parser.add_argument("password", type=str, default="")
+login_schema = Schema(email=Field(str, default=""), password=Field(str, default=""))
 
 
 class Sessions(Resource):
     def post(self):
-        args = login_parser.parse_args()
-        if len(args.email) == 0 or len(args.password) == 0:
+        args = login_schema.parse()
+        if len(args["email"]) == 0 or len(args["password"]) == 0:
             abort(400, "email and password are required fields")
-        found_user = find_user_by_email(args.email)
+        found_user = find_user_by_email(args["email"])
         if found_user:
-            password_hash = get_hash(args.password.encode("utf-8"))
+            password_hash = get_hash(args["password"].encode("utf-8"))
             if password_hash == found_user.password_hash:
                 access_token = create_access_token(
-                    identity=args.email, expires_delta=timedelta(seconds=900)
+                    identity=args["email"],
+                    additional_claims=identity_claims(args["email"]),
+                    expires_delta=timedelta(seconds=900),
                 )
                 return make_response(jsonify(access_token=access_token), 200)
         abort(401, "Invalid credentials")
     
     @jwt_required()
     def delete(self):
-        jti = get_jwt()["jti"]
-        blacklist.add(jti)
+        jwt_payload = get_jwt()
+        current_app.extensions["revocation_store"].revoke(
+            jwt_payload["jti"], token_expiry(jwt_payload)
+        )
         return {"message": "Successfully logged out"}, 200
 
 
-# User endpoints
-api.add_resource(Users, '/users')
+class QueryStats(Resource):
+    def get(self):
+        if not current_app.debug:
+            abort(404)
+        return query_summary.report(), 200
 
-# Session endpoints
-api.add_resource(Sessions, "/sessions")
 
+class Metrics(Resource):
+    def get(self):
+        return metrics_response()
 
-# Donation endpoints
-api.add_resource(
-    DonationListingResource,
-    "/donations/listings",
-    "/donations/listings/<string:listing_id>",
-)
-api.add_resource(
-    DonationFormResource,
-    "/donations/listings/<string:listing_id>/forms",
-    "/donations/listings/<string:listing_id>/forms/<string:form_id>",
-)
-api.add_resource(
-    DonationReceiptResource, "/donations/listings/<string:listing_id>/receipts"
-)
-api.add_resource(ReceiptResource, "/donations/receipts")
-api.add_resource(ReceiptDetailResource, "/donations/receipts/<string:receipt_id>")
-api.add_resource(DonationDetailResource, "/donations/<string:donation_id>")
-
-# Donor endpoints
-api.add_resource(DonorResource, "/donors", "/donors/<string:donor_id>")
-api.add_resource(
-    RatingsResource,
-    "/donors/<string:donor_id>/ratings",
-    "/donors/<string:donor_id>/ratings/<string:donation_id>",
-)
-api.add_resource(
-    ImpactLogResource,
-    "/donors/<string:donor_id>/impactlog",
-    "/donors/<string:donor_id>/impactlog/<string:donation_id>",
-)
 
-# Recipient endpoints
-api.add_resource(RecipientResource, "/recipients", "/recipients/<string:recipient_id>")
-api.add_resource(DonationLogResource, "/recipients/<string:recipient_id>/donationlog")
-api.add_resource(TaxStatusResource, "/recipients/<string:recipient_id>/taxexempt")
-api.add_resource(
-    ComplianceStatusResource, "/recipients/<string:recipient_id>/compliance"
-)
+def register_routes(api):
+    # User endpoints
+    api.add_resource(Users, '/users')
+
+    # Session endpoints
+    api.add_resource(Sessions, "/sessions")
+
+    # Debug endpoints
+    api.add_resource(QueryStats, "/debug/queries")
+    api.add_resource(Metrics, "/metrics")
+
+    # Donation endpoints
+    api.add_resource(
+        DonationListingResource,
+        "/donations/listings",
+        "/donations/listings/<string:listing_id>",
+    )
+    api.add_resource(
+        DonationFormResource,
+        "/donations/listings/<string:listing_id>/forms",
+        "/donations/listings/<string:listing_id>/forms/<string:form_id>",
+    )
+    api.add_resource(
+        DonationReceiptResource, "/donations/listings/<string:listing_id>/receipts"
+    )
+    api.add_resource(ReceiptResource, "/donations/receipts")
+    api.add_resource(
+        ReceiptDetailResource, "/donations/receipts/<string:receipt_id>"
+    )
+    api.add_resource(DonationDetailResource, "/donations/<string:donation_id>")
+
+    # Donor endpoints
+    api.add_resource(DonorResource, "/donors", "/donors/<string:donor_id>")
+    api.add_resource(
+        RatingsResource,
+        "/donors/<string:donor_id>/ratings",
+        "/donors/<string:donor_id>/ratings/<string:donation_id>",
+    )
+    api.add_resource(
+        ImpactLogResource,
+        "/donors/<string:donor_id>/impactlog",
+        "/donors/<string:donor_id>/impactlog/<string:donation_id>",
+    )
+
+    # Batch endpoint
+    api.add_resource(BatchResource, "/batch")
+
+    # Recipient endpoints
+    api.add_resource(
+        RecipientResource, "/recipients", "/recipients/<string:recipient_id>"
+    )
+    api.add_resource(
+        DonationLogResource, "/recipients/<string:recipient_id>/donationlog"
+    )
+    api.add_resource(TaxStatusResource, "/recipients/<string:recipient_id>/taxexempt")
+    api.add_resource(
+        ComplianceStatusResource, "/recipients/<string:recipient_id>/compliance"
+    )
+
+
+# Builds a configured app. `config` overrides the defaults below; the
+# MongoDB host and pool size can also be set through the environment, which
+# is how gunicorn.conf.py passes its worker settings down.
+def create_app(config=None):
+    app = Flask(__name__)
+    app.config["MONGODB_SETTINGS"] = {
+        "db": "app-donation",
+        "host": os.environ.get(
+            "MONGODB_HOST", "mongodb://localhost:27017/app-donation"
+        ),
+        "connect": False,
+        "maxPoolSize": int(os.environ.get("MONGODB_MAX_POOL_SIZE", 100)),
+    }
+    app.config["JWT_SECRET_KEY"] = "random-key"
+    app.config["PROPAGATE_EXCEPTIONS"] = True
+    app.config["JWT_BLACKLIST_ENABLED"] = True
+    app.config["JWT_BLACKLIST_TOKEN_CHECKS"] = ["access", "refresh"]
+    app.config["DONATION_LOG_STORAGE"] = "embedded"
+    # "memory" only revokes tokens in the worker that handled the logout; use
+    # "mongo" when serving from more than one process
+    app.config["JWT_REVOCATION_STORE"] = "memory"
+    app.config["JWT_REVOCATION_SYNC_SECONDS"] = 1.0
+    # Per-request MongoDB accounting: X-DB-* response headers in debug mode,
+    # per-endpoint totals at /debug/queries and a warning when a request
+    # repeats one query shape more than QUERY_REPEAT_LIMIT times. None turns
+    # it on in debug mode only. Reply sizes cost a BSON encode of every reply,
+    # so they are only counted with QUERY_STATS_BYTES.
+    app.config["QUERY_STATS"] = None
+    app.config["QUERY_STATS_BYTES"] = False
+    app.config["QUERY_REPEAT_LIMIT"] = 5
+    # Prometheus metrics at /metrics
+    app.config["METRICS"] = True
+    # Levels and DEBUG sampling rates by logger name ("" is the root logger)
+    app.config["LOG_LEVELS"] = {"": "INFO"}
+    app.config["LOG_SAMPLING"] = {}
+    app.config["LOG_QUEUE_SIZE"] = 10000
+    # Pages of GET /donations/listings kept per worker process; 0 disables
+    # the cache. Writes in other workers are only seen once the TTL expires.
+    app.config["LISTING_CACHE_SIZE"] = 1024
+    app.config["LISTING_CACHE_TTL"] = 10.0
+    # Donor and recipient documents and the profile ids of emails. "memory"
+    # is per worker, so other workers see a write once the TTL expires; "resp"
+    # shares one Redis-protocol server between every worker. "none" disables.
+    app.config["ENTITY_CACHE"] = (
+        "resp" if os.environ.get("ENTITY_CACHE_URL") else "memory"
+    )
+    app.config["ENTITY_CACHE_URL"] = os.environ.get("ENTITY_CACHE_URL")
+    app.config["ENTITY_CACHE_TTL"] = 5.0
+    app.config.update(config or {})
+    configure_logging(app)
+    jwt = JWTManager(app)
+    jwt.token_in_blocklist_loader(check_if_token_in_blacklist)
+    initialize_db(app)
+    app.json_encoder = MongoEngineJSONEncoder
+    app.extensions["revocation_store"] = create_revocation_store(
+        app.config["JWT_REVOCATION_STORE"], app.config["JWT_REVOCATION_SYNC_SECONDS"]
+    )
+    register_routes(Api(app))
+    return app
+
+
+# `from app import app` keeps working: the default app is built on first use
+# rather than at import, so importing create_app has no side effects
+def __getattr__(name):
+    global app
+    if name != "app":
+        raise AttributeError(name)
+    app = create_app()
+    return app
 
 
 if __name__ == "__main__":
-    app.run()
+    create_app().run()
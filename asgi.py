@@ -0,0 +1,96 @@
+"""Optional async serving mode.
+
+GET /donations/listings, /donors and /recipients run on the event loop with
+motor, the asyncio MongoDB driver, so a slow query does not hold a thread.
+Every other route is handed to the WSGI app in a thread pool, so the API is
+the same as in WSGI mode. Needs starlette, motor and an ASGI server:
+
+    uvicorn asgi:application --workers 4
+"""
+import contextlib
+from motor.motor_asyncio import AsyncIOMotorClient
+from resources.DonationResources import listing_list_arguments
+from resources.DonorResources import donor_list_arguments
+from resources.RecipientResources import recipient_list_arguments
+from services.DonationServices import listing_cache_key, plan_listings
+from services.DonorServices import plan_donors
+from services.RecipientServices import plan_recipients
+from starlette.applications import Starlette
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.responses import Response
+from starlette.routing import Mount, Route
+from utils.ETags import PUBLIC, make_etag
+from utils.Fields import InvalidFieldsError
+from utils.Pagination import InvalidCursorError, InvalidPageError
+from utils.ReadPlans import run_plan_async
+from utils.Serializer import dumps
+from werkzeug.http import parse_etags, quote_etag
+from wsgi import application as wsgi_application
+
+
+def json_response(obj, status=200, dates="extended"):
+    return Response(
+        dumps(obj, dates), status_code=status, media_type="application/json"
+    )
+
+
+# GET /donations/listings, with the same ETags as the WSGI route
+async def listings(request):
+    try:
+        arguments = listing_list_arguments(request.query_params)
+        plan = plan_listings(**arguments)
+    except (InvalidCursorError, InvalidPageError) as e:
+        return json_response({"message": str(e)}, 400)
+    database = request.app.state.database
+    etag = make_etag(
+        ("listings", listing_cache_key(**arguments)),
+        await run_plan_async(plan.stamps(), database),
+    )
+    headers = {"ETag": quote_etag(etag), "Cache-Control": PUBLIC}
+    if parse_etags(request.headers.get("if-none-match")).contains_weak(etag):
+        return Response(status_code=304, headers=headers)
+    response = json_response(await run_plan_async(plan, database), dates="iso")
+    response.headers.update(headers)
+    return response
+
+
+# GET /donors
+async def donors(request):
+    try:
+        plan = plan_donors(**donor_list_arguments(request.query_params))
+    except (InvalidCursorError, InvalidFieldsError, InvalidPageError) as e:
+        return json_response({"error": str(e)}, 400)
+    return json_response(await run_plan_async(plan, request.app.state.database))
+
+
+# GET /recipients
+async def recipients(request):
+    try:
+        plan = plan_recipients(**recipient_list_arguments(request.query_params))
+    except (InvalidCursorError, InvalidFieldsError, InvalidPageError) as e:
+        return json_response({"error": str(e)}, 400)
+    return json_response(await run_plan_async(plan, request.app.state.database))
+
+
+# The motor client is created inside each server process, on its own loop,
+# with the same host, database and pool size as the WSGI app
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    settings = wsgi_application.config["MONGODB_SETTINGS"]
+    client = AsyncIOMotorClient(settings["host"], maxPoolSize=settings["maxPoolSize"])
+    app.state.database = client[settings["db"]]
+    try:
+        yield
+    finally:
+        client.close()
+
+
+application = Starlette(
+    routes=[
+        Route("/donations/listings", listings, methods=["GET"]),
+        Route("/donors", donors, methods=["GET"]),
+        Route("/recipients", recipients, methods=["GET"]),
+        Mount("/", WSGIMiddleware(wsgi_application)),
+    ],
+    lifespan=lifespan,
+)
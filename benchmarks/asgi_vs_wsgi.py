@@ -0,0 +1,150 @@
+"""Read endpoint throughput of the ASGI mode against the WSGI mode.
+
+Serves the app with gunicorn (gunicorn.conf.py) and with uvicorn (asgi.py)
+using the same number of processes, then holds --connections concurrent
+keep-alive clients on GET /donations/listings, /donors and /recipients for a
+fixed time. Reports requests per second, latency percentiles and failed
+requests per mode. Needs gunicorn, uvicorn, starlette, motor and a
+reachable, seeded mongod.
+
+    python -m benchmarks.asgi_vs_wsgi --processes 2 --connections 2000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+from benchmarks.load_test import wait_until_ready
+
+PATHS = [
+    "/donations/listings?pagesize=10",
+    "/donors?pagesize=10",
+    "/recipients?pagesize=10",
+]
+
+
+async def read_response(reader):
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("connection closed")
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return int(status_line.split()[1])
+
+
+async def client(port, deadline, offset, latencies, failures):
+    reader = writer = None
+    i = offset
+    while time.perf_counter() < deadline:
+        path = PATHS[i % len(PATHS)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(
+                f"GET {path} HTTP/1.1\r\nHost: bench\r\n\r\n".encode("latin-1")
+            )
+            status = await asyncio.wait_for(read_response(reader), 30)
+        except (OSError, ConnectionError, asyncio.TimeoutError, ValueError):
+            failures.append(path)
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            await asyncio.sleep(0.05)
+            continue
+        if status >= 500:
+            failures.append(path)
+        else:
+            latencies.append(time.perf_counter() - started)
+    if writer is not None:
+        writer.close()
+
+
+async def drive(port, connections, duration):
+    deadline = time.perf_counter() + duration
+    latencies, failures = [], []
+    await asyncio.gather(
+        *(
+            client(port, deadline, i, latencies, failures)
+            for i in range(connections)
+        )
+    )
+    return sorted(latencies), len(failures)
+
+
+def server_command(mode, processes, port):
+    if mode == "wsgi":
+        return [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py"]
+    return [
+        sys.executable,
+        "-m",
+        "uvicorn",
+        "asgi:application",
+        "--workers",
+        str(processes),
+        "--port",
+        str(port),
+        "--no-access-log",
+        "--log-level",
+        "warning",
+    ]
+
+
+def run(mode, args):
+    env = dict(
+        os.environ,
+        WEB_CONCURRENCY=str(args.processes),
+        BIND=f"127.0.0.1:{args.port}",
+    )
+    server = subprocess.Popen(
+        server_command(mode, args.processes, args.port),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_ready(args.port, server)
+        return asyncio.run(drive(args.port, args.connections, args.duration))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=2)
+    parser.add_argument("--connections", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--modes", nargs="+", default=["wsgi", "asgi"])
+    args = parser.parse_args()
+
+    print(
+        f"{args.processes} process(es), {args.connections} concurrent connections, "
+        f"{args.duration:.0f}s per mode"
+    )
+    for mode in args.modes:
+        latencies, failures = run(mode, args)
+        if not latencies:
+            print(f"{mode}: no successful requests, {failures} failed")
+            continue
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(
+            f"{mode}: {len(latencies) / args.duration:9.1f} req/s "
+            f"p50 {statistics.median(latencies) * 1000:8.2f} ms "
+            f"p99 {p99 * 1000:8.2f} ms failed {failures}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Entity cache backends: read latency and loads on a cold key.
+
+For each backend ("none", "memory" and "resp"), reads --keys donor-sized
+documents --reads times from --threads threads, with a simulated database
+read of --load-ms on every miss, and reports the per-read latency and how
+many loads ran. Then --threads threads ask for one cold key at once and the
+number of loads it took is reported; stampede protection keeps it at 1.
+The "resp" backend uses --url, or a stand-in server started in process.
+Needs no MongoDB.
+
+    python -m benchmarks.entity_cache --threads 16 --reads 20000
+"""
+import argparse
+import datetime
+import statistics
+import threading
+import time
+from benchmarks import resp_server
+from bson import ObjectId
+from utils.EntityCache import EntityCache, create_backend
+
+
+def document(i):
+    return {
+        "_id": ObjectId(),
+        "donor_id": f"donor-{i}",
+        "first_name": "Karim",
+        "last_name": "Doe",
+        "email": f"donor{i}@example.org",
+        "address": {"city": "Pittsburgh", "state": "PA", "zip_code": "15213"},
+        "ratings": {"stars_sum": 40, "total_ratings": 10},
+        "donations": [
+            {
+                "donation_id": f"{i}-{n}",
+                "total_lbs_food": 12.5,
+                "date": datetime.datetime(2024, 1, 1) + datetime.timedelta(days=n),
+            }
+            for n in range(20)
+        ],
+        "version": 3,
+    }
+
+
+class Loader:
+    def __init__(self, delay):
+        self.delay = delay
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, i):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return document(i)
+
+
+def reads(cache, loader, keys, count, latencies):
+    for n in range(count):
+        i = n % keys
+        started = time.perf_counter()
+        cache.get("donor", f"donor-{i}", lambda: loader(i))
+        latencies.append(time.perf_counter() - started)
+
+
+def run(cache, args):
+    loader = Loader(args.load_ms / 1000)
+    latencies = []
+    threads = [
+        threading.Thread(
+            target=reads,
+            args=(cache, loader, args.keys, args.reads // args.threads, latencies),
+        )
+        for _ in range(args.threads)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+
+    cold = Loader(args.load_ms / 1000)
+    barrier = threading.Barrier(args.threads)
+
+    def cold_read():
+        barrier.wait()
+        cache.get("donor", "cold", lambda: cold(0))
+
+    threads = [threading.Thread(target=cold_read) for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return statistics.median(latencies), p99, loader.calls, cold.calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--reads", type=int, default=20000)
+    parser.add_argument("--keys", type=int, default=200)
+    parser.add_argument("--load-ms", type=float, default=2.0)
+    parser.add_argument("--url", help="RESP server; a stand-in is started if unset")
+    args = parser.parse_args()
+
+    url = args.url
+    if url is None:
+        server = resp_server.start()
+        url = f"resp://127.0.0.1:{server.server_address[1]}/0"
+    print(
+        f"{args.reads} reads of {args.keys} keys from {args.threads} threads, "
+        f"{args.load_ms:.1f} ms per load"
+    )
+    for backend in ("none", "memory", "resp"):
+        cache = EntityCache(create_backend(backend, url), ttl=60.0)
+        p50, p99, loads, cold_loads = run(cache, args)
+        print(
+            f"{backend:>6}: p50 {p50 * 1e6:9.1f} us  p99 {p99 * 1e6:9.1f} us  "
+            f"loads {loads:6}  cold key loads with {args.threads} readers "
+            f"{cold_loads}"
+        )
+
+
+if __name__ == "__main__":
+    main()
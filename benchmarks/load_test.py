@@ -0,0 +1,144 @@
+"""Throughput of the gunicorn deployment as workers are added.
+
+Starts gunicorn with gunicorn.conf.py once per worker count, drives it with
+keep-alive HTTP clients spread over several processes for a fixed time and
+reports requests per second and latency percentiles. Needs gunicorn and a
+reachable, seeded mongod (python manage.py seed).
+
+    python -m benchmarks.load_test --workers 1 2 4 8 --duration 20
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+PATHS = [
+    "/donations/listings?pagesize=10",
+    "/donors?pagesize=10",
+    "/recipients?pagesize=10",
+    "/donors?name=ka&pagesize=10",
+]
+
+
+def client_thread(port, deadline, latencies, errors):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    i = 0
+    while time.perf_counter() < deadline:
+        path = PATHS[i % len(PATHS)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            connection.request("GET", path)
+            response = connection.getresponse()
+            response.read()
+            if response.status >= 500:
+                errors.append(response.status)
+        except (OSError, http.client.HTTPException):
+            errors.append("connection")
+            connection.close()
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+# One load-generating process, so that the client is not limited by the GIL
+def client_process(args):
+    port, threads, duration = args
+    deadline = time.perf_counter() + duration
+    latencies, errors = [], []
+    workers = [
+        threading.Thread(
+            target=client_thread, args=(port, deadline, latencies, errors)
+        )
+        for _ in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return latencies, len(errors)
+
+
+def wait_until_ready(port, server, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("gunicorn exited during startup")
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/metrics")
+            connection.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn did not start in time")
+
+
+def run(workers, args):
+    env = dict(
+        os.environ,
+        WEB_CONCURRENCY=str(workers),
+        GUNICORN_THREADS=str(args.threads),
+        BIND=f"127.0.0.1:{args.port}",
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_ready(args.port, server)
+        with multiprocessing.Pool(args.client_processes) as pool:
+            results = pool.map(
+                client_process,
+                [(args.port, args.client_threads, args.duration)]
+                * args.client_processes,
+            )
+    finally:
+        server.terminate()
+        server.wait()
+    latencies = sorted(value for result in results for value in result[0])
+    errors = sum(result[1] for result in results)
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=[1, 2, 4, multiprocessing.cpu_count()],
+    )
+    parser.add_argument("--threads", type=int, default=8, help="Threads per worker")
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--client-processes", type=int, default=4)
+    parser.add_argument("--client-threads", type=int, default=16)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    baseline = None
+    for workers in sorted(set(args.workers)):
+        latencies, errors = run(workers, args)
+        if not latencies:
+            print(f"{workers:3} worker(s) no successful requests, errors {errors}")
+            continue
+        throughput = len(latencies) / args.duration
+        baseline = baseline or throughput
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(
+            f"{workers:3} worker(s) {throughput:9.1f} req/s "
+            f"({throughput / baseline:4.2f}x) "
+            f"p50 {statistics.median(latencies) * 1000:7.2f} ms "
+            f"p99 {p99 * 1000:7.2f} ms errors {errors}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Concurrent ratings against a single donor.
+
+Creates one donor with N donations on a local mongod, fires one rating per
+donation from a thread pool and checks that the stored counters and the
+derived average are exact.
+
+    python -m benchmarks.ratings_contention --ratings 1000 --workers 64
+"""
+import argparse
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from mongoengine import connect, disconnect
+from models.Donor import Donor, Donation
+from models.DonationBucket import DonationBucket
+from services.BucketServices import insert_buckets, set_storage_mode
+from services.DonorServices import create_rating, get_ratings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--host", default="mongodb://localhost:27017/app-donation-bench"
+    )
+    parser.add_argument("--ratings", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=64)
+    parser.add_argument(
+        "--storage", choices=["embedded", "bucketed"], default="embedded"
+    )
+    args = parser.parse_args()
+
+    connect(host=args.host, maxPoolSize=args.workers)
+    set_storage_mode(args.storage)
+    Donor.drop_collection()
+    DonationBucket.drop_collection()
+    Donor.ensure_indexes()
+    DonationBucket.ensure_indexes()
+
+    donor_id = str(uuid.uuid4())
+    donations = [Donation(total_lbs_food=10.0) for _ in range(args.ratings)]
+    donor = Donor(
+        donor_id=donor_id,
+        first_name="Bench",
+        last_name="Donor",
+        email="bench@example.org",
+        phone_number="555-555-5555",
+        tax_id="000000000",
+        company_association="Bench",
+        donations=[] if args.storage == "bucketed" else donations,
+    )
+    donor.save()
+    if args.storage == "bucketed":
+        insert_buckets(
+            "donor",
+            donor_id,
+            "donations",
+            [donation.to_mongo().to_dict() for donation in donations],
+        )
+
+    random.seed(42)
+    stars = {donation.donation_id: random.randint(1, 5) for donation in donations}
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        results = list(
+            pool.map(
+                lambda item: create_rating(donor_id, item[0], item[1]),
+                stars.items(),
+            )
+        )
+    elapsed = time.perf_counter() - started
+
+    errors = [result["error"] for result in results if "error" in result]
+    ratings = get_ratings(donor_id)
+    expected_average = sum(stars.values()) / len(stars)
+    print(f"storage:          {args.storage}")
+    print(f"ratings:          {len(stars)} in {elapsed:.2f}s ({len(stars) / elapsed:.0f}/s)")
+    print(f"errors:           {len(errors)}")
+    print(f"total_ratings:    {ratings['total_ratings']} (expected {len(stars)})")
+    print(f"average:          {ratings['stars']!r} (expected {expected_average!r})")
+    exact = (
+        not errors
+        and ratings["total_ratings"] == len(stars)
+        and ratings["stars"] == expected_average
+    )
+    print("exact" if exact else "MISMATCH")
+
+    Donor.drop_collection()
+    DonationBucket.drop_collection()
+    disconnect()
+    raise SystemExit(0 if exact else 1)
+
+
+if __name__ == "__main__":
+    main()
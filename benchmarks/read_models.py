@@ -0,0 +1,165 @@
+"""Latency and memory of GET /donors/:donorId by the object built per request.
+
+Starts from the BSON the driver receives for a donor with thousands of
+embedded donations and times decode, build and JSON encode for: a MongoEngine
+Donor document (_from_son, as QuerySet reads without as_pymongo() build
+them), read models of __slots__ classes and of frozen dataclasses built from
+the raw document, and the raw document itself, which is what the services
+return. Peak traced memory per request is reported with tracemalloc. Needs
+no database.
+
+    python -m benchmarks.read_models --donations 5000 --repeat 20
+"""
+import argparse
+import dataclasses
+import datetime
+import json
+import time
+import tracemalloc
+
+import bson
+from benchmarks.serialization import build_raw_donor
+from models.Donor import Donor
+from utils import Serializer
+
+
+DONATION_FIELDS = (
+    "donation_id",
+    "receipt_id",
+    "total_lbs_food",
+    "lbs_food_for_consumption",
+    "lbs_food_for_farms",
+    "lbs_food_for_waste",
+    "food_security_impact",
+    "environmental_impact",
+    "monetary_impact",
+    "rating",
+    "date",
+)
+
+
+class DonationView:
+    __slots__ = DONATION_FIELDS
+
+    def __init__(self, raw):
+        for field in DONATION_FIELDS:
+            setattr(self, field, raw.get(field))
+
+    def to_dict(self):
+        return {
+            field: getattr(self, field)
+            for field in DONATION_FIELDS
+            if getattr(self, field) is not None
+        }
+
+
+class DonorView:
+    __slots__ = ("raw", "donations")
+
+    def __init__(self, raw):
+        self.raw = {k: v for k, v in raw.items() if k != "donations"}
+        self.donations = [DonationView(d) for d in raw.get("donations") or []]
+
+    def to_dict(self):
+        return {**self.raw, "donations": [d.to_dict() for d in self.donations]}
+
+
+@dataclasses.dataclass(frozen=True)
+class DonationRecord:
+    donation_id: str
+    receipt_id: str
+    total_lbs_food: float
+    lbs_food_for_consumption: float
+    lbs_food_for_farms: float
+    lbs_food_for_waste: float
+    food_security_impact: int
+    environmental_impact: float
+    monetary_impact: float
+    date: datetime.datetime
+    rating: dict = None
+
+
+@dataclasses.dataclass(frozen=True)
+class DonorRecord:
+    raw: dict
+    donations: tuple
+
+    @classmethod
+    def from_raw(cls, raw):
+        return cls(
+            {k: v for k, v in raw.items() if k != "donations"},
+            tuple(DonationRecord(**d) for d in raw.get("donations") or []),
+        )
+
+    def to_dict(self):
+        donations = []
+        for donation in self.donations:
+            entry = dataclasses.asdict(donation)
+            if entry["rating"] is None:
+                del entry["rating"]
+            donations.append(entry)
+        return {**self.raw, "donations": donations}
+
+
+def document_path(data):
+    return Serializer.dumps(Donor._from_son(bson.decode(data)).to_mongo().to_dict())
+
+
+def slots_path(data):
+    return Serializer.dumps(DonorView(bson.decode(data)).to_dict())
+
+
+def dataclass_path(data):
+    return Serializer.dumps(DonorRecord.from_raw(bson.decode(data)).to_dict())
+
+
+def raw_path(data):
+    return Serializer.dumps(bson.decode(data))
+
+
+def measure(respond, data, repeat):
+    respond(data)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        respond(data)
+    seconds = (time.perf_counter() - started) / repeat
+    tracemalloc.start()
+    respond(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--donations", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    data = bson.encode(build_raw_donor(args.donations))
+    expected = json.loads(raw_path(data))
+    paths = [
+        ("document (_from_son)", document_path),
+        ("__slots__ read model", slots_path),
+        ("frozen dataclass", dataclass_path),
+        ("raw document", raw_path),
+    ]
+
+    print(
+        f"donor with {args.donations} donations ({len(data) / 1024:.0f} KiB "
+        f"of BSON), {args.repeat} runs each"
+    )
+    baseline = None
+    for name, respond in paths:
+        if json.loads(respond(data)) != expected:
+            raise SystemExit(f"{name}: output differs from the raw document")
+        seconds, peak = measure(respond, data, args.repeat)
+        baseline = baseline or seconds
+        print(
+            f"{name:22} {seconds * 1000:8.2f} ms/request "
+            f"{peak / 1024:9.0f} KiB peak {baseline / seconds:6.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
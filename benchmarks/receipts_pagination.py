@@ -0,0 +1,119 @@
+"""Per-page latency of GET /donations/receipts as the collection grows.
+
+Seeds synthetic donations with receipts into a scratch database on a local
+mongod and times ``get_all_receipts`` for a handful of pages at each size.
+
+    python -m benchmarks.receipts_pagination --sizes 10000 100000 1000000
+"""
+import argparse
+import datetime
+import random
+import statistics
+import time
+import uuid
+
+from mongoengine import connect, disconnect
+from models.Donation import Donation
+from services.DonationServices import get_all_receipts
+
+
+BATCH_SIZE = 10000
+
+
+def make_donation(index, donors, recipients, start):
+    donation_id = str(uuid.uuid4())
+    listing_id = str(uuid.uuid4())
+    donor_id = random.choice(donors)
+    recipient_id = random.choice(recipients)
+    amount = float(random.randint(1, 500))
+    return {
+        "donation_id": donation_id,
+        "donor_id": donor_id,
+        "recipient_id": recipient_id,
+        "receipt": {
+            "receipt_id": str(uuid.uuid4()),
+            "donation_id": donation_id,
+            "listing_id": listing_id,
+            "donor_id": donor_id,
+            "recipient_id": recipient_id,
+            "date_issued": start + datetime.timedelta(minutes=index),
+            "donation_amount_lbs": amount,
+            "donor_name": "Bench Donor",
+            "recipient_name": "Bench Recipient",
+        },
+    }
+
+
+def grow_to(collection, size, donors, recipients, start):
+    current = collection.estimated_document_count()
+    while current < size:
+        batch = min(BATCH_SIZE, size - current)
+        collection.insert_many(
+            [
+                make_donation(current + i, donors, recipients, start)
+                for i in range(batch)
+            ],
+            ordered=False,
+        )
+        current += batch
+
+
+def time_call(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--host", default="mongodb://localhost:27017/app-donation-bench"
+    )
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10000, 100000, 1000000]
+    )
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--pagesize", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    connect(host=args.host)
+    collection = Donation._get_collection()
+    collection.drop()
+    Donation.ensure_indexes()
+
+    random.seed(42)
+    donors = [str(uuid.uuid4()) for _ in range(1000)]
+    recipients = [str(uuid.uuid4()) for _ in range(500)]
+    start = datetime.datetime(2020, 1, 1)
+
+    print(f"{'donations':>10} {'query':<24} {'page':>5} {'median ms':>10} {'p95 ms':>8}")
+    for size in sorted(args.sizes):
+        grow_to(collection, size, donors, recipients, start)
+        donor_id = donors[0]
+        for page in args.pages:
+            cases = {
+                "sort=date_issued": lambda: get_all_receipts(
+                    page, args.pagesize, sort_by="date_issued"
+                ),
+                "donorid+date_issued": lambda: get_all_receipts(
+                    page, args.pagesize, donor_id=donor_id, sort_by="date_issued"
+                ),
+            }
+            for name, func in cases.items():
+                samples = time_call(func, args.repeat)
+                p95 = statistics.quantiles(samples, n=20)[-1]
+                print(
+                    f"{size:>10} {name:<24} {page:>5} "
+                    f"{statistics.median(samples):>10.2f} {p95:>8.2f}"
+                )
+
+    collection.drop()
+    disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Stand-in Redis-protocol server for trying the "resp" entity cache locally.
+
+Implements the commands the cache uses (GET, MGET, SET with NX/PX/EX, DEL
+and WATCH / MULTI / EXEC transactions) plus PING, SELECT, AUTH and FLUSHDB,
+in memory and with one thread per client. Not for production use.
+
+    python -m benchmarks.resp_server --port 6390
+    ENTITY_CACHE_URL=resp://localhost:6390/0 python app.py
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+
+# Values by key, and a count of the writes to each key, which WATCH
+# compares before a transaction runs
+class Store:
+    def __init__(self):
+        self.values = {}
+        self.writes = {}
+        self.lock = threading.RLock()
+
+    def get(self, key):
+        entry = self.values.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires is not None and expires <= time.monotonic():
+            self.values.pop(key, None)
+            return None
+        return value
+
+    def touch(self, key):
+        self.writes[key] = self.writes.get(key, 0) + 1
+
+
+def read_command(reader):
+    line = reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        return line.split()
+    args = []
+    for _ in range(int(line[1:])):
+        length = int(reader.readline()[1:])
+        args.append(reader.read(length + 2)[:-2])
+    return args
+
+
+def bulk(value):
+    if value is None:
+        return b"$-1\r\n"
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def execute(store, args):
+    name = args[0].upper()
+    if name == b"PING":
+        return b"+PONG\r\n"
+    if name in (b"SELECT", b"AUTH"):
+        return b"+OK\r\n"
+    if name == b"FLUSHDB":
+        with store.lock:
+            for key in store.values:
+                store.touch(key)
+            store.values.clear()
+        return b"+OK\r\n"
+    if name == b"GET":
+        with store.lock:
+            return bulk(store.get(args[1]))
+    if name == b"MGET":
+        with store.lock:
+            values = [bulk(store.get(key)) for key in args[1:]]
+        return b"*%d\r\n%s" % (len(values), b"".join(values))
+    if name == b"DEL":
+        removed = 0
+        with store.lock:
+            for key in args[1:]:
+                if store.values.pop(key, None) is not None:
+                    store.touch(key)
+                    removed += 1
+        return b":%d\r\n" % removed
+    if name == b"SET":
+        key, value, options = args[1], args[2], [a.upper() for a in args[3:]]
+        expires = None
+        if b"PX" in options:
+            expires = time.monotonic() + int(options[options.index(b"PX") + 1]) / 1000
+        if b"EX" in options:
+            expires = time.monotonic() + int(options[options.index(b"EX") + 1])
+        with store.lock:
+            if b"NX" in options and store.get(key) is not None:
+                return b"$-1\r\n"
+            store.values[key] = (value, expires)
+            store.touch(key)
+        return b"+OK\r\n"
+    return b"-ERR unknown command '%s'\r\n" % name
+
+
+# Runs the commands queued since MULTI, unless a key watched since WATCH
+# was written meanwhile
+def execute_transaction(store, watched, queued):
+    with store.lock:
+        if any(store.writes.get(key, 0) != seen for key, seen in watched.items()):
+            return b"*-1\r\n"
+        replies = [execute(store, args) for args in queued]
+    return b"*%d\r\n%s" % (len(replies), b"".join(replies))
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        store = self.server.store
+        watched, queued = {}, None
+        while True:
+            args = read_command(self.rfile)
+            if not args:
+                return
+            name = args[0].upper()
+            if name == b"WATCH":
+                with store.lock:
+                    watched.update((key, store.writes.get(key, 0)) for key in args[1:])
+                reply = b"+OK\r\n"
+            elif name == b"UNWATCH":
+                watched = {}
+                reply = b"+OK\r\n"
+            elif name == b"MULTI":
+                queued = []
+                reply = b"+OK\r\n"
+            elif name in (b"EXEC", b"DISCARD"):
+                if queued is None:
+                    reply = b"-ERR %s without MULTI\r\n" % name
+                elif name == b"EXEC":
+                    reply = execute_transaction(store, watched, queued)
+                else:
+                    reply = b"+OK\r\n"
+                watched, queued = {}, None
+            elif queued is not None:
+                queued.append(args)
+                reply = b"+QUEUED\r\n"
+            else:
+                reply = execute(store, args)
+            self.wfile.write(reply)
+
+
+class RespServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, Handler)
+        self.store = Store()
+
+
+# Serves on a background thread; returns the server, whose port is
+# server.server_address[1]
+def start(host="127.0.0.1", port=0):
+    server = RespServer((host, port))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+    server = RespServer((args.host, args.port))
+    print(f"Serving RESP on {args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Name and email search latency over a large recipients collection.
+
+Loads N synthetic recipients into a local mongod (with their search keys),
+creates the declared indexes and times GET /recipients?name= and ?email=
+searches through the service layer, reporting p50/p95/p99 per query kind.
+
+    python -m benchmarks.search_latency --recipients 500000 --queries 2000
+"""
+import argparse
+import random
+import statistics
+import time
+import uuid
+
+from mongoengine import connect, disconnect
+from models.Recipient import Recipient, RECIPIENT_NAME_FIELDS
+from services.RecipientServices import get_all_recipients
+from utils.Search import search_keys
+
+FIRST_NAMES = [
+    "James", "Mary", "Jose", "Linda", "Wei", "Aisha", "Olga", "Kenji", "Fatima",
+    "Noah", "Emma", "Lucas", "Sofia", "Mateo", "Chloe", "Omar", "Priya", "Ivan",
+]
+LAST_NAMES = [
+    "Smith", "Garcia", "Nguyen", "Okafor", "Kowalski", "Tanaka", "Haddad",
+    "Johnson", "Silva", "Muller", "Rossi", "Novak", "Kim", "Patel", "Cohen",
+]
+ORGANIZATION_WORDS = [
+    "Food", "Bank", "Pantry", "Community", "Kitchen", "Harvest", "Shelter",
+    "Mission", "Table", "Network", "Relief", "Center", "Share", "Hope",
+]
+
+
+def synthetic_recipient(i, rng):
+    first_name = rng.choice(FIRST_NAMES)
+    last_name = rng.choice(LAST_NAMES)
+    document = {
+        "recipient_id": str(uuid.uuid4()),
+        "first_name": first_name,
+        "last_name": last_name,
+        "organization_name": " ".join(rng.sample(ORGANIZATION_WORDS, 3)) + f" {i}",
+        "email": f"{first_name}.{last_name}{i}@example.org".lower(),
+        "phone_number": "555-555-5555",
+        "ein": f"{i:09d}",
+        "tax_status": {"status": "Verified"},
+        "compliance_status": {"status": "In Good Standing"},
+        "donation_log": {"total_donations": rng.randint(0, 100)},
+    }
+    document.update(search_keys(document, RECIPIENT_NAME_FIELDS))
+    return document
+
+
+def load(count, batch_size=10000):
+    rng = random.Random(42)
+    collection = Recipient._get_collection()
+    for start in range(0, count, batch_size):
+        collection.insert_many(
+            [
+                synthetic_recipient(i, rng)
+                for i in range(start, min(start + batch_size, count))
+            ],
+            ordered=False,
+        )
+
+
+def query_mix(rng):
+    first_name = rng.choice(FIRST_NAMES)
+    last_name = rng.choice(LAST_NAMES)
+    return [
+        ("name, 1-3 letter prefix", {"name": first_name[: rng.randint(1, 3)]}),
+        ("name, full word", {"name": last_name}),
+        ("name, two words", {"name": f"{first_name} {last_name[:3]}"}),
+        ("name, organization", {"name": rng.choice(ORGANIZATION_WORDS)}),
+        ("email prefix", {"email": f"{first_name}.{last_name}1".upper()}),
+        ("name, no match", {"name": "zzzz"}),
+    ]
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--host", default="mongodb://localhost:27017/app-donation-bench"
+    )
+    parser.add_argument("--recipients", type=int, default=500000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--keep", action="store_true", help="Keep the loaded data")
+    args = parser.parse_args()
+
+    connect(host=args.host)
+    if Recipient.objects.count() != args.recipients:
+        Recipient.drop_collection()
+        started = time.perf_counter()
+        load(args.recipients)
+        elapsed = time.perf_counter() - started
+        print(f"loaded {args.recipients} recipients in {elapsed:.1f}s")
+    Recipient.ensure_indexes()
+
+    rng = random.Random(7)
+    timings = {}
+    for _ in range(args.queries):
+        for kind, params in query_mix(rng):
+            started = time.perf_counter()
+            get_all_recipients(page=1, pagesize=10, **params)
+            timings.setdefault(kind, []).append(
+                (time.perf_counter() - started) * 1000
+            )
+
+    print(f"{args.recipients} recipients, {args.queries} queries per kind")
+    for kind, values in timings.items():
+        values.sort()
+        print(
+            f"{kind:26} p50 {statistics.median(values):6.2f} ms "
+            f"p95 {percentile(values, 0.95):6.2f} ms "
+            f"p99 {percentile(values, 0.99):6.2f} ms"
+        )
+
+    if not args.keep:
+        Recipient.drop_collection()
+    disconnect()
+
+
+if __name__ == "__main__":
+    main()
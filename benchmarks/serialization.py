@@ -0,0 +1,103 @@
+"""Encode throughput for a donor with thousands of embedded donations.
+
+Compares the old response path (build the Donor document from the raw
+MongoDB document, to_mongo().to_dict(), json_util.dumps) with
+utils.Serializer encoding the raw document directly, with orjson and with
+the standard library fallback. Needs no database.
+
+    python -m benchmarks.serialization --donations 5000 --repeat 20
+"""
+import argparse
+import datetime
+import json
+import time
+import uuid
+
+from bson import ObjectId, json_util
+from models.Donor import Donor, Donation
+from utils import Serializer
+
+
+def build_raw_donor(donations):
+    now = datetime.datetime(2024, 1, 1, 12, 0, 0, 123000)
+    donor = Donor(
+        donor_id=str(uuid.uuid4()),
+        first_name="Bench",
+        last_name="Donor",
+        email="bench@example.org",
+        phone_number="555-555-5555",
+        tax_id="000000000",
+        company_association="Bench",
+        donations=[
+            Donation(
+                receipt_id=str(uuid.uuid4()),
+                total_lbs_food=10.5,
+                lbs_food_for_consumption=8.25,
+                lbs_food_for_farms=1.25,
+                lbs_food_for_waste=1.0,
+                food_security_impact=8,
+                environmental_impact=9.5,
+                monetary_impact=12.75,
+                date=now + datetime.timedelta(minutes=i),
+            )
+            for i in range(donations)
+        ],
+    )
+    raw = donor.to_mongo().to_dict()
+    raw["_id"] = ObjectId()
+    return raw
+
+
+def document_path(raw):
+    return json_util.dumps(Donor._from_son(raw).to_mongo().to_dict())
+
+
+def serializer_path(raw):
+    return Serializer.dumps(raw)
+
+
+def stdlib_path(raw):
+    orjson = Serializer.orjson
+    Serializer.orjson = None
+    try:
+        return Serializer.dumps(raw)
+    finally:
+        Serializer.orjson = orjson
+
+
+def measure(encode, raw, repeat):
+    encode(raw)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        size = len(encode(raw))
+    return (time.perf_counter() - started) / repeat, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--donations", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    raw = build_raw_donor(args.donations)
+    expected = json.loads(document_path(raw))
+    paths = [("document + json_util", document_path)]
+    if Serializer.orjson is not None:
+        paths.append(("raw + orjson", serializer_path))
+    paths.append(("raw + json", stdlib_path))
+
+    print(f"donor with {args.donations} donations, {args.repeat} runs each")
+    baseline = None
+    for name, encode in paths:
+        if json.loads(encode(raw)) != expected:
+            raise SystemExit(f"{name}: output differs from json_util")
+        seconds, size = measure(encode, raw, args.repeat)
+        baseline = baseline or seconds
+        print(
+            f"{name:22} {seconds * 1000:8.2f} ms/doc "
+            f"{size / seconds / 1e6:8.1f} MB/s {baseline / seconds:6.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Import and boot time of the WSGI app.
+
+Starts a fresh interpreter per run, imports app.py, builds the URL map and
+serves one request that needs no database, which is what a worker does
+before it can take traffic. With --first-query a request that reads from
+MongoDB is timed as well (needs a reachable mongod).
+
+    python -m benchmarks.startup --runs 10
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+PROBE = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+client.get("/users")
+booted = time.perf_counter()
+timings = {"import": imported - started, "boot": booted - started}
+if FIRST_QUERY:
+    client.get("/donations/listings?pagesize=1")
+    timings["first_query"] = time.perf_counter() - started
+print(json.dumps(timings))
+"""
+
+
+def run_once(first_query):
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE.replace("FIRST_QUERY", str(first_query))],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--first-query", action="store_true")
+    args = parser.parse_args()
+
+    runs = [run_once(args.first_query) for _ in range(args.runs)]
+    print(f"{args.runs} fresh interpreters")
+    for phase in runs[0]:
+        values = sorted(run[phase] * 1000 for run in runs)
+        print(
+            f"{phase:12} median {statistics.median(values):8.1f} ms "
+            f"min {values[0]:8.1f} ms max {values[-1]:8.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
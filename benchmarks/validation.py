@@ -0,0 +1,91 @@
+"""Request body validation: flask_restful reqparse against utils.Validation.
+
+Parses the body of POST /donations/listings/:listingId/forms (nine fields)
+and POST /donations/listings (four fields, with a date and a choice) with
+the RequestParser the resources used before and with the compiled Schema
+that replaced it, each in a fresh request context so that no parsed body is
+reused between runs. Only the parse call is timed. Needs no database.
+
+    python -m benchmarks.validation --repeat 20000
+"""
+import argparse
+import json
+import time
+
+from flask import Flask
+from flask_restful import reqparse
+from resources.DonationResources import form_post_schema, listing_post_schema
+
+
+FORM_BODY = {
+    "total_lbs_food": 120,
+    "lbs_expired_food": 5,
+    "lbs_food_for_consumption": 90,
+    "lbs_food_for_farms": 20,
+    "lbs_food_for_waste": 5,
+    "donor_first_name": "Karim",
+    "donor_last_name": "Shaikh",
+    "recipient_first_name": "Sydney",
+    "recipient_last_name": "Doe",
+}
+
+LISTING_BODY = {
+    "food_type": "Produce",
+    "total_lbs_food": 120,
+    "refrigeration_requirements": "refrigerated",
+    "expiration_date": "2025-01-01",
+}
+
+
+def form_parser():
+    parser = reqparse.RequestParser()
+    for field in FORM_BODY:
+        kind = str if field.endswith("_name") else int
+        parser.add_argument(field, type=kind, required=True, help=f"{field}")
+    return parser
+
+
+def listing_parser():
+    parser = reqparse.RequestParser()
+    parser.add_argument("food_type", type=str, required=True)
+    parser.add_argument("total_lbs_food", type=int, required=True)
+    parser.add_argument("refrigeration_requirements", type=str, required=True)
+    parser.add_argument("expiration_date", type=str, required=True)
+    return parser
+
+
+def measure(app, body, parse, repeat):
+    data = json.dumps(body)
+    elapsed = 0.0
+    for _ in range(repeat):
+        with app.test_request_context(
+            "/", method="POST", data=data, content_type="application/json"
+        ):
+            started = time.perf_counter()
+            parse()
+            elapsed += time.perf_counter() - started
+    return elapsed / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20000)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    cases = [
+        ("form", FORM_BODY, form_parser(), form_post_schema),
+        ("listing", LISTING_BODY, listing_parser(), listing_post_schema),
+    ]
+    print(f"{args.repeat} parses each")
+    for name, body, request_parser, schema in cases:
+        old = measure(app, body, request_parser.parse_args, args.repeat)
+        new = measure(app, body, schema.parse, args.repeat)
+        print(
+            f"{name:8} reqparse {old * 1e6:7.1f} us  schema {new * 1e6:7.1f} us  "
+            f"{old / new:5.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,40 @@
 from flask_mongoengine import MongoEngine
-from services.DonationServices import init_donations
-from services.DonorServices import init_donors
-from services.RecipientServices import init_recipients
-from services.UserService import init_users
+from flask_mongoengine.connection import create_connections
+from mongoengine import disconnect_all
+from services.BucketServices import set_storage_mode
+from services.DonationServices import configure_listing_cache
+from utils.EntityCache import configure_entity_cache
+from utils.Metrics import init_metrics
+from utils.QueryStats import init_query_stats
 
 
 db = MongoEngine()
 
 
+# Only registers the connection: with "connect": False in MONGODB_SETTINGS
+# the client opens its first socket on the first query. Default data is
+# loaded with `python manage.py seed`, never at startup.
 def initialize_db(app):
+    set_storage_mode(app.config.get("DONATION_LOG_STORAGE", "embedded"))
+    configure_listing_cache(
+        app.config.get("LISTING_CACHE_SIZE", 1024),
+        app.config.get("LISTING_CACHE_TTL", 10.0),
+    )
+    configure_entity_cache(
+        app.config.get("ENTITY_CACHE", "memory"),
+        app.config.get("ENTITY_CACHE_URL"),
+        app.config.get("ENTITY_CACHE_TTL", 5.0),
+    )
+    init_query_stats(app)
+    init_metrics(app)
     db.init_app(app)
-    init_donations()
-    init_donors()
-    init_recipients()
-    init_users()
+
+
+# Drops the connections a forked worker inherited from its parent and
+# registers them again, so that each worker builds its own MongoClient
+def reconnect_db(app):
+    disconnect_all()
+    app.extensions["mongoengine"][db]["conn"] = create_connections(app.config)
 
 
 def fetch_engine():
@@ -0,0 +1,207 @@
+import itertools
+from models.Donation import Donation
+from models.DonationBucket import DonationBucket, BUCKET_SIZE
+from models.Donor import Donor
+from models.Recipient import Recipient
+from models.RevokedToken import RevokedToken
+from models.User import User
+from services.DonationServices import (
+    LISTING_SORT_FIELDS,
+    RECEIPT_SORT_FIELDS,
+    build_listings_query,
+    build_receipts_pipeline,
+)
+from services.DonorServices import build_donors_query
+from services.RecipientServices import build_recipients_query
+
+
+INDEXED_MODELS = [Donation, Donor, Recipient, User, DonationBucket, RevokedToken]
+
+# Placeholder value used when a query shape needs a concrete filter value
+SAMPLE = "sample"
+
+
+# Index creation is kept out of the request path (the models set
+# auto_create_index to False) and runs here at deploy time instead
+def create_indexes():
+    created = {}
+    for model in INDEXED_MODELS:
+        model.ensure_indexes()
+        created[model.__name__] = sorted(
+            model._get_collection().index_information()
+        )
+    return created
+
+
+def find_shape(name, model, query, sort=None):
+    return {"name": name, "model": model, "query": query, "sort": sort}
+
+
+def aggregate_shape(name, model, pipeline):
+    return {"name": name, "model": model, "pipeline": pipeline}
+
+
+def with_cursor(query, sort):
+    keyset = {
+        "$or": [
+            {**{path: SAMPLE for path, _ in sort[:i]}, path: {"$gt": SAMPLE}}
+            for i, (path, _) in enumerate(sort)
+        ]
+    }
+    return {"$and": [query, keyset]} if query else keyset
+
+
+# Every query issued by services/*. List endpoints are expanded over all of
+# their filter and sort combinations.
+def query_shapes():
+    shapes = [
+        find_shape("donation by donation_id", Donation, {"donation_id": SAMPLE}),
+        find_shape(
+            "donation by listing_id", Donation, {"listing.listing_id": SAMPLE}
+        ),
+        find_shape(
+            "donation by donor_id and listing_id",
+            Donation,
+            {"donor_id": SAMPLE, "listing.listing_id": SAMPLE},
+        ),
+        find_shape(
+            "donation by receipt_id", Donation, {"receipt.receipt_id": SAMPLE}
+        ),
+        find_shape("donor by donor_id", Donor, {"donor_id": SAMPLE}),
+        find_shape("donor by email", Donor, {"email": SAMPLE}),
+        find_shape("recipient by recipient_id", Recipient, {"recipient_id": SAMPLE}),
+        find_shape("recipient by email", Recipient, {"email": SAMPLE}),
+        find_shape("user by email", User, {"email": SAMPLE}),
+        find_shape("revoked token by jti", RevokedToken, {"jti": SAMPLE}),
+        find_shape(
+            "unexpired revoked tokens", RevokedToken, {"expires_at": {"$gt": SAMPLE}}
+        ),
+        find_shape(
+            "revoked tokens since watermark",
+            RevokedToken,
+            {"expires_at": {"$gt": SAMPLE}, "revoked_at": {"$gte": SAMPLE}},
+        ),
+        find_shape(
+            "open donation bucket",
+            DonationBucket,
+            {
+                "party_type": "donor",
+                "party_id": SAMPLE,
+                "kind": "donations",
+                "count": {"$lt": BUCKET_SIZE},
+            },
+        ),
+        find_shape(
+            "donation bucket entry",
+            DonationBucket,
+            {
+                "party_type": "donor",
+                "party_id": SAMPLE,
+                "kind": "donations",
+                "entries.donation_id": SAMPLE,
+            },
+        ),
+        find_shape(
+            "donation buckets in order",
+            DonationBucket,
+            {"party_type": "donor", "party_id": SAMPLE, "kind": "donations"},
+            [("_id", 1)],
+        ),
+    ]
+
+    for food_type, expiration_date, sort_by in itertools.product(
+        [None, SAMPLE], [None, "2024-12-31"], [None, *LISTING_SORT_FIELDS]
+    ):
+        query, sort = build_listings_query(food_type, expiration_date, sort_by)
+        label = f"listings food_type={food_type} expiration_date={expiration_date} sort_by={sort_by}"
+        shapes.append(find_shape(label, Donation, query, sort))
+        shapes.append(
+            find_shape(f"{label} cursor", Donation, with_cursor(query, sort), sort)
+        )
+
+    for donor_id, recipient_id, sort_by in itertools.product(
+        [None, SAMPLE], [None, SAMPLE], [None, *RECEIPT_SORT_FIELDS]
+    ):
+        pipeline = build_receipts_pipeline(
+            1, 10, donor_id, recipient_id, sort_by
+        )
+        shapes.append(
+            aggregate_shape(
+                f"receipts donorid={donor_id} recipientid={recipient_id} sort_by={sort_by}",
+                Donation,
+                pipeline,
+            )
+        )
+
+    for donor_id, name, email, sort_by in itertools.product(
+        [None, SAMPLE], [None, SAMPLE], [None, SAMPLE], [None, "numberdonations"]
+    ):
+        query, sort = build_donors_query(donor_id, name, email, sort_by)
+        label = f"donors id={donor_id} name={name} email={email} sort_by={sort_by}"
+        shapes.append(find_shape(label, Donor, query, sort))
+        shapes.append(
+            find_shape(f"{label} cursor", Donor, with_cursor(query, sort), sort)
+        )
+
+    for (
+        recipient_id,
+        name,
+        email,
+        tax_status,
+        compliance_status,
+        sort_by,
+    ) in itertools.product(
+        [None, SAMPLE],
+        [None, SAMPLE],
+        [None, SAMPLE],
+        [None, SAMPLE],
+        [None, SAMPLE],
+        [None, "numberdonations"],
+    ):
+        query, sort = build_recipients_query(
+            recipient_id, name, tax_status, compliance_status, sort_by, email
+        )
+        label = (
+            f"recipients id={recipient_id} name={name} email={email} "
+            f"501c3={tax_status} goodstanding={compliance_status} sort_by={sort_by}"
+        )
+        shapes.append(find_shape(label, Recipient, query, sort))
+        shapes.append(
+            find_shape(f"{label} cursor", Recipient, with_cursor(query, sort), sort)
+        )
+    return shapes
+
+
+def explain(shape):
+    collection = shape["model"]._get_collection()
+    if "pipeline" in shape:
+        return collection.database.command(
+            "aggregate", collection.name, pipeline=shape["pipeline"], explain=True
+        )
+    cursor = collection.find(shape["query"]).limit(10)
+    if shape["sort"]:
+        cursor = cursor.sort(shape["sort"])
+    return cursor.explain()
+
+
+# Walks an explain() result and yields the stages of the winning plans only
+def winning_stages(plan):
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for key, value in plan.items():
+            if key not in ("rejectedPlans", "allPlansExecution"):
+                yield from winning_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from winning_stages(item)
+
+
+# Returns the query shapes whose winning plan contains a collection scan
+def verify_query_plans():
+    failures = []
+    for shape in query_shapes():
+        stages = set(winning_stages(explain(shape)))
+        if "COLLSCAN" in stages:
+            failures.append((shape["name"], sorted(stages)))
+    return failures
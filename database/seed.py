@@ -0,0 +1,63 @@
+from pymongo import UpdateOne
+from models.Donation import Donation
+from models.Donor import Donor
+from models.Recipient import Recipient
+from models.User import User
+from services.default import (
+    default_donations,
+    default_donors,
+    default_recipients,
+    default_users,
+)
+from utils.Hash import get_hash
+
+
+# Inserts the documents whose key is not in the collection yet and leaves
+# existing ones untouched, in one unordered bulk write. Running it again, or
+# from several processes at once, does not create duplicates.
+def upsert_defaults(model, key, documents):
+    requests = []
+    for document in documents:
+        document.validate()
+        son = document.to_mongo().to_dict()
+        son.pop("_id", None)
+        requests.append(
+            UpdateOne({key: son[key]}, {"$setOnInsert": son}, upsert=True)
+        )
+    if not requests:
+        return 0
+    result = model._get_collection().bulk_write(requests, ordered=False)
+    return result.upserted_count
+
+
+def default_documents():
+    return [
+        (
+            Donation,
+            "donation_id",
+            [Donation(**donation) for donation in default_donations],
+        ),
+        (Donor, "donor_id", [Donor(**donor) for donor in default_donors]),
+        (
+            Recipient,
+            "recipient_id",
+            [Recipient(**recipient) for recipient in default_recipients],
+        ),
+        (
+            User,
+            "email",
+            [
+                User(email=email, password_hash=get_hash(password.encode("utf-8")))
+                for email, password in default_users.items()
+            ],
+        ),
+    ]
+
+
+# Seeds the default donations, donors, recipients and users. Returns the
+# number of documents inserted per model.
+def seed_defaults():
+    return {
+        model.__name__: upsert_defaults(model, key, documents)
+        for model, key, documents in default_documents()
+    }
@@ -0,0 +1,36 @@
+"""gunicorn settings for serving wsgi:application.
+
+    gunicorn -c gunicorn.conf.py
+
+WEB_CONCURRENCY sets the number of worker processes (one per core by
+default), GUNICORN_THREADS the threads of each worker and BIND the listen
+address. Each worker gets a MongoDB pool of MONGODB_MAX_POOL_SIZE
+connections, by default one per thread.
+"""
+import multiprocessing
+import os
+
+
+wsgi_app = "wsgi:application"
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+keepalive = 5
+timeout = 30
+# The app is imported once in the master and forked, so workers start fast
+# and share its memory
+preload_app = True
+
+os.environ.setdefault("MONGODB_MAX_POOL_SIZE", str(threads))
+
+
+# A MongoClient must not be shared across fork, and the log writer thread
+# does not survive it: both are recreated in every worker
+def post_fork(server, worker):
+    from database.db import reconnect_db
+    from utils.StructuredLogging import configure_logging
+    from wsgi import application
+
+    configure_logging(application)
+    reconnect_db(application)
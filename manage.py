@@ -0,0 +1,144 @@
+"""Deploy-time management commands.
+
+    python manage.py create-indexes
+    python manage.py verify-indexes
+    python manage.py reconcile-totals [--fix]
+    python manage.py migrate-buckets
+    python manage.py migrate-ratings
+    python manage.py seed
+    python manage.py rebuild-search-keys
+"""
+import argparse
+import sys
+from app import app
+from database.indexes import create_indexes, verify_query_plans
+from database.seed import seed_defaults
+from models.Donor import Donor, DONOR_NAME_FIELDS
+from models.Recipient import Recipient, RECIPIENT_NAME_FIELDS
+from services.BucketServices import migrate_to_buckets
+from services.DonorServices import (
+    backfill_rating_counters,
+    reconcile_donor_impact_logs,
+    reconcile_donor_ratings,
+)
+from services.RecipientServices import reconcile_recipient_donation_logs
+from utils.Search import rebuild_search_keys
+
+
+def create_indexes_command(args):
+    for model, indexes in create_indexes().items():
+        print(f"{model}: {', '.join(indexes)}")
+    return 0
+
+
+def verify_indexes_command(args):
+    failures = verify_query_plans()
+    for name, stages in failures:
+        print(f"COLLSCAN: {name} ({' -> '.join(stages)})")
+    if failures:
+        print(f"{len(failures)} query shape(s) fall back to a collection scan")
+        return 1
+    print("All query shapes are served by an index")
+    return 0
+
+
+def reconcile_totals_command(args):
+    unresolved = 0
+    for kind, mismatches in (
+        ("donor", reconcile_donor_impact_logs(fix=args.fix)),
+        ("donor", reconcile_donor_ratings(fix=args.fix)),
+        ("recipient", reconcile_recipient_donation_logs(fix=args.fix)),
+    ):
+        for mismatch in mismatches:
+            party_id = mismatch[f"{kind}_id"]
+            status = "fixed" if mismatch["fixed"] else "mismatch"
+            for field, (stored, expected) in mismatch["differences"].items():
+                print(f"{status}: {kind} {party_id} {field} stored={stored} expected={expected}")
+            unresolved += not mismatch["fixed"]
+    if unresolved:
+        print(f"{unresolved} document(s) have totals that do not match their donations")
+        return 1
+    print("All stored totals match their donations")
+    return 0
+
+
+def migrate_buckets_command(args):
+    migrated = migrate_to_buckets()
+    print(
+        f"Moved the history of {migrated['donor']} donor(s) and "
+        f"{migrated['recipient']} recipient(s) into {migrated['buckets']} bucket(s)"
+    )
+    return 0
+
+
+def migrate_ratings_command(args):
+    changed = backfill_rating_counters()
+    print(f"Rating counters backfilled for {changed} donor(s)")
+    return 0
+
+
+def seed_command(args):
+    for model, inserted in seed_defaults().items():
+        print(f"{model}: {inserted} default document(s) inserted")
+    return 0
+
+
+def rebuild_search_keys_command(args):
+    for model, name_fields in (
+        (Donor, DONOR_NAME_FIELDS),
+        (Recipient, RECIPIENT_NAME_FIELDS),
+    ):
+        changed = rebuild_search_keys(model._get_collection(), name_fields)
+        print(f"{model.__name__}: search keys rebuilt for {changed} document(s)")
+    return 0
+
+
+COMMANDS = {
+    "create-indexes": create_indexes_command,
+    "verify-indexes": verify_indexes_command,
+    "reconcile-totals": reconcile_totals_command,
+    "migrate-buckets": migrate_buckets_command,
+    "migrate-ratings": migrate_ratings_command,
+    "seed": seed_command,
+    "rebuild-search-keys": rebuild_search_keys_command,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Food donation management commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("create-indexes", help="Create the indexes declared on the models")
+    subparsers.add_parser(
+        "verify-indexes",
+        help="Explain every service query and fail on collection scans",
+    )
+    reconcile = subparsers.add_parser(
+        "reconcile-totals",
+        help="Check stored totals and rating counters against a full recompute",
+    )
+    reconcile.add_argument(
+        "--fix", action="store_true", help="Overwrite totals that do not match"
+    )
+    subparsers.add_parser(
+        "migrate-buckets",
+        help="Move embedded donation and rating history into donation buckets",
+    )
+    subparsers.add_parser(
+        "migrate-ratings",
+        help="Backfill the rating counters of donors written before they existed",
+    )
+    subparsers.add_parser(
+        "seed",
+        help="Insert the default donations, donors, recipients and users if missing",
+    )
+    subparsers.add_parser(
+        "rebuild-search-keys",
+        help="Recompute donor and recipient name tokens and lower-cased emails",
+    )
+    args = parser.parse_args(argv)
+    with app.app_context():
+        return COMMANDS[args.command](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
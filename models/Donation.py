@@ -5,6 +5,7 @@ from mongoengine import (
     EmbeddedDocument,
     StringField,
     FloatField,
+    IntField,
     DateTimeField,
     EmbeddedDocumentField,
 )
@@ -57,3 +58,22 @@ class Donation(Document):
     listing = EmbeddedDocumentField(Listing)
     form = EmbeddedDocumentField(Form)
     receipt = EmbeddedDocumentField(Receipt)
+    # Incremented by every service write (utils.Updates.versioned)
+    version = IntField(default=0)
+
+    meta = {
+        "auto_create_index": False,
+        "indexes": [
+            "donor_id",
+            "listing.listing_id",
+            "receipt.receipt_id",
+            ("listing.food_type", "listing.expiration_date"),
+            "listing.expiration_date",
+            ("listing.date_listed", "id"),
+            ("-listing.total_lbs_food", "-id"),
+            ("receipt.donor_id", "-receipt.date_issued", "-id"),
+            ("receipt.recipient_id", "-receipt.date_issued", "-id"),
+            ("-receipt.date_issued", "-id"),
+            ("-receipt.donation_amount_lbs", "-id"),
+        ],
+    }
@@ -0,0 +1,32 @@
+from mongoengine import (
+    Document,
+    StringField,
+    IntField,
+    DateTimeField,
+    DictField,
+    ListField,
+)
+
+
+# Maximum number of entries appended to a single bucket document
+BUCKET_SIZE = 200
+
+
+class DonationBucket(Document):
+    party_type = StringField(required=True, choices=["donor", "recipient"])
+    party_id = StringField(required=True)
+    kind = StringField(required=True, choices=["donations", "ratings_details"])
+    count = IntField(default=0)
+    first_date = DateTimeField()
+    last_date = DateTimeField()
+    entries = ListField(DictField())
+
+    meta = {
+        "collection": "donation_buckets",
+        "auto_create_index": False,
+        "indexes": [
+            ("party_type", "party_id", "kind", "count"),
+            ("party_type", "party_id", "kind", "last_date"),
+            ("party_type", "party_id", "kind", "entries.donation_id"),
+        ],
+    }
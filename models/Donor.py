@@ -9,7 +9,9 @@ from mongoengine import (
     EmbeddedDocumentField,
     EmbeddedDocument,
     EmbeddedDocumentListField,
+    ListField,
 )
+from utils.Search import search_tokens
 
 
 class Address(EmbeddedDocument):
@@ -28,14 +30,49 @@ class RatingDetails(EmbeddedDocument):
 
 
 class Ratings(EmbeddedDocument):
+    # Running average written before stars_sum existed; no longer maintained
     stars = FloatField(default=0.0)
+    stars_sum = IntField(default=0)
     total_ratings = IntField(default=0)
 
-    def update_ratings(self, stars):
-        self.total_ratings += 1
-        self.stars = (
-            (self.stars * (self.total_ratings - 1)) + stars
-        ) / self.total_ratings
+
+# The average is derived from the exact integer counters on every read
+def ratings_summary(ratings):
+    ratings = ratings or {}
+    total_ratings = ratings.get("total_ratings") or 0
+    stars_sum = ratings.get("stars_sum") or 0
+    return {
+        "stars": stars_sum / total_ratings if total_ratings else 0.0,
+        "total_ratings": total_ratings,
+    }
+
+
+# Counters the average is derived from; read along with any requested part
+# of `ratings`
+RATINGS_COUNTERS = ("ratings.stars_sum", "ratings.total_ratings")
+
+
+# `fields` (parsed paths) plus the rating counters if any of them is in
+# `ratings`, so donor_view can derive the average
+def with_rating_counters(fields):
+    if fields and any(path.split(".")[0] == "ratings" for path in fields):
+        return [*fields, *RATINGS_COUNTERS]
+    return fields
+
+
+# A donor (raw dict) as the API returns it: `ratings.stars` is derived from
+# the counters, as GET /donors/:donorId/ratings reports it, instead of the
+# legacy running average still stored in the document. With `fields`, only
+# the requested parts of `ratings` are kept.
+def donor_view(donor, fields=None):
+    if not donor or not isinstance(donor.get("ratings"), dict):
+        return donor
+    ratings = donor["ratings"]
+    ratings = {**ratings, **ratings_summary(ratings)}
+    wanted = {path[8:] for path in fields or () if path.startswith("ratings.")}
+    if wanted and "ratings" not in fields:
+        ratings = {key: value for key, value in ratings.items() if key in wanted}
+    return {**donor, "ratings": ratings}
 
 
 class Donation(EmbeddedDocument):
@@ -49,6 +86,40 @@ class Donation(EmbeddedDocument):
     environmental_impact = FloatField(default=0.0)
     monetary_impact = FloatField(default=0.0)
     rating = EmbeddedDocumentField(RatingDetails, default=None)
+    date = DateTimeField(default=datetime.datetime.now)
+
+
+# Per-donation fields and the impact log totals they are summed into
+IMPACT_LOG_TOTALS = {
+    "total_lbs_food": "total_lbs_food",
+    "lbs_food_for_consumption": "total_lbs_food_for_consumption",
+    "lbs_food_for_farms": "total_lbs_food_for_farms",
+    "lbs_food_for_waste": "total_lbs_food_for_waste",
+    "food_security_impact": "total_food_security_impact",
+    "environmental_impact": "total_environmental_impact",
+    "monetary_impact": "total_monetary_impact",
+}
+
+
+# Builds the $inc document that moves the stored totals from `previous` to
+# `current` (raw donation dicts); without `previous` it counts a new donation
+def impact_log_increments(current, previous=None):
+    increments = {"impact_log.total_donations": 1} if previous is None else {}
+    for field, total in IMPACT_LOG_TOTALS.items():
+        delta = (current.get(field) or 0) - ((previous or {}).get(field) or 0)
+        if delta:
+            increments[f"impact_log.{total}"] = delta
+    return increments
+
+
+# The impact log totals recomputed from raw donation dicts
+def impact_log_totals(donations):
+    totals = dict.fromkeys(["total_donations", *IMPACT_LOG_TOTALS.values()], 0)
+    for donation in donations:
+        totals["total_donations"] += 1
+        for field, total in IMPACT_LOG_TOTALS.items():
+            totals[total] += donation.get(field) or 0
+    return totals
 
 
 class ImpactLog(EmbeddedDocument):
@@ -84,6 +155,10 @@ class ImpactLog(EmbeddedDocument):
         )
 
 
+# Fields whose words are searchable through GET /donors?name=
+DONOR_NAME_FIELDS = ("first_name", "last_name")
+
+
 class Donor(Document):
     donor_id = StringField(
         required=True, unique=True, default=lambda: str(uuid.uuid4())
@@ -99,6 +174,25 @@ class Donor(Document):
     ratings = EmbeddedDocumentField(Ratings, default=Ratings)
     ratings_details = EmbeddedDocumentListField(RatingDetails, default=list)
     impact_log = EmbeddedDocumentField(ImpactLog, default=ImpactLog)
+    search_tokens = ListField(StringField())
+    email_lower = StringField()
+    # Incremented by every service write (utils.Updates.versioned)
+    version = IntField(default=0)
+
+    meta = {
+        "auto_create_index": False,
+        "indexes": [
+            "email",
+            "email_lower",
+            ("search_tokens", "id"),
+            ("-impact_log.total_donations", "-id"),
+        ],
+    }
+
+    # Keeps the search keys in step with the names and email on every save
+    def clean(self):
+        self.search_tokens = search_tokens(*(self[f] for f in DONOR_NAME_FIELDS))
+        self.email_lower = self.email.lower() if self.email else None
 
     def update_impact_log(self):
         self.impact_log.calculate_totals(self.donations)
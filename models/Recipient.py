@@ -1,3 +1,4 @@
+import datetime
 import uuid
 from mongoengine import (
     Document,
@@ -8,7 +9,9 @@ from mongoengine import (
     EmbeddedDocumentField,
     EmbeddedDocument,
     EmbeddedDocumentListField,
+    ListField,
 )
+from utils.Search import search_tokens
 
 
 class Address(EmbeddedDocument):
@@ -29,6 +32,40 @@ class Donation(EmbeddedDocument):
     food_security_impact = IntField(default=0)
     environmental_impact = FloatField(default=0.0)
     monetary_impact = FloatField(default=0.0)
+    date = DateTimeField(default=datetime.datetime.now)
+
+
+# Per-donation fields and the donation log totals they are summed into
+DONATION_LOG_TOTALS = {
+    "total_lbs_food": "total_lbs_food",
+    "lbs_food_for_consumption": "total_lbs_food_for_consumption",
+    "lbs_food_for_farms": "total_lbs_food_for_farms",
+    "lbs_food_for_waste": "total_lbs_food_for_waste",
+    "food_security_impact": "total_food_security_impact",
+    "environmental_impact": "total_environmental_impact",
+    "monetary_impact": "total_monetary_impact",
+}
+
+
+# Builds the $inc document that moves the stored totals from `previous` to
+# `current` (raw donation dicts); without `previous` it counts a new donation
+def donation_log_increments(current, previous=None):
+    increments = {"donation_log.total_donations": 1} if previous is None else {}
+    for field, total in DONATION_LOG_TOTALS.items():
+        delta = (current.get(field) or 0) - ((previous or {}).get(field) or 0)
+        if delta:
+            increments[f"donation_log.{total}"] = delta
+    return increments
+
+
+# The donation log totals recomputed from raw donation dicts
+def donation_log_totals(donations):
+    totals = dict.fromkeys(["total_donations", *DONATION_LOG_TOTALS.values()], 0)
+    for donation in donations:
+        totals["total_donations"] += 1
+        for field, total in DONATION_LOG_TOTALS.items():
+            totals[total] += donation.get(field) or 0
+    return totals
 
 
 class DonationLog(EmbeddedDocument):
@@ -74,6 +111,10 @@ class ComplianceStatus(EmbeddedDocument):
     verification_date = DateTimeField(required=False)
 
 
+# Fields whose words are searchable through GET /recipients?name=
+RECIPIENT_NAME_FIELDS = ("first_name", "last_name", "organization_name")
+
+
 class Recipient(Document):
     recipient_id = StringField(
         required=True, unique=True, default=lambda: str(uuid.uuid4())
@@ -89,3 +130,24 @@ class Recipient(Document):
     compliance_status = EmbeddedDocumentField(ComplianceStatus, required=True)
     donations = EmbeddedDocumentListField(Donation)
     donation_log = EmbeddedDocumentField(DonationLog, default=DonationLog)
+    search_tokens = ListField(StringField())
+    email_lower = StringField()
+    # Incremented by every service write (utils.Updates.versioned)
+    version = IntField(default=0)
+
+    meta = {
+        "auto_create_index": False,
+        "indexes": [
+            "email",
+            "email_lower",
+            ("search_tokens", "id"),
+            "tax_status.status",
+            "compliance_status.status",
+            ("-donation_log.total_donations", "-id"),
+        ],
+    }
+
+    # Keeps the search keys in step with the names and email on every save
+    def clean(self):
+        self.search_tokens = search_tokens(*(self[f] for f in RECIPIENT_NAME_FIELDS))
+        self.email_lower = self.email.lower() if self.email else None
@@ -0,0 +1,16 @@
+from mongoengine import Document, StringField, DateTimeField
+
+
+class RevokedToken(Document):
+    jti = StringField(required=True, unique=True)
+    expires_at = DateTimeField(required=True)
+    revoked_at = DateTimeField()
+
+    meta = {
+        "collection": "revoked_tokens",
+        "auto_create_index": False,
+        "indexes": [
+            {"fields": ["expires_at"], "expireAfterSeconds": 0},
+            "revoked_at",
+        ],
+    }
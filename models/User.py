@@ -4,3 +4,8 @@ from mongoengine import Document, StringField
 class User(Document):
     email = StringField(max_length=100, required=True)
     password_hash = StringField(required=True)
+
+    meta = {
+        "auto_create_index": False,
+        "indexes": [{"fields": ["email"], "unique": True}],
+    }
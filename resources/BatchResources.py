@@ -0,0 +1,81 @@
+from flask import request
+from flask_jwt_extended import jwt_required
+from flask_restful import Resource
+from resources.DonationResources import (
+    form_post_schema,
+    listing_post_schema,
+    new_form_data,
+)
+from resources.DonorResources import impact_log_post_schema, rating_post_schema
+from services.BatchServices import MAX_BATCH_SIZE, run_batch
+from utils.Auth import current_donor_id, current_recipient_id
+from utils.Serializer import json_response
+
+
+# Per sub-operation of POST /batch: the schema of its body, the role the
+# caller needs and the path parameter of the single endpoint it stands for
+# (None when it is the caller's own id)
+BATCH_OPERATIONS = {
+    "create_listing": (listing_post_schema, "donor", None),
+    "create_form": (form_post_schema, "recipient", "listing_id"),
+    "rate_donation": (rating_post_schema, "recipient", "donor_id"),
+    "add_impact_log": (impact_log_post_schema, "donor", "donor_id"),
+}
+
+
+class BatchResource(Resource):
+    # The body is an array (or {"operations": [...]}) of sub-operations such
+    # as {"op": "rate_donation", "donor_id": "...", "body": {...}}. The
+    # response holds one {"status", "body"} result per sub-operation, in
+    # order, each as the single endpoint would have answered.
+    @jwt_required()
+    def post(self):
+        body = request.get_json(silent=True)
+        operations = body.get("operations") if isinstance(body, dict) else body
+        if not isinstance(operations, list) or not operations:
+            return json_response(
+                {"error": "The body must be a non-empty array of operations"}, 400
+            )
+        if len(operations) > MAX_BATCH_SIZE:
+            return json_response(
+                {"error": f"A batch holds at most {MAX_BATCH_SIZE} operations"}, 400
+            )
+        # The caller is identified once for the whole batch
+        callers = {"donor": current_donor_id(), "recipient": current_recipient_id()}
+        results, groups = {}, {}
+        for index, operation in enumerate(operations):
+            name = operation.get("op") if isinstance(operation, dict) else None
+            if name not in BATCH_OPERATIONS:
+                results[index] = (
+                    400,
+                    {"message": f"op must be one of {list(BATCH_OPERATIONS)}"},
+                )
+                continue
+            schema, role, parameter = BATCH_OPERATIONS[name]
+            caller = callers[role]
+            if not caller:
+                results[index] = (403, {"message": f"{name} requires a {role}"})
+                continue
+            target = caller if parameter is None else operation.get(parameter)
+            if not target or not isinstance(target, str):
+                results[index] = (
+                    400,
+                    {"message": {parameter: f"{parameter} is required"}},
+                )
+                continue
+            values, errors = schema.validate(operation.get("body", {}))
+            if errors:
+                results[index] = (400, {"message": errors})
+                continue
+            if name == "create_form":
+                values = new_form_data(target, caller, values)
+            groups.setdefault(name, []).append((index, target, values))
+        results.update(run_batch(groups))
+        return json_response(
+            {
+                "results": [
+                    {"status": status, "body": body}
+                    for status, body in (results[i] for i in range(len(operations)))
+                ]
+            }
+        )
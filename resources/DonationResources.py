@@ -1,268 +1,235 @@
 import datetime
-from bson import json_util
-from flask import abort, make_response, jsonify, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from flask_restful import Resource, reqparse
+import logging
+from flask import abort, request
+from flask_jwt_extended import jwt_required
+from flask_restful import Resource
 from services.DonationServices import *
 from services.DonorServices import *
 from services.RecipientServices import * 
-from models.Donation import Donation
+from utils.Auth import current_donor_id, current_recipient_id
+from utils.ETags import fresh, make_etag, not_modified, tagged
+from utils.Fields import InvalidFieldsError
+from utils.Pagination import InvalidCursorError, InvalidPageError, page_arguments
+from utils.Serializer import json_response
+from utils.Validation import DATE, Field, Schema
 
 
-headers = {"Content-Type": "application/json"}
+logger = logging.getLogger(__name__)
 
-# Define parsers for request validation
-listing_post_parser = reqparse.RequestParser()
-listing_post_parser.add_argument(
-    "food_type", type=str, required=True, help="Food Type is required"
-)
-listing_post_parser.add_argument(
-    "total_lbs_food", type=int, required=True, help="Total Lbs of Food is required"
-)
-listing_post_parser.add_argument(
-    "refrigeration_requirements",
-    type=str,
-    required=True,
-    help="Refrigeration Requirements are required",
-)
-listing_post_parser.add_argument(
-    "expiration_date", type=str, required=True, help="Expiration Date is required"
-)
+REFRIGERATION_REQUIREMENTS = ["None", "Refrigerated", "Frozen"]
 
-form_post_parser = reqparse.RequestParser()
-form_post_parser.add_argument(
-    "total_lbs_food", type=int, required=True, help="Total Lbs of Food is required"
-)
-form_post_parser.add_argument(
-    "lbs_expired_food", type=int, required=True, help="Lbs of Expired Food is required"
-)
-form_post_parser.add_argument(
-    "lbs_food_for_consumption",
-    type=int,
-    required=True,
-    help="Lbs of Food for Consumption is required",
-)
-form_post_parser.add_argument(
-    "lbs_food_for_farms",
-    type=int,
-    required=True,
-    help="Lbs of Food for Farms is required",
-)
-form_post_parser.add_argument(
-    "lbs_food_for_waste",
-    type=int,
-    required=True,
-    help="Lbs of Food for Waste is required",
-)
-form_post_parser.add_argument(
-    "donor_first_name", type=str, required=True, help="Donor first name is required"
-)
-form_post_parser.add_argument(
-    "donor_last_name", type=str, required=True, help="Donor last name is required"
+# Request body schemas
+listing_post_schema = Schema(
+    food_type=Field(str, required=True, help="Food Type is required"),
+    total_lbs_food=Field(
+        float, required=True, minimum=0, help="Total Lbs of Food is required"
+    ),
+    refrigeration_requirements=Field(
+        str,
+        required=True,
+        choices=REFRIGERATION_REQUIREMENTS,
+        help="Refrigeration Requirements are required",
+    ),
+    expiration_date=Field(DATE, required=True, help="Expiration Date is required"),
 )
-form_post_parser.add_argument(
-    "recipient_first_name",
-    type=str,
-    required=True,
-    help="Recipient first name is required",
-)
-form_post_parser.add_argument(
-    "recipient_last_name",
-    type=str,
-    required=True,
-    help="Recipient last name is required",
+
+listing_patch_schema = Schema(
+    food_type=Field(str),
+    total_lbs_food=Field(float, minimum=0),
+    refrigeration_requirements=Field(str, choices=REFRIGERATION_REQUIREMENTS),
+    expiration_date=Field(DATE),
 )
 
-receipt_post_parser = reqparse.RequestParser()
-receipt_post_parser.add_argument(
-    "donation_amount_lbs",
-    type=int,
-    required=True,
-    help="Donation Amount (Lbs) is required",
+form_post_schema = Schema(
+    total_lbs_food=Field(
+        float, required=True, minimum=0, help="Total Lbs of Food is required"
+    ),
+    lbs_expired_food=Field(
+        float, required=True, minimum=0, help="Lbs of Expired Food is required"
+    ),
+    lbs_food_for_consumption=Field(
+        float,
+        required=True,
+        minimum=0,
+        help="Lbs of Food for Consumption is required",
+    ),
+    lbs_food_for_farms=Field(
+        float, required=True, minimum=0, help="Lbs of Food for Farms is required"
+    ),
+    lbs_food_for_waste=Field(
+        float, required=True, minimum=0, help="Lbs of Food for Waste is required"
+    ),
+    donor_first_name=Field(str, required=True, help="Donor first name is required"),
+    donor_last_name=Field(str, required=True, help="Donor last name is required"),
+    recipient_first_name=Field(
+        str, required=True, help="Recipient first name is required"
+    ),
+    recipient_last_name=Field(
+        str, required=True, help="Recipient last name is required"
+    ),
 )
-receipt_post_parser.add_argument(
-    "donor_name", type=str, required=True, help="Donor Name is required"
+
+form_patch_schema = Schema(
+    total_lbs_food=Field(float, minimum=0),
+    lbs_expired_food=Field(float, minimum=0),
+    lbs_food_for_consumption=Field(float, minimum=0),
+    lbs_food_for_farms=Field(float, minimum=0),
+    lbs_food_for_waste=Field(float, minimum=0),
 )
-receipt_post_parser.add_argument(
-    "recipient_name", type=str, required=True, help="Recipient Name is required"
+
+receipt_post_schema = Schema(
+    donation_id=Field(str),
+    donation_amount_lbs=Field(
+        float, required=True, minimum=0, help="Donation Amount (Lbs) is required"
+    ),
+    donor_name=Field(str, required=True, help="Donor Name is required"),
+    recipient_name=Field(str, required=True, help="Recipient Name is required"),
+    recipient_id=Field(str),
 )
-receipt_post_parser.add_argument("recipient_id", type=str, required=False)
 
 
-class DonationListingResource(Resource):
-    def serialize_datetime(self, obj):
-        if isinstance(obj, dict):
-            for key, value in obj.items():
-                if isinstance(value, datetime.datetime):
-                    obj[key] = value.isoformat()
-        return obj
+# The form_data of create_form from a validated form_post_schema body,
+# shared with the batch endpoint
+def new_form_data(listing_id, recipient_id, args):
+    return {
+        "form_id": str(uuid.uuid4()),
+        "listing_id": listing_id,
+        "recipient_id": recipient_id,
+        "total_lbs_food": args["total_lbs_food"],
+        "lbs_expired_food": args["lbs_expired_food"],
+        "lbs_food_for_consumption": args["lbs_food_for_consumption"],
+        "lbs_food_for_farms": args["lbs_food_for_farms"],
+        "lbs_food_for_waste": args["lbs_food_for_waste"],
+        "donor_name": f"{args['donor_first_name']} {args['donor_last_name']}",
+        "recipient_name": (
+            f"{args['recipient_first_name']} {args['recipient_last_name']}"
+        ),
+    }
 
+
+# Arguments of plan_listings from the query string, shared with asgi.py
+def listing_list_arguments(args):
+    page, pagesize = page_arguments(args)
+    return {
+        "page": page,
+        "pagesize": pagesize,
+        "food_type": args.get("food_type"),
+        "expiration_date": args.get("expiration_date"),
+        "sort_by": args.get("sort_by"),
+        "cursor": args.get("cursor"),
+    }
+
+
+class DonationListingResource(Resource):
     def get(self, listing_id=None):
+        # The version stamps are read before the documents, so a tag is never
+        # newer than the body it is sent with
         if listing_id:
-            print(Donation)
-            donation = Donation.objects(listing__listing_id=listing_id).first()
-            if not donation or not donation.listing:
+            stamp = get_listing_stamp(listing_id)
+            if not stamp:
                 return {"message": f"Listing with ID {listing_id} not found"}, 404
-            return jsonify(
-                self.serialize_datetime(donation.listing.to_mongo().to_dict())
-            )
+            etag = make_etag(("listing",), [stamp])
+            if fresh(etag):
+                return not_modified(etag)
+            listing = get_listing(listing_id)
+            if not listing:
+                return {"message": f"Listing with ID {listing_id} not found"}, 404
+            return tagged(json_response(listing, dates="iso"), etag)
         else:
-            args = request.args
-            page = int(args.get("page", 1))
-            pagesize = int(args.get("pagesize", 10))
-            food_type = args.get("food_type")
-            expiration_date = args.get("expiration_date")
-            sort_by = args.get("sort_by")
-            listings = get_all_listings(
-                page, pagesize, food_type, expiration_date, sort_by
-            )
-            return jsonify([self.serialize_datetime(listing) for listing in listings])
+            try:
+                etag, listings = get_cached_listings(
+                    **listing_list_arguments(request.args)
+                )
+            except (InvalidCursorError, InvalidPageError) as e:
+                return {"message": str(e)}, 400
+            if fresh(etag):
+                return not_modified(etag)
+            return tagged(json_response(listings, dates="iso"), etag)
 
     @jwt_required()
     def post(self):
-        email_identity = get_jwt_identity()
-        donor = get_donor_by_email(email_identity)
-        if donor and email_identity != donor.email:
+        donor_id = current_donor_id()
+        if not donor_id:
             return abort(403)
-        donor_id = donor.donor_id
-        args = listing_post_parser.parse_args()
-        valid_requirements = ["None", "Refrigerated", "Frozen"]
-        refrigeration_requirements = args.refrigeration_requirements.capitalize()
-        if refrigeration_requirements not in valid_requirements:
-            return {
-                "message": f"Invalid refrigeration requirement. Must be one of {valid_requirements}"
-            }, 400
+        args = listing_post_schema.parse()
         try:
-            listing_data = {
-                "date_listed": datetime.datetime.now(),
-                "food_type": args.food_type,
-                "total_lbs_food": args.total_lbs_food,
-                "refrigeration_requirements": refrigeration_requirements,
-                "expiration_date": datetime.datetime.strptime(
-                    args.expiration_date, "%Y-%m-%d"
-                ),
-            }
+            listing_data = {"date_listed": datetime.datetime.now(), **args}
             listing = create_listing(donor_id, listing_data)
-            return make_response(
-                json_util.dumps(listing.to_mongo().to_dict()), 201, headers
-            )
+            return json_response(listing.to_mongo(), 201)
         except ValueError as e:
             return {"message": str(e)}, 400
         except Exception as e:
-            print(f"Unexpected error while creating listing: {e}")
+            logger.exception("Unexpected error while creating listing")
             return {
                 "message": "An unexpected error occurred while creating the listing"
             }, 500
 
     @jwt_required()
     def patch(self, listing_id):
-        email_identity = get_jwt_identity()
-        donor = get_donor_by_email(email_identity)
-        if not donor or email_identity != donor.email:
+        if not current_donor_id():
             return abort(403)
-        data = request.get_json()
-        listing = update_listing(
-            listing_id=listing_id,
-            food_type=data.get("food_type"),
-            total_lbs_food=data.get("total_lbs_food"),
-            refrigeration_requirements=data.get("refrigeration_requirements"),
-            expiration_date=data.get("expiration_date"),
-        )
+        args = listing_patch_schema.parse()
+        listing = update_listing(listing_id=listing_id, **args)
         if not listing:
-            return make_response(
+            return json_response(
                 {"error": f"Listing with ID {listing_id} not found"}, 404
             )
-        return make_response(json_util.dumps(listing.to_mongo().to_dict()), 200)
+        return json_response(listing.to_mongo())
 
     @jwt_required()
     def delete(self, listing_id):
-        email_identity = get_jwt_identity()
-        donor = get_donor_by_email(email_identity)
-        if not donor or email_identity != donor.email:
+        if not current_donor_id():
             return abort(403)
         listing = delete_listing(listing_id)
         if not listing:
-            return make_response(
+            return json_response(
                 {"error": f"Listing with ID {listing_id} not found"}, 404
             )
-        return make_response(json_util.dumps(listing), 200)
+        return json_response(listing)
 
 
 class DonationFormResource(Resource):
-    def serialize_datetime(self, obj):
-        if isinstance(obj, dict):
-            for key, value in obj.items():
-                if isinstance(value, datetime.datetime):
-                    obj[key] = value.isoformat()
-        return obj
-
     def get(self, listing_id):
-        donation = Donation.objects(listing__listing_id=listing_id).first()
-        if not donation or not donation.listing:
+        form = get_all_forms(listing_id)
+        if form is None:
             return {"message": f"Listing with ID {listing_id} not found"}, 404
-        if not donation.form:
+        if not form:
             return {"message": f"No form found for Listing ID {listing_id}"}, 404
-        return make_response(
-            json_util.dumps(donation.form.to_mongo().to_dict()), 200, headers
-        )
+        return json_response(form)
 
     @jwt_required()
     def post(self, listing_id):
-        email_identity = get_jwt_identity()
-        recipient = get_recipient_by_email(email_identity)
-        if not recipient or email_identity != recipient.email:
+        recipient_id = current_recipient_id()
+        if not recipient_id:
             return abort(403)
-        args = form_post_parser.parse_args()
-        recipient_id = recipient.recipient_id
-        donation = Donation.objects(listing__listing_id=listing_id).first()
-        if not donation:
-            return {"message": f"Listing with ID {listing_id} not found"}, 404
-        form_data = {
-            "form_id": str(uuid.uuid4()),
-            "listing_id": listing_id,
-            "donation_id": donation.donation_id,
-            "recipient_id": recipient_id,
-            "donor_id": donation.donor_id,
-            "total_lbs_food": args.total_lbs_food,
-            "lbs_expired_food": args.lbs_expired_food,
-            "lbs_food_for_consumption": args.lbs_food_for_consumption,
-            "lbs_food_for_farms": args.lbs_food_for_farms,
-            "lbs_food_for_waste": args.lbs_food_for_waste,
-            "donor_name": f"{args.donor_first_name} {args.donor_last_name}",
-            "recipient_name": f"{args.recipient_first_name} {args.recipient_last_name}",
-        }
+        form_data = new_form_data(listing_id, recipient_id, form_post_schema.parse())
         try:
-            form = create_form(donation.donor_id, listing_id, form_data)
+            form = create_form(None, listing_id, form_data)
             if not form:
-                return {
-                    "message": f"Form creation failed for Listing ID {listing_id}"
-                }, 404
-            return make_response(
-                json_util.dumps(form.get("form").to_mongo().to_dict()), 201
-            )
+                return {"message": f"Listing with ID {listing_id} not found"}, 404
+            return json_response(form.get("form").to_mongo(), 201)
         except ValidationError as e:
             return {"message": f"Validation error: {str(e)}"}, 400
         except Exception as e:
+            logger.exception("Unexpected error while creating form")
             return {
                 "message": f"An error occurred while creating the form: {str(e)}"
             }, 500
 
     @jwt_required()
     def patch(self, listing_id, form_id):
-        email_identity = get_jwt_identity()
-        recipient = get_recipient_by_email(email_identity)
-        if not recipient or email_identity != recipient.email:
+        if not current_recipient_id():
             return abort(403)
-        data = request.get_json()
+        args = form_patch_schema.parse()
+        if all(value is None for value in args.values()):
+            return {"message": "No update data provided"}, 400
         try:
-            form = update_form(listing_id, form_id, data)
+            form = update_form(listing_id, form_id, args)
             if not form:
                 return {
                     "message": f"No form found for Form ID {form_id} in Listing ID {listing_id}"
                 }, 404
-            return make_response(
-                json_util.dumps(form.get("form").to_mongo().to_dict()), 200
-            )
+            return json_response(form.get("form").to_mongo())
         except ValidationError as e:
             return {"message": f"Validation error: {str(e)}"}, 400
         except Exception as e:
@@ -272,9 +239,7 @@ class DonationFormResource(Resource):
 
     @jwt_required()
     def delete(self, listing_id, form_id):
-        email_identity = get_jwt_identity()
-        recipient = get_recipient_by_email(email_identity)
-        if not recipient or email_identity != recipient.email:
+        if not current_recipient_id():
             return abort(403)
         try:
             deleted_form = delete_form(listing_id)
@@ -282,11 +247,10 @@ class DonationFormResource(Resource):
                 return {
                     "message": f"No form found for Form ID {form_id} in Listing ID {listing_id}"
                 }, 404
-            return make_response(
+            return json_response(
                 {
                     "message": f"Form for Form ID {form_id} in Listing ID {listing_id} deleted successfully"
-                },
-                200,
+                }
             )
         except Exception as e:
             return {
@@ -300,7 +264,7 @@ class DonationReceiptResource(Resource):
             receipt = get_receipts(listing_id)
             if not receipt:
                 return {"message": f"No receipt found for Listing ID {listing_id}"}, 404
-            return make_response(json_util.dumps(receipt.to_mongo().to_dict()), 200)
+            return json_response(receipt)
         except Exception as e:
             return {
                 "message": f"An error occurred while retrieving the receipt: {str(e)}"
@@ -308,30 +272,24 @@ class DonationReceiptResource(Resource):
 
     @jwt_required()
     def post(self, listing_id):
-        email_identity = get_jwt_identity()
-        donor = get_donor_by_email(email_identity)
-        if not donor or email_identity != donor.email:
+        donor_id = current_donor_id()
+        if not donor_id:
             return abort(403)
-        donor_id = donor.donor_id
-        data = request.get_json()
+        args = receipt_post_schema.parse()
         receipt_data = {
             "receipt_id": str(uuid.uuid4()),
-            "donation_id": data.get("donation_id"),
             "date_issued": datetime.datetime.now(),
-            "donation_amount_lbs": data.get("donation_amount_lbs"),
-            "donor_name": data.get("donor_name"),
-            "recipient_name": data.get("recipient_name"),
-            "recipient_id": data.get("recipient_id"),
+            **args,
         }
         try:
             receipt = create_receipt(donor_id, listing_id, receipt_data)
             if not receipt:
                 return {"message": f"Listing with ID {listing_id} not found"}, 404
-            return make_response(json_util.dumps(receipt.to_mongo().to_dict()), 201)
+            return json_response(receipt.to_mongo(), 201)
         except ValidationError as e:
             return {"message": f"Validation error: {str(e)}"}, 400
         except Exception as e:
-            print(f"Unexpected error while creating receipt: {e}")
+            logger.exception("Unexpected error while creating receipt")
             return {
                 "message": "An unexpected error occurred while creating the receipt"
             }, 500
@@ -341,15 +299,19 @@ class ReceiptResource(Resource):
     def get(self):
         try:
             args = request.args
-            page = int(args.get("page", 1))
-            pagesize = int(args.get("pagesize", 10))
+            page, pagesize = page_arguments(args)
             donor_id = args.get("donorid")
             recipient_id = args.get("recipientid")
             sort_by = args.get("sort_by")
-            receipts = get_all_receipts(page, pagesize, donor_id, recipient_id, sort_by)
+            cursor = args.get("cursor")
+            receipts = get_all_receipts(
+                page, pagesize, donor_id, recipient_id, sort_by, cursor
+            )
             if not receipts:
                 return {"message": "No receipts found"}, 404
-            return make_response(json_util.dumps(receipts), 200)
+            return json_response(receipts)
+        except (InvalidCursorError, InvalidPageError) as e:
+            return {"message": str(e)}, 400
         except Exception as e:
             return {
                 "message": f"An error occurred while retrieving receipts: {str(e)}"
@@ -362,7 +324,7 @@ class ReceiptDetailResource(Resource):
             receipt = get_receipt_by_id(receipt_id)
             if not receipt:
                 return {"message": f"Receipt with ID {receipt_id} not found"}, 404
-            return make_response(json_util.dumps(receipt), 200)
+            return json_response(receipt)
         except Exception as e:
             return {
                 "message": f"An error occurred while retrieving the receipt: {str(e)}"
@@ -372,10 +334,19 @@ class ReceiptDetailResource(Resource):
 class DonationDetailResource(Resource):
     def get(self, donation_id):
         try:
-            donation = get_donation_by_id(donation_id)
+            fields = request.args.get("fields")
+            stamp = get_donation_stamp(donation_id)
+            if not stamp:
+                return {"message": f"Donation with ID {donation_id} not found"}, 404
+            etag = make_etag(("donation", fields), [stamp])
+            if fresh(etag):
+                return not_modified(etag)
+            donation = get_donation_by_id(donation_id, fields=fields)
             if not donation:
                 return {"message": f"Donation with ID {donation_id} not found"}, 404
-            return make_response(json_util.dumps(donation), 200)
+            return tagged(json_response(donation), etag)
+        except InvalidFieldsError as e:
+            return json_response({"error": str(e)}, 400)
         except Exception as e:
             return {
                 "message": f"An error occurred while retrieving the donation: {str(e)}"
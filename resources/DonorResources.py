@@ -1,135 +1,151 @@
-from bson import json_util
-from flask import abort, make_response, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from flask_restful import reqparse, Resource
+from flask import abort, request
+from flask_jwt_extended import jwt_required
+from flask_restful import Resource
 from models.Donor import *
 from services.DonorServices import *
 from services.RecipientServices import *
+from utils.Auth import current_donor_id, current_recipient_id
+from utils.ETags import PRIVATE, fresh, make_etag, not_modified, tagged
+from utils.Fields import InvalidFieldsError
+from utils.Pagination import InvalidCursorError, InvalidPageError, page_arguments
+from utils.Search import without_search_fields
+from utils.Serializer import json_response
+from utils.Validation import DATE, Field, Schema
+
+
+post_schema = Schema(
+    first_name=Field(str, required=True, help="First name is required"),
+    last_name=Field(str, required=True, help="Last name is required"),
+    email=Field(str, required=True, help="Email is required"),
+    phone_number=Field(str),
+    street_and_number=Field(
+        str, required=True, help="Street and number are required"
+    ),
+    city=Field(str, required=True, help="City is required"),
+    state=Field(str, required=True, help="State is required"),
+    zip_code=Field(str, required=True, help="ZIP code is required"),
+    country=Field(str, required=True, help="Country is required"),
+    tax_id=Field(str, required=True, help="Tax ID is required"),
+    company_association=Field(
+        str, required=True, help="Company association is required"
+    ),
+)
 
-
-headers = {"Content-Type": "application/json"}
-
-post_parser = reqparse.RequestParser()
-post_parser.add_argument(
-    "first_name", type=str, required=True, help="First name is required"
+patch_schema = Schema(
+    phone_number=Field(str),
+    address=Field(dict),
+    company_association=Field(str),
 )
-post_parser.add_argument(
-    "last_name", type=str, required=True, help="Last name is required"
+
+rating_post_schema = Schema(
+    donation_id=Field(str, required=True, help="donation_id is required"),
+    stars=Field(int, required=True, minimum=1, maximum=5, help="stars is required"),
+    message=Field(str),
 )
-post_parser.add_argument("email", type=str, required=True, help="Email is required")
-post_parser.add_argument("phone_number", type=str, required=False, help="Phone number")
-post_parser.add_argument(
-    "street_and_number", type=str, required=True, help="Street and number are required"
+
+rating_patch_schema = Schema(
+    stars=Field(int, minimum=1, maximum=5),
+    message=Field(str),
 )
-post_parser.add_argument("city", type=str, required=True, help="City is required")
-post_parser.add_argument("state", type=str, required=True, help="State is required")
-post_parser.add_argument(
-    "zip_code", type=str, required=True, help="ZIP code is required"
+
+# Every per-donation field counted into the impact log is required
+impact_log_post_schema = Schema(
+    **{
+        field: Field(
+            int if field == "food_security_impact" else float,
+            required=True,
+            help=f"{field} is required",
+        )
+        for field in IMPACT_LOG_TOTALS
+    }
 )
-post_parser.add_argument("country", type=str, required=True, help="Country is required")
-post_parser.add_argument("tax_id", type=str, required=True, help="Tax ID is required")
-post_parser.add_argument(
-    "company_association",
-    type=str,
-    required=True,
-    help="Company association is required",
+
+impact_log_patch_schema = Schema(
+    **{
+        field: Field(int if field == "food_security_impact" else float)
+        for field in IMPACT_LOG_TOTALS
+    },
+    receipt_id=Field(str),
+    date=Field(DATE),
 )
 
-patch_parser = reqparse.RequestParser()
-patch_parser.add_argument("phone_number", type=str, required=False)
-patch_parser.add_argument("street_and_number", type=str, required=False)
-patch_parser.add_argument("city", type=str, required=False)
-patch_parser.add_argument("state", type=str, required=False)
-patch_parser.add_argument("zip_code", type=str, required=False)
-patch_parser.add_argument("country", type=str, required=False)
-patch_parser.add_argument("company_association", type=str, required=False)
+
+# Arguments of get_all_donors from the query string, shared with asgi.py
+def donor_list_arguments(args):
+    page, pagesize = page_arguments(args)
+    return {
+        "page": page,
+        "pagesize": pagesize,
+        "donor_id": args.get("id"),
+        "name": args.get("name"),
+        "email": args.get("email"),
+        "sort_by": args.get("numberdonations"),
+        "cursor": args.get("cursor"),
+        "fields": args.get("fields"),
+    }
 
 
 class DonorResource(Resource):
     def get(self, donor_id=None):
         if donor_id:
-            donor_data = get_donor(donor_id)
+            fields = request.args.get("fields")
+            not_found = {"error": f"Donor with ID {donor_id} not found"}
+            # Stamp first, so the tag is never newer than the body
+            stamp = get_donor_stamp(donor_id)
+            if not stamp:
+                return json_response(not_found, 404)
+            etag = make_etag(("donor", fields), [stamp])
+            if fresh(etag):
+                return not_modified(etag, PRIVATE)
+            try:
+                donor_data = get_donor(donor_id, fields=fields)
+            except InvalidFieldsError as e:
+                return json_response({"error": str(e)}, 400)
             if not donor_data:
-                return make_response(
-                    json_util.dumps({"error": f"Donor with ID {donor_id} not found"}),
-                    404,
-                    headers,
-                )
-            return make_response(json_util.dumps(donor_data), 200, headers)
+                return json_response(not_found, 404)
+            return tagged(json_response(donor_data), etag, PRIVATE)
         else:
-            args = request.args
-            donors = get_all_donors(
-                page=int(args.get("page", 1)),
-                pagesize=int(args.get("pagesize", 10)),
-                donor_id=args.get("id"),
-                name=args.get("name"),
-                email=args.get("email"),
-                sort_by=args.get("numberdonations"),
-            )
-            return make_response(json_util.dumps(donors), 200, headers)
+            try:
+                donors = get_all_donors(**donor_list_arguments(request.args))
+            except (InvalidCursorError, InvalidFieldsError, InvalidPageError) as e:
+                return json_response({"error": str(e)}, 400)
+            return json_response(donors)
 
     @jwt_required()
     def post(self):
-        email_identity = get_jwt_identity()
-        donor = get_donor_by_email(email_identity)
-        if donor and email_identity != donor.email:
-            return abort(403)
-        data = request.get_json()
+        args = post_schema.parse()
         address = {
-            "street_and_number": data.get("street_and_number"),
-            "city": data.get("city"),
-            "state": data.get("state"),
-            "zip_code": data.get("zip_code"),
-            "country": data.get("country"),
+            "street_and_number": args["street_and_number"],
+            "city": args["city"],
+            "state": args["state"],
+            "zip_code": args["zip_code"],
+            "country": args["country"],
         }
         donor = create_donor(
-            first_name=data.get("first_name"),
-            last_name=data.get("last_name"),
-            email=data.get("email"),
-            phone_number=data.get("phone_number"),
+            first_name=args["first_name"],
+            last_name=args["last_name"],
+            email=args["email"],
+            phone_number=args["phone_number"],
             address=address,
-            tax_id=data.get("tax_id"),
-            company_association=data.get("company_association"),
+            tax_id=args["tax_id"],
+            company_association=args["company_association"],
         )
-        return make_response(json_util.dumps(donor.to_mongo().to_dict()), 201, headers)
+        return json_response(without_search_fields(donor.to_mongo()), 201)
 
     @jwt_required()
     def patch(self, donor_id):
-        email_identity = get_jwt_identity()
-        donor = get_donor_by_email(email_identity)
-        if donor and email_identity != donor.email:
-            return abort(403)
-        data = request.get_json()
-        updated_donor = update_donor(
-            donor_id=donor_id,
-            phone_number=data.get("phone_number"),
-            address=data.get("address"),
-            company_association=data.get("company_association"),
-        )
+        args = patch_schema.parse()
+        updated_donor = update_donor(donor_id=donor_id, **args)
         if not updated_donor:
-            return make_response(
-                {"error": f"Donor with ID {donor_id} not found"}, 404, headers
-            )
-        return make_response(json_util.dumps(updated_donor), 200, headers)
+            return json_response({"error": f"Donor with ID {donor_id} not found"}, 404)
+        return json_response(updated_donor)
 
     @jwt_required()
     def delete(self, donor_id):
-        email_identity = get_jwt_identity()
-        donor = get_donor_by_email(email_identity)
-        if donor and email_identity != donor.email:
-            return abort(403)
-        if not donor:
-            return make_response(
-                json_util.dumps({"error": f"Donor with ID {donor_id} not found"}),
-                404,
-                headers,
-            )
+        if not current_donor_id():
+            return json_response({"error": f"Donor with ID {donor_id} not found"}, 404)
         delete_donor(donor_id)
-        return make_response(
-            json_util.dumps({"message": f"Donor with ID {donor_id} has been deleted"}),
-            200,
-            headers,
-        )
+        return json_response({"message": f"Donor with ID {donor_id} has been deleted"})
 
 
 class RatingsResource(Resource):
@@ -137,58 +153,39 @@ class RatingsResource(Resource):
         ratings = get_ratings(donor_id)
         if not ratings:
             return {"message": f"Donor with ID {donor_id} not found"}, 404
-        return make_response(json_util.dumps(ratings), 200)
+        return json_response(ratings)
 
     @jwt_required()
     def post(self, donor_id):
-        email_identity = get_jwt_identity()
-        recipient = get_recipient_by_email(email_identity)
-        if not recipient or email_identity != recipient.email:
+        if not current_recipient_id():
             return abort(403)
-        data = request.get_json()
-        if "donation_id" not in data or "stars" not in data:
-            return {"message": "Missing required fields: donation_id, stars"}, 400
-
-        result = create_rating(
-            donor_id=donor_id,
-            donation_id=data["donation_id"],
-            stars=data["stars"],
-            message=data.get("message"),
-        )
+        args = rating_post_schema.parse()
+        result = create_rating(donor_id=donor_id, **args)
         if "error" in result:
             return {"message": result["error"]}, 404
-        return make_response(json_util.dumps(result), 201)
+        return json_response(result, 201)
 
     @jwt_required()
     def patch(self, donor_id, donation_id):
-        email_identity = get_jwt_identity()
-        recipient = get_recipient_by_email(email_identity)
-        if not recipient or email_identity != recipient.email:
+        if not current_recipient_id():
             return abort(403)
-        data = request.get_json()
-        if not data:
+        args = rating_patch_schema.parse()
+        if args["stars"] is None and args["message"] is None:
             return {"message": "No update data provided"}, 400
 
-        result = update_rating(
-            donor_id=donor_id,
-            donation_id=donation_id,
-            stars=data.get("stars"),
-            message=data.get("message"),
-        )
+        result = update_rating(donor_id=donor_id, donation_id=donation_id, **args)
         if "error" in result:
             return {"message": result["error"]}, 404
-        return make_response(json_util.dumps(result), 200)
+        return json_response(result)
 
     @jwt_required()
     def delete(self, donor_id, donation_id):
-        email_identity = get_jwt_identity()
-        recipient = get_recipient_by_email(email_identity)
-        if not recipient or email_identity != recipient.email:
+        if not current_recipient_id():
             return abort(403)
         result = delete_rating(donor_id, donation_id)
         if "error" in result:
             return {"message": result["error"]}, 404
-        return make_response(json_util.dumps(result), 200)
+        return json_response(result)
 
 
 class ImpactLogResource(Resource):
@@ -199,58 +196,32 @@ class ImpactLogResource(Resource):
                 return {
                     "message": f"Donation with ID {donation_id} not found for donor {donor_id}"
                 }, 404
-            return make_response(json_util.dumps(donation), 200)
+            return json_response(donation)
         else:
             impact_log = get_donor_impact_logs(donor_id)
             if not impact_log:
                 return {"message": f"Donor with ID {donor_id} not found"}, 404
-            return make_response(json_util.dumps(impact_log), 200)
+            return json_response(impact_log)
 
     @jwt_required()
     def post(self, donor_id):
-        email_identity = get_jwt_identity()
-        donor = get_donor_by_email(email_identity)
-        if not donor or email_identity != donor.email:
+        if not current_donor_id():
             return abort(403)
-        data = request.get_json()
-        required_fields = [
-            "total_lbs_food",
-            "lbs_food_for_consumption",
-            "lbs_food_for_farms",
-            "lbs_food_for_waste",
-            "food_security_impact",
-            "environmental_impact",
-            "monetary_impact",
-        ]
-        missing_fields = [field for field in required_fields if field not in data]
-        if missing_fields:
-            return {
-                "message": f"Missing required fields: {', '.join(missing_fields)}"
-            }, 400
-        donation_data = {
-            "total_lbs_food": data["total_lbs_food"],
-            "lbs_food_for_consumption": data["lbs_food_for_consumption"],
-            "lbs_food_for_farms": data["lbs_food_for_farms"],
-            "lbs_food_for_waste": data["lbs_food_for_waste"],
-            "food_security_impact": data["food_security_impact"],
-            "environmental_impact": data["environmental_impact"],
-            "monetary_impact": data["monetary_impact"],
-        }
+        donation_data = impact_log_post_schema.parse()
         donation = add_donor_impact_log(donor_id, donation_data)
         if not donation:
             return {"message": f"Donor with ID {donor_id} not found"}, 404
-        return make_response(json_util.dumps(donation), 201)
+        return json_response(donation, 201)
 
     @jwt_required()
     def patch(self, donor_id, donation_id):
-        email_identity = get_jwt_identity()
-        donor = get_donor_by_email(email_identity)
-        if not donor or email_identity != donor.email:
+        if not current_donor_id():
             return abort(403)
-        data = request.get_json()
+        args = impact_log_patch_schema.parse()
+        data = {field: value for field, value in args.items() if value is not None}
         if not data:
             return {"message": "No update data provided"}, 400
         updated_donation = update_donor_impact_log_donation(donor_id, donation_id, data)
         if "error" in updated_donation:
             return {"message": updated_donation["error"]}, 404
-        return make_response(json_util.dumps(updated_donation), 200)
+        return json_response(updated_donation)
@@ -1,214 +1,216 @@
-from bson import json_util
-from flask import abort, make_response, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from flask_restful import reqparse, Resource
+import logging
+from flask import abort, request
+from flask_jwt_extended import jwt_required
+from flask_restful import Resource
 from models.Recipient import *
 from services.RecipientServices import *
-
-
-headers = {"Content-Type": "application/json"}
-
-post_parser = reqparse.RequestParser()
-post_parser.add_argument("first_name", type=str, required=False, help="First name")
-post_parser.add_argument("last_name", type=str, required=False, help="Last name")
-post_parser.add_argument(
-    "organization_name", type=str, required=False, help="Organization name"
+from utils.Auth import current_recipient_id
+from utils.ETags import PRIVATE, fresh, make_etag, not_modified, tagged
+from utils.Fields import InvalidFieldsError
+from utils.Pagination import InvalidCursorError, InvalidPageError, page_arguments
+from utils.Search import without_search_fields
+from utils.Serializer import json_response
+from utils.Validation import Field, Schema
+
+
+logger = logging.getLogger(__name__)
+
+post_schema = Schema(
+    first_name=Field(str),
+    last_name=Field(str),
+    organization_name=Field(str),
+    email=Field(str, required=True, help="Email is required"),
+    phone_number=Field(str, required=True, help="Phone number is required"),
+    street_and_number=Field(
+        str, required=True, help="Street and number are required"
+    ),
+    city=Field(str, required=True, help="City is required"),
+    state=Field(str, required=True, help="State is required"),
+    zip_code=Field(str, required=True, help="ZIP code is required"),
+    country=Field(str, required=True, help="Country is required"),
+    ein=Field(str, required=True, help="EIN is required"),
 )
-post_parser.add_argument("email", type=str, required=True, help="Email is required")
-post_parser.add_argument(
-    "phone_number", type=str, required=True, help="Phone number is required"
+
+patch_schema = Schema(
+    phone_number=Field(str),
+    address=Field(dict),
+    tax_status=Field(str),
+    compliance_status=Field(str),
 )
-post_parser.add_argument(
-    "street_and_number", type=str, required=True, help="Street and number are required"
+
+# Per-donation fields counted into the donation log; left out, they default
+donation_log_post_schema = Schema(
+    donation_id=Field(str),
+    receipt_id=Field(str),
+    **{
+        field: Field(int if field == "food_security_impact" else float)
+        for field in DONATION_LOG_TOTALS
+    },
 )
-post_parser.add_argument("city", type=str, required=True, help="City is required")
-post_parser.add_argument("state", type=str, required=True, help="State is required")
-post_parser.add_argument(
-    "zip_code", type=str, required=True, help="ZIP code is required"
+
+status_schema = Schema(
+    status=Field(
+        str, required=True, help="Missing required field 'status' in request body"
+    ),
 )
-post_parser.add_argument("country", type=str, required=True, help="Country is required")
-post_parser.add_argument("ein", type=str, required=True, help="EIN is required")
 
-patch_parser = reqparse.RequestParser()
-patch_parser.add_argument("phone_number", type=str, required=False)
-patch_parser.add_argument("street_and_number", type=str, required=False)
-patch_parser.add_argument("city", type=str, required=False)
-patch_parser.add_argument("state", type=str, required=False)
-patch_parser.add_argument("zip_code", type=str, required=False)
-patch_parser.add_argument("country", type=str, required=False)
-patch_parser.add_argument("compliance_status", type=str, required=False)
-patch_parser.add_argument("tax_status", type=str, required=False)
+
+# Arguments of get_all_recipients from the query string, shared with asgi.py
+def recipient_list_arguments(args):
+    page, pagesize = page_arguments(args)
+    return {
+        "page": page,
+        "pagesize": pagesize,
+        "recipient_id": args.get("id"),
+        "name": args.get("name"),
+        "tax_status": args.get("501c3"),
+        "compliance_status": args.get("goodstanding"),
+        "sort_by": args.get("numberdonations"),
+        "cursor": args.get("cursor"),
+        "email": args.get("email"),
+        "fields": args.get("fields"),
+    }
 
 
 class RecipientResource(Resource):
     def get(self, recipient_id=None):
         if recipient_id:
-            recipient_data = get_recipient(recipient_id)
+            fields = request.args.get("fields")
+            not_found = {"error": f"Recipient with ID {recipient_id} not found"}
+            # Stamp first, so the tag is never newer than the body
+            stamp = get_recipient_stamp(recipient_id)
+            if not stamp:
+                return json_response(not_found, 404)
+            etag = make_etag(("recipient", fields), [stamp])
+            if fresh(etag):
+                return not_modified(etag, PRIVATE)
+            try:
+                recipient_data = get_recipient(recipient_id, fields=fields)
+            except InvalidFieldsError as e:
+                return json_response({"error": str(e)}, 400)
             if not recipient_data:
-                return make_response(
-                    json_util.dumps(
-                        {"error": f"Recipient with ID {recipient_id} not found"}
-                    ),
-                    404,
-                    headers,
-                )
-            return make_response(json_util.dumps(recipient_data), 200, headers)
+                return json_response(not_found, 404)
+            return tagged(json_response(recipient_data), etag, PRIVATE)
         else:
-            args = request.args
-            recipients = get_all_recipients(
-                page=int(args.get("page", 1)),
-                pagesize=int(args.get("pagesize", 10)),
-                recipient_id=args.get("id"),
-                name=args.get("name"),
-                tax_status=args.get("501c3"),
-                compliance_status=args.get("goodstanding"),
-                sort_by=args.get("numberdonations"),
-            )
-            return make_response(json_util.dumps(recipients), 200, headers)
+            try:
+                recipients = get_all_recipients(
+                    **recipient_list_arguments(request.args)
+                )
+            except (InvalidCursorError, InvalidFieldsError, InvalidPageError) as e:
+                return json_response({"error": str(e)}, 400)
+            return json_response(recipients)
 
     @jwt_required()
     def post(self):
-        email_identity = get_jwt_identity()
-        recipient = get_recipient_by_email(email_identity)
-        if not recipient or email_identity != recipient.email:
+        if not current_recipient_id():
             return abort(403)
-        data = request.get_json()
+        args = post_schema.parse()
         address = {
-            "street_and_number": data.get("street_and_number"),
-            "city": data.get("city"),
-            "state": data.get("state"),
-            "zip_code": data.get("zip_code"),
-            "country": data.get("country"),
+            "street_and_number": args["street_and_number"],
+            "city": args["city"],
+            "state": args["state"],
+            "zip_code": args["zip_code"],
+            "country": args["country"],
         }
         recipient = create_recipient(
-            first_name=data.get("first_name"),
-            last_name=data.get("last_name"),
-            organization_name=data.get("organization_name"),
-            email=data["email"],
-            phone_number=data["phone_number"],
+            first_name=args["first_name"],
+            last_name=args["last_name"],
+            organization_name=args["organization_name"],
+            email=args["email"],
+            phone_number=args["phone_number"],
             address=address,
-            ein=data["ein"],
-        )
-        return make_response(
-            json_util.dumps(recipient.to_mongo().to_dict()), 201, headers
+            ein=args["ein"],
         )
+        return json_response(without_search_fields(recipient.to_mongo()), 201)
 
     @jwt_required()
     def patch(self, recipient_id):
-        email_identity = get_jwt_identity()
-        recipient = get_recipient_by_email(email_identity)
-        if not recipient or email_identity != recipient.email:
+        if not current_recipient_id():
             return abort(403)
-        data = request.get_json()
-        updated_recipient = update_recipient(
-            recipient_id=recipient_id,
-            phone_number=data.get("phone_number"),
-            address=data.get("address"),
-            tax_status=data.get("tax_status"),
-            compliance_status=data.get("compliance_status"),
-        )
+        args = patch_schema.parse()
+        updated_recipient = update_recipient(recipient_id=recipient_id, **args)
         if not updated_recipient:
-            return make_response(
-                {"error": f"Recipient with ID {recipient_id} not found"}, 404, headers
+            return json_response(
+                {"error": f"Recipient with ID {recipient_id} not found"}, 404
             )
-        return make_response(json_util.dumps(updated_recipient), 200, headers)
+        return json_response(updated_recipient)
 
     @jwt_required()
     def delete(self, recipient_id):
-        email_identity = get_jwt_identity()
-        recipient = get_recipient_by_email(email_identity)
-        if not recipient or email_identity != recipient.email:
-            return abort(403)
-        if not recipient:
-            return make_response(
-                json_util.dumps(
-                    {"error": f"Recipient with ID {recipient_id} not found"}
-                ),
-                404,
-                headers,
+        if not current_recipient_id():
+            return json_response(
+                {"error": f"Recipient with ID {recipient_id} not found"}, 404
             )
         delete_recipient(recipient_id)
-        return make_response(
-            json_util.dumps(
-                {"message": f"Recipient with ID {recipient_id} has been deleted"}
-            ),
-            200,
-            headers,
+        return json_response(
+            {"message": f"Recipient with ID {recipient_id} has been deleted"}
         )
 
 
 class DonationLogResource(Resource):
+    # A page of the log, `pagesize` entries (10 unless given) at a time;
+    # page is counted from 1 and pagesize is at most MAX_PAGESIZE
     def get(self, recipient_id):
-        logs = get_recipient_donation_logs(recipient_id)
+        args = request.args
+        try:
+            page, pagesize = page_arguments(args)
+            logs = get_recipient_donation_logs(
+                recipient_id, page=page, pagesize=pagesize, since=args.get("since")
+            )
+        except ValueError as e:
+            return json_response({"error": str(e)}, 400)
         if logs is None:
-            return make_response(
-                json_util.dumps(
-                    {"error": f"Recipient with ID {recipient_id} not found"}
-                ),
-                404,
-                headers,
+            return json_response(
+                {"error": f"Recipient with ID {recipient_id} not found"}, 404
             )
-        return make_response(json_util.dumps(logs), 200)
+        return json_response(logs)
 
     @jwt_required()
     def post(self, recipient_id):
-        email_identity = get_jwt_identity()
-        recipient = get_recipient_by_email(email_identity)
-        if not recipient or email_identity != recipient.email:
+        if not current_recipient_id():
             return abort(403)
-        data = request.get_json()
-        log = add_recipient_donation_log(recipient_id=recipient_id, donation_data=data)
+        args = donation_log_post_schema.parse()
+        donation_data = {
+            field: value for field, value in args.items() if value is not None
+        }
+        log = add_recipient_donation_log(
+            recipient_id=recipient_id, donation_data=donation_data
+        )
         if not log:
-            return make_response(
-                json_util.dumps(
-                    {"error": f"Recipient with ID {recipient_id} not found"}
-                ),
-                404,
-                headers,
+            return json_response(
+                {"error": f"Recipient with ID {recipient_id} not found"}, 404
             )
-        return make_response(json_util.dumps(log), 201, headers)
+        return json_response(log, 201)
 
 
 class TaxStatusResource(Resource):
     def get(self, recipient_id):
         status = get_recipient_tax_status(recipient_id)
         if not status:
-            return make_response(
-                json_util.dumps({"error": "Tax status not found"}), 404, headers
-            )
-        return make_response(json_util.dumps(status), 200)
+            return json_response({"error": "Tax status not found"}, 404)
+        return json_response(status)
 
     @jwt_required()
     def patch(self, recipient_id):
-        email_identity = get_jwt_identity()
-        recipient = get_recipient_by_email(email_identity)
-        if not recipient or email_identity != recipient.email:
+        if not current_recipient_id():
             return abort(403)
+        args = status_schema.parse()
         try:
-            data = request.get_json()
-            if not data or "status" not in data:
-                return make_response(
-                    {"error": "Missing required field 'status' in request body"}, 400
-                )
             tax_status = update_recipient_tax_status(
                 recipient_id=recipient_id,
-                status=data["status"],
+                status=args["status"],
                 verification_date=datetime.datetime.now(),
             )
             if not tax_status:
-                return make_response(
-                    json_util.dumps(
-                        {"error": f"Recipient with ID {recipient_id} not found"}
-                    ),
-                    404,
-                    headers,
+                return json_response(
+                    {"error": f"Recipient with ID {recipient_id} not found"}, 404
                 )
-            return make_response(json_util.dumps(tax_status), 200)
+            return json_response(tax_status)
         except Exception as ex:
-            print(
-                f"Error while updating tax exempt status for recipient {recipient_id}: {ex}"
+            logger.exception(
+                "Error while updating tax exempt status for recipient %s", recipient_id
             )
-            return make_response(
+            return json_response(
                 {"error": "An error occurred while updating tax exempt status"}, 500
             )
 
@@ -217,41 +219,29 @@ class ComplianceStatusResource(Resource):
     def get(self, recipient_id):
         compliance = get_recipient_compliance_status(recipient_id)
         if not compliance:
-            return make_response(
-                json_util.dumps({"error": "Compliance status not found"}), 404, headers
-            )
-        return make_response(json_util.dumps(compliance), 200)
+            return json_response({"error": "Compliance status not found"}, 404)
+        return json_response(compliance)
 
     @jwt_required()
     def patch(self, recipient_id):
-        email_identity = get_jwt_identity()
-        recipient = get_recipient_by_email(email_identity)
-        if not recipient or email_identity != recipient.email:
+        if not current_recipient_id():
             return abort(403)
+        args = status_schema.parse()
         try:
-            data = request.get_json()
-            if not data or "status" not in data:
-                return make_response(
-                    {"error": "Missing required field 'status' in request body"}, 400
-                )
             compliance_status = update_recipient_compliance_status(
                 recipient_id=recipient_id,
-                status=data["status"],
+                status=args["status"],
                 verification_date=datetime.datetime.now(),
             )
             if not compliance_status:
-                return make_response(
-                    json_util.dumps(
-                        {"error": f"Recipient with ID {recipient_id} not found"}
-                    ),
-                    404,
-                    headers,
+                return json_response(
+                    {"error": f"Recipient with ID {recipient_id} not found"}, 404
                 )
-            return make_response(json_util.dumps(compliance_status), 200)
+            return json_response(compliance_status)
         except Exception as ex:
-            print(
-                f"Error while updating compliance status for recipient {recipient_id}: {ex}"
+            logger.exception(
+                "Error while updating compliance status for recipient %s", recipient_id
             )
-            return make_response(
+            return json_response(
                 {"error": "An error occurred while updating compliance status"}, 500
             )
@@ -0,0 +1,286 @@
+import datetime
+import logging
+from models.Donation import Donation
+from models.Donor import Donor, ratings_summary
+from mongoengine.errors import ValidationError
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+from services.BucketServices import is_bucketed
+from services.DonationServices import build_listing, form_update, invalidate_listings
+from services.DonorServices import (
+    add_donor_impact_log,
+    create_rating,
+    donation_not_found,
+    forget_donor,
+    impact_log_update,
+    new_impact_log_entry,
+    new_rating,
+    rating_update,
+)
+
+
+logger = logging.getLogger(__name__)
+
+# Most sub-operations one POST /batch may carry
+MAX_BATCH_SIZE = 100
+
+
+# Sends `requests` unordered in one round trip; returns the messages of the
+# writes that failed, by their position in `requests`
+def bulk(collection, requests):
+    if not requests:
+        return {}
+    try:
+        collection.bulk_write(requests, ordered=False)
+    except BulkWriteError as e:
+        return {error["index"]: error["errmsg"] for error in e.details["writeErrors"]}
+    return {}
+
+
+# Each group below takes the (index, target, data) items of one kind of
+# sub-operation, where target is the id the single endpoint takes in its
+# path, and returns {index: (status, body)} with the status and body that
+# endpoint would have answered with.
+
+
+# POST /donations/listings; target is the caller's donor id
+def create_listings(items):
+    results, donations = {}, []
+    now = datetime.datetime.now()
+    for index, donor_id, listing_data in items:
+        try:
+            donation = build_listing(donor_id, {"date_listed": now, **listing_data})
+        except (ValidationError, ValueError) as e:
+            results[index] = (400, {"message": str(e)})
+            continue
+        donations.append((index, donation))
+    failed = bulk(
+        Donation._get_collection(),
+        [InsertOne(donation.to_mongo()) for _, donation in donations],
+    )
+    created = []
+    for position, (index, donation) in enumerate(donations):
+        if position in failed:
+            results[index] = (500, {"message": failed[position]})
+            continue
+        listing = donation.listing.to_mongo()
+        created.append(listing)
+        results[index] = (201, listing)
+    invalidate_listings(*created)
+    return results
+
+
+# POST /donations/listings/:listingId/forms. Whether each form was set is
+# read back in one query afterwards; of two forms for the same listing the
+# later one wins.
+def create_forms(items):
+    results, writes = {}, []
+    for index, listing_id, form_data in items:
+        try:
+            query, update, form = form_update(None, listing_id, form_data)
+        except ValidationError as e:
+            results[index] = (400, {"message": f"Validation error: {str(e)}"})
+            continue
+        writes.append((index, listing_id, form.form_id, UpdateOne(query, update)))
+    collection = Donation._get_collection()
+    failed = bulk(collection, [write for *_, write in writes])
+    donations = {
+        donation["listing"]["listing_id"]: donation
+        for donation in collection.find(
+            {"listing.listing_id": {"$in": [w[1] for w in writes]}},
+            {"_id": 0, "listing": 1, "form": 1},
+        )
+    }
+    for position, (index, listing_id, form_id, _) in enumerate(writes):
+        donation = donations.get(listing_id)
+        if position in failed:
+            results[index] = (500, {"message": failed[position]})
+        elif not donation:
+            message = f"Listing with ID {listing_id} not found"
+            results[index] = (404, {"message": message})
+        elif (donation.get("form") or {}).get("form_id") != form_id:
+            results[index] = (
+                409,
+                {"message": f"Replaced by a later form for Listing ID {listing_id}"},
+            )
+        else:
+            results[index] = (201, donation["form"])
+    invalidate_listings(*(donation["listing"] for donation in donations.values()))
+    return results
+
+
+# POST /donors/:donorId/ratings; target is the donor id. A rating only
+# applies to a donation without one, so which ratings were written is read
+# back in one query afterwards.
+def rate_donations(items):
+    results = {}
+    if is_bucketed():
+        for index, donor_id, rating in items:
+            result = create_rating(donor_id, **rating)
+            if "error" in result:
+                results[index] = (404, {"message": result["error"]})
+            else:
+                results[index] = (201, result)
+        return results
+    # Stored dates keep milliseconds; truncated here, a read-back rating
+    # compares equal to the one that was sent
+    now = datetime.datetime.now()
+    now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+    writes, seen = [], set()
+    for index, donor_id, rating in items:
+        donation_id = rating["donation_id"]
+        if (donor_id, donation_id) in seen:
+            results[index] = (
+                404,
+                {"message": f"Donation with ID {donation_id} already has a rating"},
+            )
+            continue
+        seen.add((donor_id, donation_id))
+        try:
+            stored = new_rating(
+                donation_id, rating["stars"], rating.get("message"), now
+            )
+        except ValidationError as e:
+            results[index] = (400, {"message": str(e)})
+            continue
+        query, update = rating_update(
+            donor_id,
+            {"donation_id": donation_id, "rating": None},
+            stored,
+            {"ratings.stars_sum": stored["stars"], "ratings.total_ratings": 1},
+        )
+        writes.append((index, donor_id, stored, UpdateOne(query, update)))
+    collection = Donor._get_collection()
+    failed = bulk(collection, [write for *_, write in writes])
+    # Only the donations rated here are read back, not whole donation arrays
+    rated = sorted({stored["donation_id"] for _, _, stored, _ in writes})
+    donations = {
+        "$filter": {
+            "input": "$donations",
+            "as": "donation",
+            "cond": {"$in": ["$$donation.donation_id", rated]},
+        }
+    }
+    donors = {
+        donor["donor_id"]: donor
+        for donor in collection.aggregate(
+            [
+                {"$match": {"donor_id": {"$in": [w[1] for w in writes]}}},
+                {
+                    "$project": {
+                        "_id": 0,
+                        "donor_id": 1,
+                        "ratings": 1,
+                        "donations": {
+                            "$map": {
+                                "input": donations,
+                                "as": "donation",
+                                "in": {
+                                    "donation_id": "$$donation.donation_id",
+                                    "rating": "$$donation.rating",
+                                },
+                            }
+                        },
+                    }
+                },
+            ]
+        )
+    }
+    for position, (index, donor_id, stored, _) in enumerate(writes):
+        donor = donors.get(donor_id)
+        donation_id = stored["donation_id"]
+        donation = next(
+            (
+                donation
+                for donation in (donor or {}).get("donations") or []
+                if donation.get("donation_id") == donation_id
+            ),
+            None,
+        )
+        if position in failed:
+            results[index] = (500, {"message": failed[position]})
+        elif not donation:
+            error = donation_not_found(donor_id, donation_id, bool(donor))
+            results[index] = (404, {"message": error["error"]})
+        elif donation.get("rating") != stored:
+            results[index] = (
+                404,
+                {"message": f"Donation with ID {donation_id} already has a rating"},
+            )
+        else:
+            results[index] = (
+                201,
+                {
+                    "message": "Rating created successfully",
+                    "ratings": ratings_summary(donor.get("ratings")),
+                },
+            )
+    for donor_id in donors:
+        forget_donor(donor_id)
+    return results
+
+
+# POST /donors/:donorId/impactlog; target is the donor id
+def add_impact_logs(items):
+    results = {}
+    if is_bucketed():
+        for index, donor_id, donation_data in items:
+            entry = add_donor_impact_log(donor_id, donation_data)
+            if not entry:
+                message = f"Donor with ID {donor_id} not found"
+                results[index] = (404, {"message": message})
+            else:
+                results[index] = (201, entry)
+        return results
+    writes = []
+    for index, donor_id, donation_data in items:
+        try:
+            entry = new_impact_log_entry(donation_data)
+        except ValidationError as e:
+            results[index] = (400, {"message": str(e)})
+            continue
+        update = UpdateOne(*impact_log_update(donor_id, entry))
+        writes.append((index, donor_id, entry, update))
+    collection = Donor._get_collection()
+    failed = bulk(collection, [write for *_, write in writes])
+    found = {
+        donor["donor_id"]
+        for donor in collection.find(
+            {"donor_id": {"$in": [w[1] for w in writes]}}, {"_id": 0, "donor_id": 1}
+        )
+    }
+    for position, (index, donor_id, entry, _) in enumerate(writes):
+        if position in failed:
+            results[index] = (500, {"message": failed[position]})
+        elif donor_id not in found:
+            message = f"Donor with ID {donor_id} not found"
+            results[index] = (404, {"message": message})
+        else:
+            results[index] = (201, entry)
+    for donor_id in found:
+        forget_donor(donor_id)
+    return results
+
+
+# Sub-operations accepted by POST /batch, with the group that performs them
+BATCH_OPERATIONS = {
+    "create_listing": create_listings,
+    "create_form": create_forms,
+    "rate_donation": rate_donations,
+    "add_impact_log": add_impact_logs,
+}
+
+
+# POST /batch
+# `groups` maps sub-operation names to their items; each group is written
+# with one bulk_write. A group that fails as a whole fails each of its items.
+def run_batch(groups):
+    results = {}
+    for name, items in groups.items():
+        try:
+            results.update(BATCH_OPERATIONS[name](items))
+        except Exception:
+            logger.exception("Unexpected error in batch group %s", name)
+            for index, *_ in items:
+                results[index] = (500, {"message": f"An error occurred in {name}"})
+    return results
@@ -0,0 +1,204 @@
+from models.DonationBucket import DonationBucket, BUCKET_SIZE
+from models.Donor import Donor
+from models.Recipient import Recipient
+from utils.EntityCache import entity_cache
+from utils.Updates import versioned
+
+
+STORAGE_MODES = ["embedded", "bucketed"]
+
+# "embedded" keeps donation history inside the donor/recipient document,
+# "bucketed" keeps it in DonationBucket documents of up to BUCKET_SIZE entries
+storage = {"mode": "embedded"}
+
+
+def set_storage_mode(mode):
+    if mode not in STORAGE_MODES:
+        raise ValueError(
+            f"Invalid donation log storage: {mode}. Must be one of {STORAGE_MODES}."
+        )
+    storage["mode"] = mode
+
+
+def is_bucketed():
+    return storage["mode"] == "bucketed"
+
+
+def bucket_query(party_type, party_id, kind):
+    return {"party_type": party_type, "party_id": party_id, "kind": kind}
+
+
+# Appends to the party's open bucket, or starts a new one once it is full
+def append_entry(party_type, party_id, kind, entry):
+    date = entry.get("date")
+    update = {"$push": {"entries": entry}, "$inc": {"count": 1}}
+    if date is not None:
+        update["$min"] = {"first_date": date}
+        update["$max"] = {"last_date": date}
+    DonationBucket._get_collection().update_one(
+        {**bucket_query(party_type, party_id, kind), "count": {"$lt": BUCKET_SIZE}},
+        update,
+        upsert=True,
+    )
+    return entry
+
+
+# Returns only the matching entry, never the rest of its bucket
+def find_entry(party_type, party_id, kind, donation_id):
+    bucket = DonationBucket._get_collection().find_one(
+        {**bucket_query(party_type, party_id, kind), "entries.donation_id": donation_id},
+        {"_id": 0, "entries": {"$elemMatch": {"donation_id": donation_id}}},
+    )
+    return bucket["entries"][0] if bucket else None
+
+
+# Yields the party's entries oldest bucket first, one bucket at a time
+def iter_entries(party_type, party_id, kind):
+    buckets = (
+        DonationBucket._get_collection()
+        .find(bucket_query(party_type, party_id, kind), {"entries": 1})
+        .sort("_id", 1)
+    )
+    for bucket in buckets:
+        yield from bucket.get("entries", [])
+
+
+# One page of the party's entries, oldest first, optionally only those dated
+# on or after `since`. Buckets that end before `since` are not read.
+def page_entries(party_type, party_id, kind, skip, limit, since=None):
+    match = bucket_query(party_type, party_id, kind)
+    if since is not None:
+        match["last_date"] = {"$gte": since}
+    pipeline = [
+        {"$match": match},
+        {"$sort": {"_id": 1}},
+        {"$unwind": "$entries"},
+        {"$replaceRoot": {"newRoot": "$entries"}},
+    ]
+    if since is not None:
+        pipeline.append({"$match": {"date": {"$gte": since}}})
+    pipeline += [{"$skip": skip}, {"$limit": limit}]
+    return list(DonationBucket._get_collection().aggregate(pipeline))
+
+
+# One page of an embedded history array, cut down inside MongoDB with
+# $filter/$slice so only the page is returned. None if `query` matches no
+# document.
+def page_embedded(collection, query, kind, skip, limit, since=None):
+    entries = f"${kind}"
+    if since is not None:
+        entries = {
+            "$filter": {
+                "input": entries,
+                "cond": {"$gte": ["$$this.date", since]},
+            }
+        }
+    documents = list(
+        collection.aggregate(
+            [
+                {"$match": query},
+                {"$limit": 1},
+                {
+                    "$project": {
+                        "_id": 0,
+                        "entries": {
+                            "$slice": [{"$ifNull": [entries, []]}, skip, limit]
+                        },
+                    }
+                },
+            ]
+        )
+    )
+    return documents[0]["entries"] if documents else None
+
+
+# Sets fields on the entry matching `expected`; returns False if no entry
+# matched, e.g. because it was modified concurrently
+def update_entry(party_type, party_id, kind, expected, fields):
+    result = DonationBucket._get_collection().update_one(
+        {
+            **bucket_query(party_type, party_id, kind),
+            "entries": {"$elemMatch": expected},
+        },
+        {"$set": {f"entries.$.{key}": value for key, value in fields.items()}},
+    )
+    return bool(result.matched_count)
+
+
+def pull_entries(party_type, party_id, kind, match):
+    DonationBucket._get_collection().update_many(
+        bucket_query(party_type, party_id, kind), {"$pull": {"entries": match}}
+    )
+
+
+def insert_buckets(party_type, party_id, kind, entries):
+    buckets = []
+    for start in range(0, len(entries), BUCKET_SIZE):
+        chunk = entries[start : start + BUCKET_SIZE]
+        dates = [entry["date"] for entry in chunk if entry.get("date")]
+        buckets.append(
+            {
+                **bucket_query(party_type, party_id, kind),
+                "count": len(chunk),
+                "first_date": min(dates) if dates else None,
+                "last_date": max(dates) if dates else None,
+                "entries": chunk,
+            }
+        )
+    if buckets:
+        DonationBucket._get_collection().insert_many(buckets)
+    return len(buckets)
+
+
+# The entries not yet copied into the party's buckets, told apart by
+# donation_id. Entries without one are always copied.
+def entries_not_in_buckets(party_type, party_id, kind, entries):
+    ids = [entry["donation_id"] for entry in entries if entry.get("donation_id")]
+    copied = set()
+    if ids:
+        query = bucket_query(party_type, party_id, kind)
+        query["entries.donation_id"] = {"$in": ids}
+        buckets = DonationBucket._get_collection().find(
+            query, {"_id": 0, "entries.donation_id": 1}
+        )
+        for bucket in buckets:
+            copied.update(entry.get("donation_id") for entry in bucket["entries"])
+    return [entry for entry in entries if entry.get("donation_id") not in copied]
+
+
+# Moves embedded donation and rating history into buckets. Only the entries
+# that were copied are pulled from the parent document, so writes that land
+# while the migration runs are not lost. Entries already in a bucket are
+# pulled without being copied again, so a run that stopped between the two
+# writes can simply be started again.
+def migrate_to_buckets():
+    migrated = {"donor": 0, "recipient": 0, "buckets": 0}
+    lists = [
+        ("donor", Donor, "donor_id", ["donations", "ratings_details"]),
+        ("recipient", Recipient, "recipient_id", ["donations"]),
+    ]
+    for party_type, model, id_field, kinds in lists:
+        collection = model._get_collection()
+        projection = {id_field: 1, **{kind: 1 for kind in kinds}}
+        for document in collection.find(
+            {"$or": [{f"{kind}.0": {"$exists": True}} for kind in kinds]}, projection
+        ):
+            party_id = document[id_field]
+            pull = {}
+            for kind in kinds:
+                entries = document.get(kind) or []
+                if not entries:
+                    continue
+                migrated["buckets"] += insert_buckets(
+                    party_type,
+                    party_id,
+                    kind,
+                    entries_not_in_buckets(party_type, party_id, kind, entries),
+                )
+                pull[kind] = {"$in": entries}
+            collection.update_one(
+                {"_id": document["_id"]}, versioned({"$pull": pull})
+            )
+            entity_cache.forget(party_type, party_id)
+            migrated[party_type] += 1
+    return migrated
@@ -1,68 +1,191 @@
 import datetime
+import logging
 import uuid
-from .default import default_donations
 from models.Donation import Donation, Listing, Form, Receipt
 from mongoengine.errors import ValidationError
+from pymongo import ReturnDocument
+from utils.Cache import LRUCache
+from utils.ETags import make_etag
+from utils.Fields import fields_projection, parse_fields
+from utils.Pagination import apply_cursor, cursor_page
+from utils.ReadPlans import ReadPlan, run_plan
+from utils.Updates import STAMP_PROJECTION, set_fields, versioned
 
 
-# Helper function for pagination
-def paginate(queryset, page, pagesize):
-    return queryset.skip((page - 1) * pagesize).limit(pagesize)
+logger = logging.getLogger(__name__)
 
 
-# GET /donations/listings
-def get_all_listings(page=1, pagesize=10, food_type=None, expiration_date=None, sort_by=None):
-    query = {}
+# Sort keys accepted by GET /donations/listings, mapped to document paths
+LISTING_SORT_FIELDS = {
+    "date_listed": ("listing.date_listed", 1),
+    "total_lbs_food": ("listing.total_lbs_food", -1),
+}
+
+
+# Builds the filter and the stable sort (ending in _id) for listing queries
+def build_listings_query(food_type=None, expiration_date=None, sort_by=None):
+    query = {"listing": {"$ne": None}}
     if food_type:
         query["listing.food_type"] = food_type
     if expiration_date:
-        query["listing.expiration_date__lte"] = datetime.datetime.strptime(expiration_date, '%Y-%m-%d')
-    
-    donations = Donation.objects(**query)
-    if sort_by == "date_listed":
-        donations = donations.order_by("listing.date_listed")
-    elif sort_by == "total_lbs_food":
-        donations = donations.order_by("-listing.total_lbs_food")
+        query["listing.expiration_date"] = {
+            "$lte": datetime.datetime.strptime(expiration_date, "%Y-%m-%d")
+        }
+    if sort_by in LISTING_SORT_FIELDS:
+        path, direction = LISTING_SORT_FIELDS[sort_by]
+        sort = [(path, direction), ("_id", direction)]
+    else:
+        sort = [("_id", 1)]
+    return query, sort
+
+
+# Plans GET /donations/listings
+def plan_listings(
+    page=1, pagesize=10, food_type=None, expiration_date=None, sort_by=None, cursor=None
+):
+    query, sort = build_listings_query(food_type, expiration_date, sort_by)
+    if cursor is None:
+        return ReadPlan(
+            Donation,
+            query,
+            {"listing": 1},
+            sort,
+            skip=(max(page, 1) - 1) * pagesize,
+            limit=pagesize,
+            item=lambda donation: donation["listing"],
+        )
+    return ReadPlan(
+        Donation,
+        apply_cursor(query, sort, cursor),
+        {"listing": 1},
+        sort,
+        limit=pagesize + 1,
+        page_sort=sort,
+        pagesize=pagesize,
+        item=lambda donation: donation["listing"],
+    )
+
+
+# GET /donations/listings
+def get_all_listings(*args, **kwargs):
+    return run_plan(plan_listings(*args, **kwargs))
+
+
+# Results of GET /donations/listings by listing_cache_key, with their ETags.
+# Writes to a listing drop the entries whose filter matches it; the TTL
+# bounds how long other worker processes, which do not see those writes,
+# may serve a stale page.
+listing_cache = LRUCache("listings")
+
+
+def configure_listing_cache(maxsize, ttl):
+    listing_cache.configure(maxsize, ttl)
+
+
+# (food_type, expiration_date, sort_by, page, pagesize, cursor), with the
+# arguments that do not change the query normalized away
+def listing_cache_key(
+    page=1, pagesize=10, food_type=None, expiration_date=None, sort_by=None, cursor=None
+):
+    return (
+        food_type or None,
+        expiration_date or None,
+        sort_by if sort_by in LISTING_SORT_FIELDS else None,
+        max(page, 1) if cursor is None else None,
+        pagesize,
+        cursor,
+    )
+
+
+# Whether the listing (a raw dict) matches the filter of a cache key
+def listing_matches_key(listing, key):
+    food_type, expiration_date = key[:2]
+    if food_type and listing.get("food_type") != food_type:
+        return False
+    if expiration_date:
+        date = listing.get("expiration_date")
+        limit = datetime.datetime.strptime(expiration_date, "%Y-%m-%d")
+        return date is not None and date <= limit
+    return True
+
+
+# Drops the cached pages that held, or should now hold, any of the listings
+def invalidate_listings(*listings):
+    listings = [listing for listing in listings if listing]
+    listing_cache.invalidate(
+        lambda key: any(listing_matches_key(listing, key) for listing in listings)
+    )
+
 
-    # Paginate results
-    start = (page - 1) * pagesize
-    end = start + pagesize
-    paginated_listings = donations[start:end]
-    return [donation.listing.to_mongo().to_dict() for donation in paginated_listings if donation.listing]
+# GET /donations/listings through the listing cache; returns (etag, listings).
+# A cold key is loaded once however many requests ask for it meanwhile.
+def get_cached_listings(**arguments):
+    plan = plan_listings(**arguments)
+    key = listing_cache_key(**arguments)
+
+    # The stamps are read before the listings, so the tag is never newer
+    # than the page it is stored with
+    def load():
+        etag = make_etag(("listings", key), run_plan(plan.stamps()))
+        return etag, run_plan(plan)
+
+    return listing_cache.get_or_load(key, load)
+
+
+# GET /donations/listings/:listingId
+def get_listing(listing_id):
+    donation = Donation._get_collection().find_one(
+        {"listing.listing_id": listing_id}, {"_id": 0, "listing": 1}
+    )
+    return donation.get("listing") if donation else None
+
+
+# Version stamp of a listing's donation, for the ETag of
+# GET /donations/listings/:listingId
+def get_listing_stamp(listing_id):
+    return Donation._get_collection().find_one(
+        {"listing.listing_id": listing_id}, STAMP_PROJECTION
+    )
+
+
+# The validated, unsaved donation document of a new listing
+def build_listing(donor_id, listing_data):
+    refrigeration_requirements = listing_data.get(
+        "refrigeration_requirements"
+    ).capitalize()
+    valid_requirements = ["None", "Refrigerated", "Frozen"]
+    if refrigeration_requirements not in valid_requirements:
+        raise ValueError(
+            f"Invalid refrigeration requirement: {refrigeration_requirements}. Must be one of {valid_requirements}."
+        )
+    listing = Listing(
+        listing_id=str(uuid.uuid4()),
+        donation_id=listing_data.get("donation_id", str(uuid.uuid4())),
+        donor_id=donor_id,
+        date_listed=listing_data.get("date_listed"),
+        food_type=listing_data.get("food_type"),
+        total_lbs_food=listing_data.get("total_lbs_food"),
+        refrigeration_requirements=refrigeration_requirements,
+        expiration_date=listing_data.get("expiration_date"),
+    )
+    donation = Donation(
+        donation_id=listing.donation_id, donor_id=donor_id, listing=listing
+    )
+    donation.validate()
+    return donation
 
 
 # POST /donations/listings
 def create_listing(donor_id, listing_data):
     try:
-        refrigeration_requirements = listing_data.get(
-            "refrigeration_requirements"
-        ).capitalize()
-        valid_requirements = ["None", "Refrigerated", "Frozen"]
-        if refrigeration_requirements not in valid_requirements:
-            raise ValueError(
-                f"Invalid refrigeration requirement: {refrigeration_requirements}. Must be one of {valid_requirements}."
-            )
-        listing = Listing(
-            listing_id=str(uuid.uuid4()),
-            donation_id=listing_data.get("donation_id", str(uuid.uuid4())),
-            donor_id=donor_id,
-            date_listed=listing_data.get("date_listed"),
-            food_type=listing_data.get("food_type"),
-            total_lbs_food=listing_data.get("total_lbs_food"),
-            refrigeration_requirements=refrigeration_requirements,
-            expiration_date=listing_data.get("expiration_date"),
-        )
-        donation = Donation(
-            donation_id=listing.donation_id, donor_id=donor_id, listing=listing
-        )
-        donation.save()
-        print(f"Listing created successfully: {listing}")
+        donation = build_listing(donor_id, listing_data)
+        donation.save(validate=False)
+        listing = donation.listing
+        invalidate_listings(listing.to_mongo())
+        logger.info("Listing created: %s", listing.listing_id)
         return listing
     except ValidationError as e:
-        print(f"Validation error while creating listing: {e}")
-        raise
-    except Exception as ex:
-        print(f"Unexpected error while creating listing: {ex}")
+        logger.warning("Validation error while creating listing: %s", e)
         raise
 
 
@@ -75,137 +198,220 @@ def update_listing(
     expiration_date=None,
 ):
     try:
-        donation = Donation.objects(listing__listing_id=listing_id).first()
-        if not donation or not donation.listing:
-            return None
-        listing = donation.listing
-        if food_type is not None:
-            listing.food_type = food_type
-        if total_lbs_food is not None:
-            listing.total_lbs_food = total_lbs_food
         if refrigeration_requirements is not None:
             valid_requirements = ["None", "Refrigerated", "Frozen"]
             if refrigeration_requirements.capitalize() not in valid_requirements:
                 raise ValueError(
                     f"Invalid refrigeration requirement. Must be one of {valid_requirements}."
                 )
-            listing.refrigeration_requirements = refrigeration_requirements.capitalize()
-        if expiration_date is not None:
-            listing.expiration_date = (
-                datetime.datetime.strptime(expiration_date, "%Y-%m-%d")
-                if isinstance(expiration_date, str)
-                else expiration_date
-            )
-        donation.listing = listing
-        donation.save()
-        return listing
+            refrigeration_requirements = refrigeration_requirements.capitalize()
+        if isinstance(expiration_date, str):
+            expiration_date = datetime.datetime.strptime(expiration_date, "%Y-%m-%d")
+        updates = set_fields(
+            Listing,
+            {
+                "food_type": food_type,
+                "total_lbs_food": total_lbs_food,
+                "refrigeration_requirements": refrigeration_requirements,
+                "expiration_date": expiration_date,
+            },
+            prefix="listing.",
+        )
+        query = {"listing.listing_id": listing_id}
+        projection = {"_id": 0, "listing": 1}
+        if not updates:
+            donation = Donation._get_collection().find_one(query, projection)
+            return Listing._from_son(donation["listing"]) if donation else None
+        # The pre-image is needed to invalidate the pages the listing leaves
+        donation = Donation._get_collection().find_one_and_update(
+            query, versioned({"$set": updates}), projection=projection
+        )
+        if not donation:
+            return None
+        previous = donation["listing"]
+        current = {
+            **previous,
+            **{path.partition(".")[2]: value for path, value in updates.items()},
+        }
+        invalidate_listings(previous, current)
+        return Listing._from_son(current)
     except ValidationError as e:
-        print(f"Validation error while updating listing: {e}")
-        raise
-    except Exception as ex:
-        print(f"Unexpected error while updating listing: {ex}")
+        logger.warning("Validation error while updating listing: %s", e)
         raise
 
 
 # DELETE /donations/listings/:listingId
 def delete_listing(listing_id):
-    try:
-        donation = Donation.objects(listing__listing_id=listing_id).first()
-        if not donation or not donation.listing:
-            return None
-        donation.listing = None
-        donation.save()
-        return {
-            "message": f"Listing with ID {listing_id} has been deleted successfully"
-        }
-    except Exception as ex:
-        print(f"Unexpected error while deleting listing {listing_id}: {ex}")
-        raise
+    donation = Donation._get_collection().find_one_and_update(
+        {"listing.listing_id": listing_id},
+        versioned({"$unset": {"listing": ""}}),
+        projection={"_id": 0, "listing": 1},
+    )
+    if not donation:
+        return None
+    invalidate_listings(donation["listing"])
+    return {"message": f"Listing with ID {listing_id} has been deleted successfully"}
 
 
 # GET /donations/listings/:listingId/forms
 def get_all_forms(listing_id):
-    donation = Donation.objects(listing__listing_id=listing_id).first()
-    if donation and donation.form:
-        return donation.form.to_mongo().to_dict()
-    return None
+    donation = Donation._get_collection().find_one(
+        {"listing.listing_id": listing_id}, {"_id": 0, "listing": 1, "form": 1}
+    )
+    if not donation or not donation.get("listing"):
+        return None
+    return donation.get("form") or {}
+
+
+# Builds the $set value of a pipeline update: user values are wrapped in
+# $literal so strings starting with "$" are never read as field paths
+def pipeline_values(document, references):
+    return {
+        key: references[key] if key in references else {"$literal": value}
+        for key, value in document.items()
+    }
+
+
+# The filter and pipeline update that set a new form and its receipt on a
+# listing's donation, with the validated form. donor_id and the form's
+# donation_id may be None, in which case they are taken from the listing's
+# donation document on the server.
+def form_update(donor_id, listing_id, form_data):
+    references = {}
+    if not form_data.get("donation_id"):
+        references["donation_id"] = "$donation_id"
+    if not donor_id:
+        references["donor_id"] = "$donor_id"
+    form = Form(
+        form_id=form_data.get("form_id"),
+        listing_id=listing_id,
+        donation_id=form_data.get("donation_id") or references.get("donation_id"),
+        donor_id=donor_id or references.get("donor_id"),
+        recipient_id=form_data.get("recipient_id"),
+        total_lbs_food=form_data.get("total_lbs_food"),
+        lbs_expired_food=form_data.get("lbs_expired_food"),
+        lbs_food_for_consumption=form_data.get("lbs_food_for_consumption"),
+        lbs_food_for_farms=form_data.get("lbs_food_for_farms"),
+        lbs_food_for_waste=form_data.get("lbs_food_for_waste"),
+    )
+    receipt = Receipt(
+        receipt_id=str(uuid.uuid4()),
+        listing_id=listing_id,
+        donation_id=form.donation_id,
+        donor_id=form.donor_id,
+        recipient_id=form.recipient_id,
+        date_issued=datetime.datetime.now(),
+        donation_amount_lbs=form.total_lbs_food,
+        donor_name=form_data.get("donor_name"),
+        recipient_name=form_data.get("recipient_name"),
+    )
+    form.validate()
+    receipt.validate()
+    query = {"listing.listing_id": listing_id}
+    if donor_id:
+        query["donor_id"] = donor_id
+    update = versioned(
+        [
+            {"$unset": ["form", "receipt"]},
+            {
+                "$set": {
+                    "form": pipeline_values(form.to_mongo(), references),
+                    "receipt": pipeline_values(receipt.to_mongo(), references),
+                }
+            },
+        ]
+    )
+    return query, update, form
 
 
 # POST /donations/listings/:listingId/forms
+# Sets the form and its receipt in one round trip
 def create_form(donor_id, listing_id, form_data):
     try:
-        form = Form(
-            form_id=form_data.get("form_id"),
-            listing_id=listing_id,
-            donation_id=form_data.get("donation_id"),
-            donor_id=donor_id,
-            recipient_id=form_data.get("recipient_id"),
-            total_lbs_food=form_data.get("total_lbs_food"),
-            lbs_expired_food=form_data.get("lbs_expired_food"),
-            lbs_food_for_consumption=form_data.get("lbs_food_for_consumption"),
-            lbs_food_for_farms=form_data.get("lbs_food_for_farms"),
-            lbs_food_for_waste=form_data.get("lbs_food_for_waste"),
+        query, update, _ = form_update(donor_id, listing_id, form_data)
+        donation = Donation._get_collection().find_one_and_update(
+            query,
+            update,
+            projection={"_id": 0, "listing": 1, "form": 1, "receipt": 1},
+            return_document=ReturnDocument.AFTER,
         )
-        donation = Donation.objects(
-            donor_id=donor_id, listing__listing_id=listing_id
-        ).first()
         if not donation:
             return None
-        donation.form = form
-        receipt = Receipt(
-            receipt_id=str(uuid.uuid4()),
-            listing_id=listing_id,
-            donation_id=donation.form.donation_id,
-            donor_id=donor_id,
-            recipient_id=form.recipient_id,
-            date_issued=datetime.datetime.now(),
-            donation_amount_lbs=form.total_lbs_food,
-            donor_name=form_data.get("donor_name"),
-            recipient_name=form_data.get("recipient_name"),
-        )
-        donation.receipt = receipt
-        donation.save()
-        return {"form": form, "receipt": receipt}
+        invalidate_listings(donation.get("listing"))
+        return {
+            "form": Form._from_son(donation["form"]),
+            "receipt": Receipt._from_son(donation["receipt"]),
+        }
     except ValidationError as e:
-        print(f"Validation error while creating form: {e}")
-        raise
-    except Exception as ex:
-        print(f"Unexpected error while creating form: {ex}")
+        logger.warning("Validation error while creating form: %s", e)
         raise
 
 
+# The receipt, if there is one, is re-issued with the form's total in the
+# same update
 def update_form(listing_id, form_id, update_data):
-    donation = Donation.objects(listing__listing_id=listing_id).first()
-    if not donation or not donation.form or donation.form.form_id != form_id:
+    updates = set_fields(
+        Form,
+        {
+            field: value
+            for field, value in update_data.items()
+            if field in Form._fields
+        },
+        prefix="form.",
+    )
+    receipt = {
+        "donation_amount_lbs": "$form.total_lbs_food",
+        "date_issued": {"$literal": datetime.datetime.now()},
+    }
+    pipeline = [{"$set": pipeline_values(updates, {})}] if updates else []
+    pipeline.append(
+        {
+            "$set": {
+                "receipt": {
+                    "$cond": [
+                        {"$gt": ["$receipt", None]},
+                        {"$mergeObjects": ["$receipt", receipt]},
+                        "$receipt",
+                    ]
+                }
+            }
+        }
+    )
+    donation = Donation._get_collection().find_one_and_update(
+        {"listing.listing_id": listing_id, "form.form_id": form_id},
+        versioned(pipeline),
+        projection={"_id": 0, "listing": 1, "form": 1, "receipt": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    if not donation:
         return None
-    form = donation.form
-    for field, value in update_data.items():
-        if hasattr(form, field) and value is not None:
-            setattr(form, field, value)
-    receipt = donation.receipt
-    if receipt:
-        receipt.donation_amount_lbs = form.total_lbs_food
-        receipt.date_issued = datetime.datetime.now()
-    donation.save()
-    return {"form": form, "receipt": receipt}
+    invalidate_listings(donation.get("listing"))
+    return {
+        "form": Form._from_son(donation["form"]),
+        "receipt": (
+            Receipt._from_son(donation["receipt"]) if donation.get("receipt") else None
+        ),
+    }
 
 
 def delete_form(listing_id):
-    donation = Donation.objects(listing__listing_id=listing_id).first()
-    if not donation or not donation.form:
+    donation = Donation._get_collection().find_one_and_update(
+        {"listing.listing_id": listing_id, "form": {"$ne": None}},
+        versioned({"$unset": {"form": ""}}),
+        projection={"_id": 0, "listing": 1, "form": 1},
+    )
+    if not donation:
         return None
-    form_data = donation.form.to_mongo().to_dict()
-    donation.form = None
-    donation.save()
-    return form_data
+    invalidate_listings(donation.get("listing"))
+    return donation["form"]
 
 
 # GET /donations/listings/:listingId/receipts
 def get_receipts(listing_id):
-    donation = Donation.objects(listing__listing_id=listing_id).first()
-    if donation and donation.receipt:
-        return donation.receipt
-    return None
+    donation = Donation._get_collection().find_one(
+        {"listing.listing_id": listing_id}, {"_id": 0, "receipt": 1}
+    )
+    return donation.get("receipt") if donation else None
 
 
 # POST /donations/listings/:listingId/receipts
@@ -222,82 +428,100 @@ def create_receipt(donor_id, listing_id, receipt_data):
             recipient_name=receipt_data.get("recipient_name"),
             recipient_id=receipt_data.get("recipient_id"),
         )
-        donation = Donation.objects(
-            donor_id=donor_id, listing__listing_id=listing_id
-        ).first()
+        receipt.validate()
+        donation = Donation._get_collection().find_one_and_update(
+            {"donor_id": donor_id, "listing.listing_id": listing_id},
+            versioned({"$set": {"receipt": receipt.to_mongo()}}),
+            projection={"_id": 0, "listing": 1},
+        )
         if not donation:
             return None
-        donation.receipt = receipt
-        donation.save()
+        invalidate_listings(donation.get("listing"))
         return receipt
     except ValidationError as e:
-        print(f"Validation error while creating receipt: {e}")
-        raise
-    except Exception as ex:
-        print(f"Unexpected error while creating receipt: {ex}")
+        logger.warning("Validation error while creating receipt: %s", e)
         raise
 
 
-# GET /donations/receipts
-def get_all_receipts(
-    page=1, pagesize=10, donor_id=None, recipient_id=None, sort_by=None
-):
-    query = {}
+# Sort keys accepted by GET /donations/receipts, mapped to document paths
+RECEIPT_SORT_FIELDS = {
+    "date_issued": "receipt.date_issued",
+    "donation_amount": "receipt.donation_amount_lbs",
+}
+
+
+# Builds the filter and the stable sort (ending in _id) for receipt queries
+def build_receipts_query(donor_id=None, recipient_id=None, sort_by=None):
+    query = {"receipt": {"$ne": None}}
     if donor_id:
         query["receipt.donor_id"] = donor_id
     if recipient_id:
         query["receipt.recipient_id"] = recipient_id
-    donations = Donation.objects(__raw__=query)
-    receipts = [
-        donation.receipt.to_mongo().to_dict()
-        for donation in donations
-        if donation.receipt
+    sort_field = RECEIPT_SORT_FIELDS.get(sort_by)
+    if sort_field:
+        sort = [(sort_field, -1), ("_id", -1)]
+    else:
+        sort = [("_id", 1)]
+    return query, sort
+
+
+# Builds the aggregation pipeline for GET /donations/receipts so filtering,
+# sorting and paging all happen inside MongoDB
+def build_receipts_pipeline(
+    page=1, pagesize=10, donor_id=None, recipient_id=None, sort_by=None, cursor=None
+):
+    query, sort = build_receipts_query(donor_id, recipient_id, sort_by)
+    if cursor is None:
+        return [
+            {"$match": query},
+            {"$sort": dict(sort)},
+            {"$skip": (max(page, 1) - 1) * pagesize},
+            {"$limit": pagesize},
+            {"$project": {"_id": 0, "receipt": 1}},
+            {"$replaceRoot": {"newRoot": "$receipt"}},
+        ]
+    return [
+        {"$match": apply_cursor(query, sort, cursor)},
+        {"$sort": dict(sort)},
+        {"$limit": pagesize + 1},
+        {"$project": {"receipt": 1}},
     ]
-    if sort_by == "date_issued":
-        receipts.sort(key=lambda x: x.date_issued, reverse=True)
-    elif sort_by == "donation_amount":
-        receipts.sort(key=lambda x: x.donation_amount_lbs, reverse=True)
-    start = (page - 1) * pagesize
-    end = start + pagesize
-    paginated_receipts = receipts[start:end]
-    return [receipt for receipt in paginated_receipts]
+
+
+# GET /donations/receipts
+def get_all_receipts(
+    page=1, pagesize=10, donor_id=None, recipient_id=None, sort_by=None, cursor=None
+):
+    pipeline = build_receipts_pipeline(
+        page, pagesize, donor_id, recipient_id, sort_by, cursor
+    )
+    donations = Donation._get_collection().aggregate(pipeline)
+    if cursor is None:
+        return list(donations)
+    _, sort = build_receipts_query(donor_id, recipient_id, sort_by)
+    return cursor_page(donations, sort, pagesize, lambda donation: donation["receipt"])
 
 
 # GET /donations/receipts/:receiptId
 def get_receipt_by_id(receipt_id):
-    donation = Donation.objects(receipt__receipt_id=receipt_id).first()
-    receipt = (
-        donation.receipt.to_mongo().to_dict() if donation and donation.receipt else None
+    donation = Donation._get_collection().find_one(
+        {"receipt.receipt_id": receipt_id}, {"_id": 0, "receipt": 1}
+    )
+    return donation.get("receipt") if donation else None
+
+
+# Version stamp of a donation, for the ETag of GET /donations/:donationId
+def get_donation_stamp(donation_id):
+    return Donation._get_collection().find_one(
+        {"donation_id": donation_id}, STAMP_PROJECTION
     )
-    return receipt
 
 
 # GET /donations/:donationId
-def get_donation_by_id(donation_id):
-    donation = Donation.objects(donation_id=donation_id).first()
-    return donation.to_mongo().to_dict() if donation else None
-
-
-def init_donations():
-    existing_donations = Donation.objects()
-    if existing_donations.count() == 0:
-        print("Initializing default donations...")
-        for donation_data in default_donations:
-            try:
-                print(f"Preparing donation: {donation_data['donation_id']}")
-                donation = Donation(
-                    donation_id=donation_data["donation_id"],
-                    donor_id=donation_data["donor_id"],
-                    listing=donation_data["listing"],
-                    form=donation_data["form"],
-                    receipt=donation_data["receipt"],
-                )
-                donation.save()
-                print(f"Donation {donation.donation_id} saved successfully.")
-            except Exception as e:
-                print(
-                    f"Error while saving donation {donation_data['donation_id']}: {e}"
-                )
-        print("Donations initialized successfully.")
-    else:
-        print("Donations already exist in the database. Initialization skipped.")
+def get_donation_by_id(donation_id, fields=None):
+    fields = parse_fields(fields, Donation)
+    if fields:
+        return Donation._get_collection().find_one(
+            {"donation_id": donation_id}, fields_projection(fields)
+        )
+    return Donation._get_collection().find_one({"donation_id": donation_id})
@@ -1,44 +1,131 @@
 import datetime
-from .default import default_donors
+import logging
+import math
 from models.Donor import *
 from mongoengine.errors import ValidationError
-
-
-# Helper function for pagination
-def paginate(queryset, page, pagesize):
-    start = (page - 1) * pagesize
-    return queryset.skip(start).limit(pagesize)
+from pymongo import ReturnDocument
+from services.BucketServices import (
+    append_entry,
+    find_entry,
+    is_bucketed,
+    iter_entries,
+    pull_entries,
+    update_entry,
+)
+from utils.EntityCache import entity_cache
+from utils.Fields import fields_projection, parse_fields, pick
+from utils.Pagination import apply_cursor
+from utils.ReadPlans import ReadPlan, run_plan
+from utils.Updates import STAMP_PROJECTION, find_and_set, set_fields, versioned
+from utils.Search import (
+    SEARCH_FIELDS,
+    SEARCH_PROJECTION,
+    email_filter,
+    name_filter,
+    relevance_plan,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+# Attempts made by optimistic read-modify-write updates before giving up
+UPDATE_RETRIES = 5
 
 
 # Get Donor by Email
 def get_donor_by_email(email):
     donor = None
     if email is not None:
-        donor = Donor.objects(email=email).first()
+        donor = Donor.objects(email=email).exclude(*SEARCH_FIELDS).first()
     return donor
 
 
-# GET /donors
-def get_all_donors(
-    page=1, pagesize=10, donor_id=None, name=None, email=None, sort_by=None
-):
+# Get Donor ID by Email, reading nothing but the id
+def get_donor_id_by_email(email):
+    if email is None:
+        return None
+
+    def load():
+        donor = Donor._get_collection().find_one(
+            {"email": email}, {"_id": 0, "donor_id": 1}
+        )
+        return donor["donor_id"] if donor else None
+
+    return entity_cache.get("donor-email", email, load)
+
+
+# Builds the filter and the stable sort (ending in _id) for donor queries
+def build_donors_query(donor_id=None, name=None, email=None, sort_by=None):
     query = {}
     if donor_id:
         query["donor_id"] = donor_id
-    if name:
-        query["$or"] = [
-            {"first_name": {"$regex": name, "$options": "i"}},
-            {"last_name": {"$regex": name, "$options": "i"}},
-        ]
+    if name_filter(name):
+        query.update(name_filter(name))
     if email:
-        query["email"] = {"$regex": email, "$options": "i"}
-    print(f"Constructed Query: {query}")
-    donors = Donor.objects(**query)
+        query.update(email_filter(email))
     if sort_by == "numberdonations":
-        donors = donors.order_by("-impact_log.total_donations")
-    donors = paginate(donors, page, pagesize)
-    print(f"Number of donors retrieved: {donors.count()}")
-    return [donor.to_mongo().to_dict() for donor in donors]
+        sort = [("impact_log.total_donations", -1), ("_id", -1)]
+    else:
+        sort = [("_id", 1)]
+    return query, sort
+
+
+# Plans GET /donors; `fields` is the raw fields= parameter and only those
+# paths (and the rating counters the average is derived from) are read
+def plan_donors(
+    page=1,
+    pagesize=10,
+    donor_id=None,
+    name=None,
+    email=None,
+    sort_by=None,
+    cursor=None,
+    fields=None,
+):
+    fields = parse_fields(fields, Donor, SEARCH_FIELDS)
+    read_fields = with_rating_counters(fields)
+    query, sort = build_donors_query(donor_id, name, email, sort_by)
+    logger.debug("Donor query: %s", query)
+    if name_filter(name) and not sort_by:
+        plan = relevance_plan(Donor, query, name, page, pagesize, cursor, read_fields)
+    elif cursor is None:
+        plan = ReadPlan(
+            Donor,
+            query,
+            fields_projection(read_fields) if fields else SEARCH_PROJECTION,
+            sort,
+            skip=(max(page, 1) - 1) * pagesize,
+            limit=pagesize,
+        )
+    elif not fields:
+        plan = ReadPlan(
+            Donor,
+            apply_cursor(query, sort, cursor),
+            SEARCH_PROJECTION,
+            sort,
+            limit=pagesize + 1,
+            page_sort=sort,
+            pagesize=pagesize,
+        )
+    else:
+        plan = ReadPlan(
+            Donor,
+            apply_cursor(query, sort, cursor),
+            fields_projection(read_fields, [path for path, _ in sort]),
+            sort,
+            limit=pagesize + 1,
+            page_sort=sort,
+            pagesize=pagesize,
+        )
+    item = plan.item
+    plan.item = lambda donor: donor_view(item(donor), fields)
+    return plan
+
+
+# GET /donors
+def get_all_donors(*args, **kwargs):
+    return run_plan(plan_donors(*args, **kwargs))
 
 
 # POST /donors
@@ -67,233 +154,469 @@ def create_donor(
             impact_log=ImpactLog(),
         )
         donor.save()
-        print(f"Donor created successfully: {donor}")
+        logger.info("Donor created: %s", donor.donor_id)
         return donor
     except ValidationError as e:
-        print(f"Validation error while creating donor: {e}")
-        raise
-    except Exception as ex:
-        print(f"Unexpected error while creating donor: {ex}")
+        logger.warning("Validation error while creating donor: %s", e)
         raise
 
 
+# The donor as GET /donors/:donorId returns it, through the entity cache
+def read_donor(donor_id):
+    return entity_cache.get(
+        "donor",
+        donor_id,
+        lambda: Donor._get_collection().find_one(
+            {"donor_id": donor_id}, SEARCH_PROJECTION
+        ),
+    )
+
+
+# Drops the cached donor after a write to its document
+def forget_donor(donor_id):
+    entity_cache.forget("donor", donor_id)
+
+
 # GET /donors/:donorId
-def get_donor(donor_id):
-    donor = Donor.objects(donor_id=donor_id).first()
-    return donor.to_mongo().to_dict() if donor else None
+# Paths into arrays are projected by MongoDB; anything else is picked from
+# the cached document
+def get_donor(donor_id, fields=None):
+    fields = parse_fields(fields, Donor, SEARCH_FIELDS)
+    if any("." in path for path in fields or ()):
+        donor = Donor._get_collection().find_one(
+            {"donor_id": donor_id}, fields_projection(with_rating_counters(fields))
+        )
+    else:
+        donor = read_donor(donor_id)
+        if donor is not None and fields:
+            donor = pick(donor, with_rating_counters(fields))
+    return donor_view(donor, fields)
+
+
+# Version stamp of a donor, for the ETag of GET /donors/:donorId. A
+# projection-only read, so a conditional GET neither loads nor caches the
+# full document.
+def get_donor_stamp(donor_id):
+    return Donor._get_collection().find_one({"donor_id": donor_id}, STAMP_PROJECTION)
 
 
 # PATCH /donors/:donorId
 def update_donor(donor_id, phone_number=None, address=None, company_association=None):
-    donor = Donor.objects(donor_id=donor_id).first()
-    if not donor:
-        return None
-    if phone_number:
-        donor.phone_number = phone_number
-    if address:
-        donor.address = Address(**address)
-    if company_association:
-        donor.company_association = company_association
-    donor.save()
-    return donor.to_mongo().to_dict()
+    updates = set_fields(
+        Donor,
+        {
+            "phone_number": phone_number or None,
+            "address": Address(**address) if address else None,
+            "company_association": company_association or None,
+        },
+    )
+    donor = find_and_set(
+        Donor._get_collection(), {"donor_id": donor_id}, updates, SEARCH_PROJECTION
+    )
+    if donor:
+        entity_cache.put("donor", donor_id, donor)
+    return donor_view(donor)
 
 
 # DELETE /donors/:donorId
 def delete_donor(donor_id):
-    donor = Donor.objects(donor_id=donor_id).first()
+    donor = Donor._get_collection().find_one_and_delete(
+        {"donor_id": donor_id}, projection={"_id": 0, "email": 1}
+    )
     if not donor:
         return None
-    donor.delete()
+    forget_donor(donor_id)
+    entity_cache.forget("donor-email", donor.get("email"))
     return {"message": f"Donor with ID {donor_id} has been deleted"}
 
 
-# GET /donors/:donorId/ratings
-def get_ratings(donor_id):
-    donor = Donor.objects(donor_id=donor_id).first()
+# Reads a single donation without loading the rest of the donor's history.
+# Returns (donor_found, donation) with the donation as a raw dict.
+def read_donor_donation(donor_id, donation_id):
+    collection = Donor._get_collection()
+    if is_bucketed():
+        donation = find_entry("donor", donor_id, "donations", donation_id)
+        if donation:
+            return True, donation
+        return bool(collection.find_one({"donor_id": donor_id}, {"_id": 1})), None
+    donor = collection.find_one(
+        {"donor_id": donor_id},
+        {"_id": 0, "donations": {"$elemMatch": {"donation_id": donation_id}}},
+    )
     if not donor:
+        return False, None
+    return True, (donor.get("donations") or [None])[0]
+
+
+def donation_not_found(donor_id, donation_id, found):
+    if not found:
         return {"error": f"Donor with ID {donor_id} not found"}
-    return donor.ratings.to_mongo().to_dict()
+    return {"error": f"Donation with ID {donation_id} not found for donor {donor_id}"}
 
 
-# POST /donors/:donorId/ratings
-def create_rating(donor_id, donation_id, stars, message=None):
-    donor = Donor.objects(donor_id=donor_id).first()
+# The filter and update of apply_rating_change for embedded donations
+def rating_update(donor_id, expected, rating, increments, pull=None):
+    if rating is None:
+        update = {"$unset": {"donations.$.rating": ""}}
+    else:
+        update = {"$set": {"donations.$.rating": rating}}
+    if increments:
+        update["$inc"] = increments
+    if pull:
+        update["$pull"] = {"ratings_details": pull}
+    query = {"donor_id": donor_id, "donations": {"$elemMatch": expected}}
+    return query, versioned(update)
+
+
+# Writes a donation's rating and moves the donor's rating counters in one
+# update. The donation must still match `expected`, which pins the rating
+# state the increments were computed from. Returns the donor's updated
+# counters, or None if nothing matched.
+def apply_rating_change(donor_id, expected, rating, increments, pull=None):
+    collection = Donor._get_collection()
+    if is_bucketed():
+        if not update_entry("donor", donor_id, "donations", expected, {"rating": rating}):
+            return None
+        if pull:
+            pull_entries("donor", donor_id, "ratings_details", pull)
+        donor = collection.find_one_and_update(
+            {"donor_id": donor_id},
+            versioned({"$inc": increments}),
+            projection={"_id": 0, "ratings": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        forget_donor(donor_id)
+        return donor
+    query, update = rating_update(donor_id, expected, rating, increments, pull)
+    donor = collection.find_one_and_update(
+        query,
+        update,
+        projection={"_id": 0, "ratings": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    if donor:
+        forget_donor(donor_id)
+    return donor
+
+
+# GET /donors/:donorId/ratings
+def get_ratings(donor_id):
+    donor = read_donor(donor_id)
     if not donor:
         return {"error": f"Donor with ID {donor_id} not found"}
-    donation = next((d for d in donor.donations if d.donation_id == donation_id), None)
-    if not donation:
-        return {
-            "error": f"Donation with ID {donation_id} not found for donor {donor_id}"
-        }
-    donation.rating = RatingDetails(
+    return ratings_summary(donor.get("ratings"))
+
+
+# A validated new rating, as stored on its donation
+def new_rating(donation_id, stars, message=None, date=None):
+    rating = RatingDetails(
         donation_id=donation_id,
         stars=stars,
         message=message,
-        date=datetime.datetime.now(),
+        date=date or datetime.datetime.now(),
+    )
+    rating.validate()
+    return rating.to_mongo().to_dict()
+
+
+# POST /donors/:donorId/ratings
+def create_rating(donor_id, donation_id, stars, message=None):
+    stored = new_rating(donation_id, stars, message)
+    donor = apply_rating_change(
+        donor_id,
+        {"donation_id": donation_id, "rating": None},
+        stored,
+        {"ratings.stars_sum": stored["stars"], "ratings.total_ratings": 1},
     )
-    donor.ratings.update_ratings(stars)
-    donor.save()
+    if not donor:
+        found, donation = read_donor_donation(donor_id, donation_id)
+        if not donation:
+            return donation_not_found(donor_id, donation_id, found)
+        return {"error": f"Donation with ID {donation_id} already has a rating"}
     return {
         "message": "Rating created successfully",
-        "ratings": donor.ratings.to_mongo().to_dict(),
+        "ratings": ratings_summary(donor.get("ratings")),
     }
 
 
 # PATCH /donors/:donorId/ratings/:donationId
 def update_rating(donor_id, donation_id, stars=None, message=None):
-    donor = Donor.objects(donor_id=donor_id).first()
-    if not donor:
-        return {"error": f"Donor with ID {donor_id} not found"}
-    donation = next((d for d in donor.donations if d.donation_id == donation_id), None)
-    if not donation:
-        return {
-            "error": f"Donation with ID {donation_id} not found for donor {donor_id}"
-        }
-    if donation.rating:
-        previous_stars = donation.rating.stars
+    for _ in range(UPDATE_RETRIES):
+        found, donation = read_donor_donation(donor_id, donation_id)
+        if not donation:
+            return donation_not_found(donor_id, donation_id, found)
+        previous = donation.get("rating")
+        if not previous:
+            return {"error": f"No existing rating for donation ID {donation_id}"}
+        rating = RatingDetails._from_son(previous)
         if stars is not None:
-            donation.rating.stars = stars
-            donor.ratings.stars = (
-                (donor.ratings.stars * donor.ratings.total_ratings)
-                - previous_stars
-                + stars
-            ) / donor.ratings.total_ratings
+            rating.stars = stars
         if message is not None:
-            donation.rating.message = message
-        donation.rating.date = datetime.datetime.now()
-    else:
-        return {"error": f"No existing rating for donation ID {donation_id}"}
-    donor.save()
-    return {
-        "message": "Rating updated successfully",
-        "ratings": donor.ratings.to_mongo().to_dict(),
-        "updated_rating": donation.rating.to_mongo().to_dict(),
-    }
+            rating.message = message
+        rating.date = datetime.datetime.now()
+        rating.validate()
+        stored = rating.to_mongo().to_dict()
+        delta = stored["stars"] - previous["stars"]
+        donor = apply_rating_change(
+            donor_id,
+            {
+                "donation_id": donation_id,
+                "rating.stars": previous["stars"],
+                "rating.date": previous.get("date"),
+            },
+            stored,
+            {"ratings.stars_sum": delta} if delta else {},
+        )
+        if donor:
+            return {
+                "message": "Rating updated successfully",
+                "ratings": ratings_summary(donor.get("ratings")),
+                "updated_rating": stored,
+            }
+    return {"error": f"Rating for donation ID {donation_id} is being modified concurrently"}
 
 
 # DELETE /donors/:donorId/ratings/:donationId
 def delete_rating(donor_id, donation_id):
-    donor = Donor.objects(donor_id=donor_id).first()
-    if not donor:
-        return {"error": f"Donor with ID {donor_id} not found"}
-    donation = next((d for d in donor.donations if d.donation_id == donation_id), None)
-    if not donation:
-        return {
-            "error": f"Donation with ID {donation_id} not found for donor {donor_id}"
-        }
-    if donation.rating:
-        previous_stars = donation.rating.stars
-        donation.rating = None
-        if donor.ratings.total_ratings > 1:
-            donor.ratings.stars = (
-                (donor.ratings.stars * donor.ratings.total_ratings) - previous_stars
-            ) / (donor.ratings.total_ratings - 1)
-        else:
-            donor.ratings.stars = 0.0
-        donor.ratings.total_ratings -= 1
-        donor.ratings_details = [
-            rating
-            for rating in donor.ratings_details
-            if rating.date != donation.rating.date
-        ]
-    else:
-        return {"error": f"No existing rating for donation ID {donation_id}"}
-    donor.save()
-    return {
-        "message": "Rating deleted successfully",
-        "ratings": donor.ratings.to_mongo().to_dict(),
-    }
+    for _ in range(UPDATE_RETRIES):
+        found, donation = read_donor_donation(donor_id, donation_id)
+        if not donation:
+            return donation_not_found(donor_id, donation_id, found)
+        previous = donation.get("rating")
+        if not previous:
+            return {"error": f"No existing rating for donation ID {donation_id}"}
+        donor = apply_rating_change(
+            donor_id,
+            {
+                "donation_id": donation_id,
+                "rating.stars": previous["stars"],
+                "rating.date": previous.get("date"),
+            },
+            None,
+            {"ratings.stars_sum": -previous["stars"], "ratings.total_ratings": -1},
+            pull={"date": previous.get("date")},
+        )
+        if donor:
+            return {
+                "message": "Rating deleted successfully",
+                "ratings": ratings_summary(donor.get("ratings")),
+            }
+    return {"error": f"Rating for donation ID {donation_id} is being modified concurrently"}
 
 
 # GET /donors/:donorId/impactlog
 def get_donor_impact_logs(donor_id):
-    donor = Donor.objects(donor_id=donor_id).first()
+    donor = Donor._get_collection().find_one(
+        {"donor_id": donor_id}, {"_id": 0, "impact_log": 1}
+    )
     if not donor:
         return None
-    return donor.impact_log.to_mongo().to_dict()
+    return donor.get("impact_log") or ImpactLog().to_mongo().to_dict()
+
+
+# A validated new donation, as stored in a donor's impact log
+def new_impact_log_entry(donation_data):
+    donation = Donation(**donation_data)
+    donation.validate()
+    return donation.to_mongo().to_dict()
+
+
+# The filter and update that add `entry` to a donor's embedded donations
+# and impact log
+def impact_log_update(donor_id, entry):
+    update = {"$push": {"donations": entry}, "$inc": impact_log_increments(entry)}
+    return {"donor_id": donor_id}, versioned(update)
 
 
 # POST /donors/:donorId/impactlog
 def add_donor_impact_log(donor_id, donation_data):
-    donor = Donor.objects(donor_id=donor_id).first()
-    if not donor:
+    entry = new_impact_log_entry(donation_data)
+    collection = Donor._get_collection()
+    if is_bucketed():
+        result = collection.update_one(
+            {"donor_id": donor_id}, versioned({"$inc": impact_log_increments(entry)})
+        )
+        if not result.matched_count:
+            return None
+        forget_donor(donor_id)
+        return append_entry("donor", donor_id, "donations", entry)
+    result = collection.update_one(*impact_log_update(donor_id, entry))
+    if not result.matched_count:
         return None
-    donation = Donation(**donation_data)
-    donor.donations.append(donation)
-    donor.impact_log.calculate_totals(donor.donations)
-    donor.save()
-    return donation.to_mongo().to_dict()
+    forget_donor(donor_id)
+    return entry
 
 
 # GET /donors/:donorId/impactlog/:donationId
 def get_donor_impact_log_donation(donor_id, donation_id):
-    donor = Donor.objects(donor_id=donor_id).first()
-    if not donor:
-        return {"error": f"Donor with ID {donor_id} not found"}
-    donation = next((d for d in donor.donations if d.donation_id == donation_id), None)
+    found, donation = read_donor_donation(donor_id, donation_id)
     if not donation:
-        return {
-            "error": f"Donation with ID {donation_id} not found for donor {donor_id}"
-        }
-    return donation.to_mongo().to_dict()
+        return donation_not_found(donor_id, donation_id, found)
+    return donation
 
 
 # PATCH /donors/:donorId/impactlog/:donationId
 def update_donor_impact_log_donation(donor_id, donation_id, update_data):
-    donor = Donor.objects(donor_id=donor_id).first()
-    if not donor:
-        return {"error": f"Donor with ID {donor_id} not found"}
-    donation = next(
-        (d for d in donor.donations if str(d.donation_id) == str(donation_id)), None
-    )
-    if not donation:
-        return {
-            "error": f"Donation with ID {donation_id} not found for donor {donor_id}"
-        }
-    for key, value in update_data.items():
-        if hasattr(donation, key):
+    for key in update_data:
+        if key not in Donation._fields:
+            return {"error": f"Invalid field '{key}' for donation"}
+    collection = Donor._get_collection()
+    # The write only applies if the tracked fields still hold the values the
+    # delta was computed from; otherwise re-read and retry
+    for _ in range(UPDATE_RETRIES):
+        found, previous = read_donor_donation(donor_id, donation_id)
+        if not previous:
+            return donation_not_found(donor_id, donation_id, found)
+        donation = Donation._from_son(previous)
+        for key, value in update_data.items():
             setattr(donation, key, value)
+        donation.validate()
+        current = donation.to_mongo().to_dict()
+        update = {
+            "$set": {f"donations.$.{key}": current.get(key) for key in update_data}
+        }
+        increments = impact_log_increments(current, previous)
+        if increments:
+            update["$inc"] = increments
+        expected = {"donation_id": donation_id}
+        expected.update({field: previous.get(field) for field in IMPACT_LOG_TOTALS})
+        if is_bucketed():
+            fields = {key: current.get(key) for key in update_data}
+            if not update_entry("donor", donor_id, "donations", expected, fields):
+                continue
+            collection.update_one(
+                {"donor_id": donor_id}, versioned({"$inc": increments})
+            )
+            forget_donor(donor_id)
+            return {
+                "message": "Donation updated successfully",
+                "donation": current,
+            }
+        result = collection.update_one(
+            {"donor_id": donor_id, "donations": {"$elemMatch": expected}},
+            versioned(update),
+        )
+        if result.matched_count:
+            forget_donor(donor_id)
+            return {
+                "message": "Donation updated successfully",
+                "donation": current,
+            }
+    return {"error": f"Donation with ID {donation_id} is being modified concurrently"}
+
+
+# Recomputes every donor's impact log from its donations and reports the
+# totals that differ from the stored counters; with fix=True the stored
+# counters are overwritten unless the donor changed since it was read
+def reconcile_donor_impact_logs(fix=False):
+    mismatches = []
+    collection = Donor._get_collection()
+    projection = {"donor_id": 1, "impact_log": 1, "donations": 1}
+    for donor in collection.find({}, projection):
+        donor_id = donor["donor_id"]
+        if is_bucketed():
+            donations = iter_entries("donor", donor_id, "donations")
         else:
-            return {"error": f"Invalid field '{key}' for donation"}
-    donation.donation_id = str(donation.donation_id)
-    donor.impact_log.calculate_totals(donor.donations)
-    print(f"Donor before save: {donor.to_mongo().to_dict()}")
-    donor.save()
-    return {
-        "message": "Donation updated successfully",
-        "donation": donation.to_mongo().to_dict(),
-    }
-
-
-# Initialize default donors
-def init_donors():
-    existing_donors = Donor.objects()
-    if existing_donors.count() == 0:
-        print("Initializing default donors...")
-        for donor_data in default_donors:
-            try:
-                print(
-                    f"Preparing donor: {donor_data['first_name']} {donor_data['last_name']}"
-                )
-                donor = Donor(
-                    donor_id=donor_data["donor_id"],
-                    first_name=donor_data["first_name"],
-                    last_name=donor_data["last_name"],
-                    email=donor_data["email"],
-                    phone_number=donor_data["phone_number"],
-                    address=donor_data["address"],
-                    tax_id=donor_data["tax_id"],
-                    company_association=donor_data["company_association"],
-                    donations=donor_data["donations"],
-                    impact_log=donor_data["impact_log"],
-                    ratings=donor_data["ratings"],
-                )
-                donor.save()
-                print(f"Donor {donor.first_name} {donor.last_name} saved successfully.")
-            except Exception as e:
-                print(
-                    f"Error while saving donor {donor_data['first_name']} {donor_data['last_name']}: {e}"
-                )
-        print("Default donors have been initialized.")
-    else:
-        print("Donors already exist in the database. Initialization skipped.")
+            donations = donor.get("donations") or []
+        stored = donor.get("impact_log") or {}
+        differences = {
+            field: (stored.get(field), value)
+            for field, value in impact_log_totals(donations).items()
+            if not math.isclose(stored.get(field) or 0, value, abs_tol=1e-6)
+        }
+        if not differences:
+            continue
+        fixed = False
+        if fix:
+            result = collection.update_one(
+                {
+                    "donor_id": donor_id,
+                    **{f"impact_log.{field}": value for field, value in stored.items()},
+                },
+                versioned(
+                    {
+                        "$set": {
+                            f"impact_log.{field}": value
+                            for field, (_, value) in differences.items()
+                        }
+                    }
+                ),
+            )
+            fixed = bool(result.modified_count)
+            forget_donor(donor_id)
+        mismatches.append(
+            {"donor_id": donor_id, "differences": differences, "fixed": fixed}
+        )
+    return mismatches
+
+
+# Recomputes every donor's rating counters from the ratings on its donations
+# and reports the ones that differ; with fix=True they are overwritten unless
+# the donor's counters changed since they were read
+def reconcile_donor_ratings(fix=False):
+    mismatches = []
+    collection = Donor._get_collection()
+    for donor in collection.find({}, {"donor_id": 1, "ratings": 1, "donations.rating": 1}):
+        if is_bucketed():
+            donations = iter_entries("donor", donor["donor_id"], "donations")
+        else:
+            donations = donor.get("donations") or []
+        stars = [d["rating"]["stars"] for d in donations if d.get("rating")]
+        expected = {"stars_sum": sum(stars), "total_ratings": len(stars)}
+        stored = donor.get("ratings") or {}
+        differences = {
+            field: (stored.get(field), value)
+            for field, value in expected.items()
+            if stored.get(field) != value
+        }
+        if not differences:
+            continue
+        fixed = False
+        if fix:
+            result = collection.update_one(
+                {
+                    "donor_id": donor["donor_id"],
+                    **{f"ratings.{field}": stored.get(field) for field in expected},
+                },
+                versioned(
+                    {
+                        "$set": {
+                            f"ratings.{field}": value
+                            for field, value in expected.items()
+                        }
+                    }
+                ),
+            )
+            fixed = bool(result.modified_count)
+            forget_donor(donor["donor_id"])
+        mismatches.append(
+            {"donor_id": donor["donor_id"], "differences": differences, "fixed": fixed}
+        )
+    return mismatches
+
+
+# Sets the rating counters of donors written before they existed, from the
+# ratings on their donations. Donors that already have them are left alone,
+# so it is safe to run on every deploy. Returns the number of donors changed.
+def backfill_rating_counters():
+    changed = 0
+    collection = Donor._get_collection()
+    missing = {"ratings.stars_sum": {"$exists": False}}
+    projection = {"donor_id": 1, "ratings": 1, "donations.rating": 1}
+    for donor in collection.find(missing, projection):
+        if is_bucketed():
+            donations = iter_entries("donor", donor["donor_id"], "donations")
+        else:
+            donations = donor.get("donations") or []
+        stars = [d["rating"]["stars"] for d in donations if d.get("rating")]
+        counters = {"stars_sum": sum(stars), "total_ratings": len(stars)}
+        if isinstance(donor.get("ratings"), dict):
+            update = {f"ratings.{field}": value for field, value in counters.items()}
+        else:
+            update = {"ratings": counters}
+        result = collection.update_one(
+            {"_id": donor["_id"], **missing}, versioned({"$set": update})
+        )
+        changed += result.modified_count
+        forget_donor(donor["donor_id"])
+    return changed
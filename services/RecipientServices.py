@@ -1,50 +1,141 @@
 import datetime
-from .default import default_recipients
+import logging
+import math
 from models.Recipient import *
 from mongoengine.errors import ValidationError
-
-
-# Helper function for pagination
-def paginate(queryset, page, pagesize):
-    return queryset.skip((page - 1) * pagesize).limit(pagesize)
+from services.BucketServices import (
+    append_entry,
+    find_entry,
+    is_bucketed,
+    iter_entries,
+    page_embedded,
+    page_entries,
+    update_entry,
+)
+from utils.EntityCache import entity_cache
+from utils.Fields import fields_projection, parse_fields, pick
+from utils.Pagination import apply_cursor
+from utils.ReadPlans import ReadPlan, run_plan
+from utils.Updates import STAMP_PROJECTION, find_and_set, set_fields, versioned
+from utils.Search import (
+    SEARCH_FIELDS,
+    SEARCH_PROJECTION,
+    email_filter,
+    name_filter,
+    relevance_plan,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+# Attempts made by optimistic read-modify-write updates before giving up
+UPDATE_RETRIES = 5
 
 
 # Get Recipient by Email
 def get_recipient_by_email(email):
     recipient = None
     if email is not None:
-        recipient = Recipient.objects(email=email).first()
+        recipient = Recipient.objects(email=email).exclude(*SEARCH_FIELDS).first()
     return recipient
 
 
-# GET /recipients
-def get_all_recipients(
-    page=1,
-    pagesize=10,
+# Get Recipient ID by Email, reading nothing but the id
+def get_recipient_id_by_email(email):
+    if email is None:
+        return None
+
+    def load():
+        recipient = Recipient._get_collection().find_one(
+            {"email": email}, {"_id": 0, "recipient_id": 1}
+        )
+        return recipient["recipient_id"] if recipient else None
+
+    return entity_cache.get("recipient-email", email, load)
+
+
+# Builds the filter and the stable sort (ending in _id) for recipient queries
+def build_recipients_query(
     recipient_id=None,
     name=None,
     tax_status=None,
     compliance_status=None,
     sort_by=None,
+    email=None,
 ):
     query = {}
     if recipient_id:
         query["recipient_id"] = recipient_id
-    if name:
-        query["$or"] = [
-            {"first_name": {"$regex": name, "$options": "i"}},
-            {"last_name": {"$regex": name, "$options": "i"}},
-            {"organization_name": {"$regex": name, "$options": "i"}},
-        ]
+    if name_filter(name):
+        query.update(name_filter(name))
+    if email:
+        query.update(email_filter(email))
     if tax_status:
         query["tax_status.status"] = tax_status
     if compliance_status:
         query["compliance_status.status"] = compliance_status
-    recipients = Recipient.objects(**query)
     if sort_by == "numberdonations":
-        recipients = recipients.order_by("-donation_log.total_donations_received")
-    recipients = paginate(recipients, page, pagesize)
-    return [recipient.to_mongo().to_dict() for recipient in recipients]
+        sort = [("donation_log.total_donations", -1), ("_id", -1)]
+    else:
+        sort = [("_id", 1)]
+    return query, sort
+
+
+# Plans GET /recipients; `fields` is the raw fields= parameter and only those
+# paths are read
+def plan_recipients(
+    page=1,
+    pagesize=10,
+    recipient_id=None,
+    name=None,
+    tax_status=None,
+    compliance_status=None,
+    sort_by=None,
+    cursor=None,
+    email=None,
+    fields=None,
+):
+    fields = parse_fields(fields, Recipient, SEARCH_FIELDS)
+    query, sort = build_recipients_query(
+        recipient_id, name, tax_status, compliance_status, sort_by, email
+    )
+    if name_filter(name) and not sort_by:
+        return relevance_plan(Recipient, query, name, page, pagesize, cursor, fields)
+    if cursor is None:
+        return ReadPlan(
+            Recipient,
+            query,
+            fields_projection(fields) if fields else SEARCH_PROJECTION,
+            sort,
+            skip=(max(page, 1) - 1) * pagesize,
+            limit=pagesize,
+        )
+    if not fields:
+        return ReadPlan(
+            Recipient,
+            apply_cursor(query, sort, cursor),
+            SEARCH_PROJECTION,
+            sort,
+            limit=pagesize + 1,
+            page_sort=sort,
+            pagesize=pagesize,
+        )
+    return ReadPlan(
+        Recipient,
+        apply_cursor(query, sort, cursor),
+        fields_projection(fields, [path for path, _ in sort]),
+        sort,
+        limit=pagesize + 1,
+        page_sort=sort,
+        pagesize=pagesize,
+        item=lambda recipient: pick(recipient, fields),
+    )
+
+
+# GET /recipients
+def get_all_recipients(*args, **kwargs):
+    return run_plan(plan_recipients(*args, **kwargs))
 
 
 # POST /recipients
@@ -82,20 +173,52 @@ def create_recipient(
             donation_log=DonationLog(),
         )
         recipient.save()
-        print(f"Recipient created successfully: {recipient}")
+        logger.info("Recipient created: %s", recipient.recipient_id)
         return recipient
     except ValidationError as e:
-        print(f"Validation error while creating recipient: {e}")
-        raise
-    except Exception as ex:
-        print(f"Unexpected error while creating recipient: {ex}")
+        logger.warning("Validation error while creating recipient: %s", e)
         raise
 
 
+# The recipient as GET /recipients/:recipientId returns it, through the
+# entity cache
+def read_recipient(recipient_id):
+    return entity_cache.get(
+        "recipient",
+        recipient_id,
+        lambda: Recipient._get_collection().find_one(
+            {"recipient_id": recipient_id}, SEARCH_PROJECTION
+        ),
+    )
+
+
+# Drops the cached recipient after a write to its document
+def forget_recipient(recipient_id):
+    entity_cache.forget("recipient", recipient_id)
+
+
 # GET /recipients/:recipientId
-def get_recipient(recipient_id):
-    recipient = Recipient.objects(recipient_id=recipient_id).first()
-    return recipient.to_mongo().to_dict() if recipient else None
+# Paths into arrays are projected by MongoDB; anything else is picked from
+# the cached document
+def get_recipient(recipient_id, fields=None):
+    fields = parse_fields(fields, Recipient, SEARCH_FIELDS)
+    if any("." in path for path in fields or ()):
+        return Recipient._get_collection().find_one(
+            {"recipient_id": recipient_id}, fields_projection(fields)
+        )
+    recipient = read_recipient(recipient_id)
+    if recipient is None or not fields:
+        return recipient
+    return pick(recipient, fields)
+
+
+# Version stamp of a recipient, for the ETag of GET /recipients/:recipientId.
+# A projection-only read, so a conditional GET neither loads nor caches the
+# full document.
+def get_recipient_stamp(recipient_id):
+    return Recipient._get_collection().find_one(
+        {"recipient_id": recipient_id}, STAMP_PROJECTION
+    )
 
 
 # PATCH /recipients/:recipientId
@@ -106,150 +229,266 @@ def update_recipient(
     tax_status=None,
     compliance_status=None,
 ):
-    recipient = Recipient.objects(recipient_id=recipient_id).first()
-    if not recipient:
-        return None
-    if phone_number:
-        recipient.phone_number = phone_number
-    if address:
-        recipient.address = Address(**address)
+    now = datetime.datetime.now()
+    updates = set_fields(
+        Recipient,
+        {
+            "phone_number": phone_number or None,
+            "address": Address(**address) if address else None,
+        },
+    )
     if tax_status:
-        recipient.tax_status.status = tax_status
-        recipient.tax_status.verification_date = datetime.datetime.now()
+        updates.update(
+            set_fields(
+                TaxStatus,
+                {"status": tax_status, "verification_date": now},
+                prefix="tax_status.",
+            )
+        )
     if compliance_status:
-        recipient.compliance_status.status = compliance_status
-        recipient.compliance_status.verification_date = datetime.datetime.now()
-    recipient.save()
-    return recipient.to_mongo().to_dict()
+        updates.update(
+            set_fields(
+                ComplianceStatus,
+                {"status": compliance_status, "verification_date": now},
+                prefix="compliance_status.",
+            )
+        )
+    recipient = find_and_set(
+        Recipient._get_collection(),
+        {"recipient_id": recipient_id},
+        updates,
+        SEARCH_PROJECTION,
+    )
+    if recipient:
+        entity_cache.put("recipient", recipient_id, recipient)
+    return recipient
 
 
 # DELETE /recipients/:recipientId
 def delete_recipient(recipient_id):
-    recipient = Recipient.objects(recipient_id=recipient_id).first()
+    recipient = Recipient._get_collection().find_one_and_delete(
+        {"recipient_id": recipient_id}, projection={"_id": 0, "email": 1}
+    )
     if not recipient:
         return None
-    recipient.delete()
+    forget_recipient(recipient_id)
+    entity_cache.forget("recipient-email", recipient.get("email"))
     return {"message": f"Recipient with ID {recipient_id} has been deleted"}
 
 
 # GET /recipients/:recipientId/donationlog
-def get_recipient_donation_logs(recipient_id):
-    recipient = Recipient.objects(recipient_id=recipient_id).first()
-    if not recipient:
-        return None
-    return [donation.to_mongo().to_dict() for donation in recipient.donations]
+# Oldest first, one page of `pagesize` entries; the whole log is never
+# returned at once. `since` ("YYYY-MM-DD") keeps donations dated on or after it
+def get_recipient_donation_logs(recipient_id, page=1, pagesize=10, since=None):
+    if since:
+        since = datetime.datetime.strptime(since, "%Y-%m-%d")
+    skip = (max(page, 1) - 1) * pagesize
+    if is_bucketed():
+        recipient = Recipient._get_collection().find_one(
+            {"recipient_id": recipient_id}, {"_id": 1}
+        )
+        if not recipient:
+            return None
+        return page_entries(
+            "recipient", recipient_id, "donations", skip, pagesize, since or None
+        )
+    return page_embedded(
+        Recipient._get_collection(),
+        {"recipient_id": recipient_id},
+        "donations",
+        skip,
+        pagesize,
+        since or None,
+    )
 
 
 # POST /recipients/:recipientId/donationlog
 def add_recipient_donation_log(recipient_id, donation_data):
-    recipient = Recipient.objects(recipient_id=recipient_id).first()
-    if not recipient:
-        return None
     donation = Donation(**donation_data)
-    recipient.donations.append(donation)
-    recipient.donation_log.calculate_totals(recipient.donations)
-    recipient.save()
-    return donation.to_mongo().to_dict()
+    donation.validate()
+    entry = donation.to_mongo().to_dict()
+    collection = Recipient._get_collection()
+    if is_bucketed():
+        result = collection.update_one(
+            {"recipient_id": recipient_id},
+            versioned({"$inc": donation_log_increments(entry)}),
+        )
+        if not result.matched_count:
+            return None
+        forget_recipient(recipient_id)
+        return append_entry("recipient", recipient_id, "donations", entry)
+    result = collection.update_one(
+        {"recipient_id": recipient_id},
+        versioned(
+            {"$push": {"donations": entry}, "$inc": donation_log_increments(entry)}
+        ),
+    )
+    if not result.matched_count:
+        return None
+    forget_recipient(recipient_id)
+    return entry
 
 
 # GET /recipients/:recipientId/donationlog/:donationId
 def get_recipient_donation_log(recipient_id, donation_id):
-    recipient = Recipient.objects(recipient_id=recipient_id).first()
-    if not recipient:
-        return None
-    donation = next(
-        (d for d in recipient.donations if d.donation_id == donation_id), None
+    if is_bucketed():
+        return find_entry("recipient", recipient_id, "donations", donation_id)
+    recipient = Recipient._get_collection().find_one(
+        {"recipient_id": recipient_id},
+        {"_id": 0, "donations": {"$elemMatch": {"donation_id": donation_id}}},
     )
-    return donation.to_mongo().to_dict() if donation else None
+    return ((recipient or {}).get("donations") or [None])[0]
 
 
 # PATCH /recipients/:recipientId/donationlog/:donationId
 def update_recipient_donation_log(recipient_id, donation_id, update_data):
-    recipient = Recipient.objects(recipient_id=recipient_id).first()
-    if not recipient:
-        return None
-    donation = next(
-        (d for d in recipient.donations if d.donation_id == donation_id), None
-    )
-    if not donation:
-        return None
-    for key, value in update_data.items():
-        setattr(donation, key, value)
-    recipient.donation_log.calculate_totals(recipient.donations)
-    recipient.save()
-    return donation.to_mongo().to_dict()
+    collection = Recipient._get_collection()
+    # The write only applies if the tracked fields still hold the values the
+    # delta was computed from; otherwise re-read and retry
+    for _ in range(UPDATE_RETRIES):
+        if is_bucketed():
+            previous = find_entry("recipient", recipient_id, "donations", donation_id)
+        else:
+            recipient = collection.find_one(
+                {"recipient_id": recipient_id},
+                {"_id": 0, "donations": {"$elemMatch": {"donation_id": donation_id}}},
+            )
+            previous = ((recipient or {}).get("donations") or [None])[0]
+        if not previous:
+            return None
+        donation = Donation._from_son(previous)
+        for key, value in update_data.items():
+            setattr(donation, key, value)
+        donation.validate()
+        current = donation.to_mongo().to_dict()
+        update = {
+            "$set": {f"donations.$.{key}": current.get(key) for key in update_data}
+        }
+        increments = donation_log_increments(current, previous)
+        if increments:
+            update["$inc"] = increments
+        expected = {"donation_id": donation_id}
+        expected.update(
+            {field: previous.get(field) for field in DONATION_LOG_TOTALS}
+        )
+        if is_bucketed():
+            fields = {key: current.get(key) for key in update_data}
+            if not update_entry("recipient", recipient_id, "donations", expected, fields):
+                continue
+            collection.update_one(
+                {"recipient_id": recipient_id}, versioned({"$inc": increments})
+            )
+            forget_recipient(recipient_id)
+            return current
+        result = collection.update_one(
+            {"recipient_id": recipient_id, "donations": {"$elemMatch": expected}},
+            versioned(update),
+        )
+        if result.matched_count:
+            forget_recipient(recipient_id)
+            return current
+    return None
+
+
+# Recomputes every recipient's donation log from its donations and reports
+# the totals that differ from the stored counters; with fix=True the stored
+# counters are overwritten unless the recipient changed since it was read
+def reconcile_recipient_donation_logs(fix=False):
+    mismatches = []
+    collection = Recipient._get_collection()
+    projection = {"recipient_id": 1, "donation_log": 1, "donations": 1}
+    for recipient in collection.find({}, projection):
+        recipient_id = recipient["recipient_id"]
+        if is_bucketed():
+            donations = iter_entries("recipient", recipient_id, "donations")
+        else:
+            donations = recipient.get("donations") or []
+        stored = recipient.get("donation_log") or {}
+        differences = {
+            field: (stored.get(field), value)
+            for field, value in donation_log_totals(donations).items()
+            if not math.isclose(stored.get(field) or 0, value, abs_tol=1e-6)
+        }
+        if not differences:
+            continue
+        fixed = False
+        if fix:
+            result = collection.update_one(
+                {
+                    "recipient_id": recipient_id,
+                    **{
+                        f"donation_log.{field}": value
+                        for field, value in stored.items()
+                    },
+                },
+                versioned(
+                    {
+                        "$set": {
+                            f"donation_log.{field}": value
+                            for field, (_, value) in differences.items()
+                        }
+                    }
+                ),
+            )
+            fixed = bool(result.modified_count)
+            forget_recipient(recipient_id)
+        mismatches.append(
+            {
+                "recipient_id": recipient_id,
+                "differences": differences,
+                "fixed": fixed,
+            }
+        )
+    return mismatches
 
 
 # GET /recipients/:recipientId/taxexempt
 def get_recipient_tax_status(recipient_id):
-    recipient = Recipient.objects(recipient_id=recipient_id).first()
+    recipient = read_recipient(recipient_id)
     if not recipient:
         return None
-    return recipient.tax_status.to_mongo().to_dict()
+    return recipient.get("tax_status")
 
 
 # PATCH /recipients/:recipientId/taxexempt
 def update_recipient_tax_status(recipient_id, status, verification_date):
-    recipient = Recipient.objects(recipient_id=recipient_id).first()
+    recipient = find_and_set(
+        Recipient._get_collection(),
+        {"recipient_id": recipient_id},
+        set_fields(
+            TaxStatus,
+            {"status": status, "verification_date": verification_date},
+            prefix="tax_status.",
+        ),
+        {"_id": 0, "tax_status": 1},
+    )
     if not recipient:
         return None
-    recipient.tax_status.status = status
-    recipient.tax_status.verification_date = verification_date
-    recipient.save()
-    return recipient.tax_status.to_mongo().to_dict()
+    forget_recipient(recipient_id)
+    return recipient["tax_status"]
 
 
 # GET /recipients/:recipientId/compliance
 def get_recipient_compliance_status(recipient_id):
-    recipient = Recipient.objects(recipient_id=recipient_id).first()
+    recipient = read_recipient(recipient_id)
     if not recipient:
         return None
-    return recipient.compliance_status.to_mongo().to_dict()
+    return recipient.get("compliance_status")
 
 
 # PATCH /recipients/:recipientId/compliance
 def update_recipient_compliance_status(recipient_id, status, verification_date):
-    recipient = Recipient.objects(recipient_id=recipient_id).first()
+    recipient = find_and_set(
+        Recipient._get_collection(),
+        {"recipient_id": recipient_id},
+        set_fields(
+            ComplianceStatus,
+            {"status": status, "verification_date": verification_date},
+            prefix="compliance_status.",
+        ),
+        {"_id": 0, "compliance_status": 1},
+    )
     if not recipient:
         return None
-    recipient.compliance_status.status = status
-    recipient.compliance_status.verification_date = verification_date
-    recipient.save()
-    return recipient.compliance_status.to_mongo().to_dict()
-
-
-# Initialize recipients
-def init_recipients():
-    existing_recipients = Recipient.objects()
-    if existing_recipients.count() == 0:
-        print("Initializing default recipients...")
-        for recipient_data in default_recipients:
-            try:
-                print(
-                    f"Preparing recipient: {recipient_data['first_name']} {recipient_data['last_name']}"
-                )
-                recipient = Recipient(
-                    recipient_id=recipient_data["recipient_id"],
-                    first_name=recipient_data["first_name"],
-                    last_name=recipient_data["last_name"],
-                    organization_name=recipient_data["organization_name"],
-                    email=recipient_data["email"],
-                    phone_number=recipient_data["phone_number"],
-                    address=recipient_data["address"],
-                    ein=recipient_data["ein"],
-                    tax_status=recipient_data["tax_status"],
-                    compliance_status=recipient_data["compliance_status"],
-                    donations=recipient_data["donations"],
-                    donation_log=recipient_data["donation_log"],
-                )
-                recipient.save()
-                print(
-                    f"Recipient {recipient.first_name} {recipient.last_name} saved successfully."
-                )
-            except Exception as e:
-                print(
-                    f"Error while saving recipient {recipient_data['first_name']} {recipient_data['last_name']}: {e}"
-                )
-        print("Default recipients have been initialized.")
-    else:
-        print("Recipients already exist in the database. Initialization skipped.")
+    forget_recipient(recipient_id)
+    return recipient["compliance_status"]
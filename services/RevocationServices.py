@@ -0,0 +1,110 @@
+import datetime
+import threading
+import time
+from models.RevokedToken import RevokedToken
+
+
+REVOCATION_STORES = ["memory", "mongo"]
+
+# Revocations whose server timestamp falls this close to the last one seen
+# are fetched again, to cover writes that commit out of timestamp order
+SYNC_OVERLAP = datetime.timedelta(seconds=5)
+
+
+def utcnow():
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+# Revoked token ids of this process only, each kept until its token expires
+class InMemoryRevocationStore:
+    def __init__(self):
+        self.revoked = {}
+        self.lock = threading.Lock()
+        self.next_purge = 0.0
+
+    def revoke(self, jti, expires_at):
+        with self.lock:
+            self.revoked[jti] = expires_at
+        self.purge()
+
+    def is_revoked(self, jti):
+        expires_at = self.revoked.get(jti)
+        return expires_at is not None and expires_at > utcnow()
+
+    def purge(self):
+        if time.monotonic() < self.next_purge:
+            return
+        now = utcnow()
+        with self.lock:
+            self.revoked = {
+                jti: expires_at
+                for jti, expires_at in self.revoked.items()
+                if expires_at > now
+            }
+            self.next_purge = time.monotonic() + 60
+
+
+# Revocations shared by every worker through the revoked_tokens collection,
+# which a TTL index empties as tokens expire. Each worker mirrors the
+# unexpired revocations into an InMemoryRevocationStore and pulls new ones
+# at most once per sync_interval, so token checks do not hit the database.
+# Revocations made by the same worker apply immediately.
+class MongoRevocationStore:
+    def __init__(self, sync_interval=1.0):
+        self.local = InMemoryRevocationStore()
+        self.sync_interval = sync_interval
+        self.watermark = None
+        self.next_sync = 0.0
+        self.lock = threading.Lock()
+
+    def revoke(self, jti, expires_at):
+        RevokedToken._get_collection().update_one(
+            {"jti": jti},
+            {
+                "$setOnInsert": {"jti": jti, "expires_at": expires_at},
+                "$currentDate": {"revoked_at": True},
+            },
+            upsert=True,
+        )
+        self.local.revoke(jti, expires_at)
+
+    def is_revoked(self, jti):
+        self.sync()
+        return self.local.is_revoked(jti)
+
+    def sync(self):
+        if time.monotonic() < self.next_sync:
+            return
+        if not self.lock.acquire(blocking=False):
+            return
+        try:
+            query = {"expires_at": {"$gt": utcnow()}}
+            if self.watermark is not None:
+                query["revoked_at"] = {"$gte": self.watermark - SYNC_OVERLAP}
+            tokens = RevokedToken._get_collection().find(
+                query, {"_id": 0, "jti": 1, "expires_at": 1, "revoked_at": 1}
+            )
+            for token in tokens:
+                self.local.revoke(token["jti"], token["expires_at"])
+                revoked_at = token.get("revoked_at")
+                if revoked_at and (self.watermark is None or revoked_at > self.watermark):
+                    self.watermark = revoked_at
+            self.next_sync = time.monotonic() + self.sync_interval
+        finally:
+            self.lock.release()
+
+
+def create_revocation_store(kind="memory", sync_interval=1.0):
+    if kind == "memory":
+        return InMemoryRevocationStore()
+    if kind == "mongo":
+        return MongoRevocationStore(sync_interval)
+    raise ValueError(
+        f"Invalid token revocation store: {kind}. Must be one of {REVOCATION_STORES}."
+    )
+
+
+def token_expiry(jwt_payload):
+    return datetime.datetime.fromtimestamp(
+        jwt_payload["exp"], datetime.timezone.utc
+    ).replace(tzinfo=None)
@@ -1,4 +1,3 @@
-from .default import default_users
 from models.User import User
 from utils.Hash import get_hash
 
@@ -9,20 +8,10 @@ def create_user(email: str, password_hash: str):
 
 
 def find_user_by_email(email: str):
-    return User.objects.filter(email=email).first()
+    return User.objects.filter(email=email).only("email", "password_hash").first()
 
 
 def delete_user(email: str):
-    user = User.objects.filter(email=email).first()
-    if not user:
+    if not User.objects.filter(email=email).delete():
         return None
-    user.delete()
     return {"message": f"User with email {email} has been deleted"}
-
-
-def init_users():
-    existing_users = User.objects()
-    if len(existing_users) == 0:
-        for user_email in default_users:
-            password_hash = get_hash(default_users[user_email].encode('utf-8'))
-            create_user(user_email, password_hash)
@@ -87,7 +87,7 @@ default_donors = [
                 },
             }
         ],
-        "ratings": {"stars": 5.0, "total_ratings": 1},
+        "ratings": {"stars_sum": 5, "total_ratings": 1},
         "impact_log": {
             "total_donations": 1,
             "total_lbs_food": 100.0,
@@ -115,7 +115,7 @@ default_donors = [
         "tax_id": "987654321",
         "company_association": "Carnegie Mellon University",
         "donations": [],
-        "ratings": {"stars": 0.0, "total_ratings": 0},
+        "ratings": {"stars_sum": 0, "total_ratings": 0},
         "impact_log": {
             "total_donations": 0,
             "total_lbs_food": 0.0,
@@ -0,0 +1,33 @@
+from flask_jwt_extended import get_jwt, get_jwt_identity
+from services.DonorServices import get_donor_id_by_email
+from services.RecipientServices import get_recipient_id_by_email
+
+
+# Claims added to every access token so handlers know who the caller is
+# without looking the profile up again
+def identity_claims(email):
+    donor_id = get_donor_id_by_email(email)
+    recipient_id = get_recipient_id_by_email(email)
+    claims = {"role": "donor" if donor_id else "recipient" if recipient_id else "user"}
+    if donor_id:
+        claims["donor_id"] = donor_id
+    if recipient_id:
+        claims["recipient_id"] = recipient_id
+    return claims
+
+
+# The donor/recipient ids in the token are trusted as-is. Tokens issued
+# before the caller's profile existed carry no id, so those fall back to a
+# lookup by the token's email.
+def current_donor_id():
+    claims = get_jwt()
+    if "donor_id" in claims:
+        return claims["donor_id"]
+    return get_donor_id_by_email(get_jwt_identity())
+
+
+def current_recipient_id():
+    claims = get_jwt()
+    if "recipient_id" in claims:
+        return claims["recipient_id"]
+    return get_recipient_id_by_email(get_jwt_identity())
@@ -0,0 +1,120 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+# Every cache by name, so that their statistics can be reported at /metrics
+caches = {}
+
+
+# A load in progress. Callers asking for the same key while it runs wait for
+# its result instead of starting a load of their own.
+class Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        # Set when the key is invalidated during the load: the result is
+        # still handed to the callers waiting for it, but never stored
+        self.invalidated = False
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+# Bounded in-process cache: least recently used entries are evicted past
+# `maxsize` and entries expire `ttl` seconds after they were loaded. A
+# maxsize of 0 disables it, every lookup then loads.
+class LRUCache:
+    def __init__(self, name, maxsize=1024, ttl=10.0, clock=time.monotonic):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.flights = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = {"size": 0, "expired": 0, "invalidated": 0}
+        caches[name] = self
+
+    def configure(self, maxsize, ttl):
+        with self.lock:
+            self.maxsize = maxsize
+            self.ttl = ttl
+            self.entries.clear()
+
+    # Returns the cached value of `key`, or calls `load` to produce it. Only
+    # one load per key runs at a time.
+    def get_or_load(self, key, load):
+        leader = False
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > self.clock():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.entries[key]
+                self.evictions["expired"] += 1
+            flight = self.flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+            else:
+                self.misses += 1
+                flight = self.flights[key] = Flight()
+                leader = True
+        if not leader:
+            return flight.wait()
+        try:
+            flight.value = load()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+                if flight.error is None and not flight.invalidated:
+                    self.store(key, flight.value)
+            flight.done.set()
+        return flight.value
+
+    # Called with the lock held
+    def store(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self.entries[key] = (self.clock() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions["size"] += 1
+
+    # Drops every entry whose key satisfies `predicate`, and keeps loads of
+    # such keys already in progress from storing what they read
+    def invalidate(self, predicate):
+        with self.lock:
+            for key in [key for key in self.entries if predicate(key)]:
+                del self.entries[key]
+                self.evictions["invalidated"] += 1
+            for key, flight in self.flights.items():
+                if predicate(key):
+                    flight.invalidated = True
+
+    def clear(self):
+        self.invalidate(lambda key: True)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": dict(self.evictions),
+            }
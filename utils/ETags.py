@@ -0,0 +1,33 @@
+import hashlib
+from flask import Response, request
+
+
+# Cache-Control sent with tagged responses: clients keep the body but
+# revalidate it with If-None-Match before every use
+PUBLIC = "public, no-cache"
+PRIVATE = "private, no-cache"
+
+
+# Strong validator of a representation: a digest of `key`, whatever selects
+# the representation (route and arguments), and of the _id and version of
+# every document it is built from, in order. Returned unquoted.
+def make_etag(key, stamps):
+    digest = hashlib.blake2b(repr(key).encode("utf-8"), digest_size=16)
+    for stamp in stamps:
+        digest.update(f"{stamp.get('_id')}:{stamp.get('version', 0)};".encode())
+    return digest.hexdigest()
+
+
+# Whether the client's If-None-Match already names `etag`
+def fresh(etag):
+    return request.if_none_match.contains_weak(etag)
+
+
+def tagged(response, etag, cache_control=PUBLIC):
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = cache_control
+    return response
+
+
+def not_modified(etag, cache_control=PUBLIC):
+    return tagged(Response(status=304), etag, cache_control)
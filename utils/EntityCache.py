@@ -0,0 +1,387 @@
+import contextlib
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from urllib.parse import unquote, urlsplit
+import bson
+from utils.Cache import caches
+
+
+logger = logging.getLogger(__name__)
+
+ENTITY_CACHE_BACKENDS = ["memory", "resp", "none"]
+
+
+class RespError(Exception):
+    pass
+
+
+# Entries of this process only, least recently used dropped past maxsize.
+# Values are bytes; `ttl` is in seconds.
+#
+# Both backends also offer update(keys, change): `change` is called with the
+# current values of `keys` and returns the writes to make, {key: (value,
+# ttl)} or {key: None} to delete, or nothing to leave the backend as it is.
+# No other write to `keys` lands between the read and the writes. Returns
+# whether the writes were made.
+class MemoryBackend:
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.store(key, value, ttl)
+
+    # Callers hold the lock
+    def store(self, key, value, ttl):
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    # Sets the key only if it holds no live value; returns whether it did
+    def add(self, key, value, ttl):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                return False
+            self.entries[key] = (time.monotonic() + ttl, value)
+            return True
+
+    def delete(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def update(self, keys, change):
+        with self.lock:
+            now = time.monotonic()
+            current = []
+            for key in keys:
+                entry = self.entries.get(key)
+                current.append(entry[1] if entry and entry[0] > now else None)
+            writes = change(*current)
+            if not writes:
+                return False
+            for key, write in writes.items():
+                if write is None:
+                    self.entries.pop(key, None)
+                else:
+                    self.store(key, *write)
+            return True
+
+    def size(self):
+        return len(self.entries)
+
+
+# A Redis-protocol (RESP2) server shared by every worker, e.g.
+# resp://localhost:6379/0 or resp://:password@cache:6379/2. Connections are
+# pooled per process and opened again after a fork. update() is a WATCH /
+# MULTI / EXEC transaction, tried again while a watched key keeps changing.
+class RespBackend:
+    def __init__(self, url, timeout=0.25, attempts=3):
+        parts = urlsplit(url)
+        self.address = (parts.hostname or "localhost", parts.port or 6379)
+        self.password = unquote(parts.password) if parts.password else None
+        self.db = int(parts.path.strip("/") or 0)
+        self.timeout = timeout
+        self.attempts = attempts
+        self.idle = []
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+
+    def connect(self):
+        sock = socket.create_connection(self.address, self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        connection = (sock, sock.makefile("rb"))
+        try:
+            if self.password:
+                self.call(connection, "AUTH", self.password)
+            if self.db:
+                self.call(connection, "SELECT", self.db)
+        except BaseException:
+            sock.close()
+            raise
+        return connection
+
+    # A pooled connection, returned to the pool once the block is done. One
+    # that fails in any way is closed instead: it may hold an unread reply or
+    # be inside a transaction.
+    @contextlib.contextmanager
+    def connection(self):
+        with self.lock:
+            if self.pid != os.getpid():
+                self.idle, self.pid = [], os.getpid()
+            connection = self.idle.pop() if self.idle else None
+        if connection is None:
+            connection = self.connect()
+        try:
+            yield connection
+        except BaseException:
+            connection[0].close()
+            raise
+        with self.lock:
+            self.idle.append(connection)
+
+    def command(self, *args):
+        with self.connection() as connection:
+            return self.call(connection, *args)
+
+    @staticmethod
+    def call(connection, *args):
+        sock, reader = connection
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        sock.sendall(b"".join(parts))
+        return RespBackend.read_reply(reader)
+
+    @staticmethod
+    def read_reply(reader):
+        line = reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Connection closed by the cache server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest
+        if kind == b"-":
+            raise RespError(rest.decode("utf-8", "replace"))
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = reader.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError("Connection closed by the cache server")
+            return data[:-2]
+        if kind == b"*":
+            count = int(rest)
+            if count < 0:
+                return None
+            return [RespBackend.read_reply(reader) for _ in range(count)]
+        raise RespError(f"Unexpected reply: {line!r}")
+
+    def get(self, key):
+        return self.command("GET", key)
+
+    def set(self, key, value, ttl):
+        self.command("SET", key, value, "PX", int(ttl * 1000))
+
+    def add(self, key, value, ttl):
+        reply = self.command("SET", key, value, "NX", "PX", int(ttl * 1000))
+        return reply is not None
+
+    def delete(self, *keys):
+        if keys:
+            self.command("DEL", *keys)
+
+    def update(self, keys, change):
+        with self.connection() as connection:
+            for _ in range(self.attempts):
+                self.call(connection, "WATCH", *keys)
+                writes = change(*self.call(connection, "MGET", *keys))
+                if not writes:
+                    self.call(connection, "UNWATCH")
+                    return False
+                self.call(connection, "MULTI")
+                for key, write in writes.items():
+                    if write is None:
+                        self.call(connection, "DEL", key)
+                    else:
+                        value, ttl = write
+                        self.call(connection, "SET", key, value, "PX", int(ttl * 1000))
+                # None when a watched key changed since WATCH
+                if self.call(connection, "EXEC") is not None:
+                    return True
+        return False
+
+    def size(self):
+        return None
+
+
+# Read-through cache of documents, and of small values such as the id of the
+# profile with a given email, by (kind, key).
+#
+# A cold key is loaded by one caller at a time: the first takes a lock entry
+# in the backend, the others poll for the value until the lock is released
+# or expires. Writes forget the keys they touch, and the lock with them, so
+# a load already running does not store what it read before the write.
+# Documents with a version are written through with put(), which never
+# replaces a newer version and drops the lock as forget() does. Both checks
+# are made in one backend update() with the store they guard. If the backend fails, values are loaded from
+# the database as if the cache were empty.
+class EntityCache:
+    def __init__(self, backend, ttl=5.0, lock_ttl=2.0, poll=0.01, name="entities"):
+        self.backend = backend
+        self.ttl = ttl
+        self.lock_ttl = lock_ttl
+        self.poll = poll
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidated = 0
+        self.next_warning = 0.0
+
+    @staticmethod
+    def key(kind, key):
+        return f"entity:{kind}:{key}"
+
+    def warn(self, action, error):
+        if time.monotonic() >= self.next_warning:
+            self.next_warning = time.monotonic() + 60
+            logger.warning("Entity cache %s failed: %s", action, error)
+
+    def read(self, key):
+        try:
+            raw = self.backend.get(key)
+        except (OSError, RespError) as e:
+            self.warn("read", e)
+            return None
+        return None if raw is None else bson.decode(raw)
+
+    # Returns the cached value, or calls `load` to produce it. None, for a
+    # missing document, is returned but not cached.
+    def get(self, kind, key, load):
+        if self.backend is None:
+            return load()
+        key = self.key(kind, key)
+        entry = self.read(key)
+        if entry is not None:
+            self.hits += 1
+            return entry["value"]
+        lock = key + ":lock"
+        token = uuid.uuid4().hex.encode()
+        try:
+            leader = self.backend.add(lock, token, self.lock_ttl)
+        except (OSError, RespError) as e:
+            self.warn("lock", e)
+            return load()
+        if leader:
+            # The previous holder may have stored the value and released the
+            # lock since the read above
+            entry = self.read(key)
+            if entry is not None:
+                self.release(key, lock, token, None)
+                self.hits += 1
+                return entry["value"]
+            self.misses += 1
+            value = None
+            try:
+                value = load()
+            finally:
+                self.release(key, lock, token, value)
+            return value
+        self.coalesced += 1
+        deadline = time.monotonic() + self.lock_ttl
+        while time.monotonic() < deadline:
+            time.sleep(self.poll)
+            entry = self.read(key)
+            if entry is not None:
+                return entry["value"]
+            try:
+                if self.backend.get(lock) is None:
+                    break
+            except (OSError, RespError):
+                break
+        # The holder may have stored the value just before releasing the lock
+        entry = self.read(key)
+        return entry["value"] if entry is not None else load()
+
+    # Stores what the lock holder loaded, unless a write forgot the key (and
+    # the lock) in the meantime, and lets the waiting callers go
+    def release(self, key, lock, token, value):
+        writes = {lock: None}
+        if value is not None:
+            writes[key] = (bson.encode({"value": value}), self.ttl)
+        try:
+            self.backend.update([lock], lambda held: writes if held == token else None)
+        except (OSError, RespError) as e:
+            self.warn("write", e)
+
+    # Writes a document back after the database write that produced it,
+    # unless the cache already holds the same or a later version. The lock
+    # is dropped either way: a load running meanwhile may have read the
+    # document from before the write.
+    def put(self, kind, key, document):
+        if self.backend is None:
+            return
+        key = self.key(kind, key)
+        lock = key + ":lock"
+        version = document.get("version", 0)
+        entry = bson.encode({"value": document})
+
+        def change(raw):
+            cached = None if raw is None else bson.decode(raw)["value"]
+            if cached is not None and cached.get("version", 0) >= version:
+                return {lock: None}
+            return {key: (entry, self.ttl), lock: None}
+
+        try:
+            self.backend.update([key], change)
+        except (OSError, RespError) as e:
+            self.warn("write", e)
+
+    def forget(self, kind, *keys):
+        if self.backend is None:
+            return
+        keys = [self.key(kind, key) for key in keys if key]
+        try:
+            self.backend.delete(*keys, *(key + ":lock" for key in keys))
+        except (OSError, RespError) as e:
+            self.warn("invalidation", e)
+            return
+        self.invalidated += len(keys)
+
+    def stats(self):
+        return {
+            "entries": self.backend.size() if self.backend else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": {"invalidated": self.invalidated},
+        }
+
+
+def create_backend(backend, url=None):
+    if backend not in ENTITY_CACHE_BACKENDS:
+        raise ValueError(
+            f"Invalid entity cache backend: {backend}. "
+            f"Must be one of {ENTITY_CACHE_BACKENDS}."
+        )
+    if backend == "resp":
+        return RespBackend(url or "resp://localhost:6379/0")
+    if backend == "memory":
+        return MemoryBackend()
+    return None
+
+
+entity_cache = EntityCache(MemoryBackend())
+caches[entity_cache.name] = entity_cache
+
+
+def configure_entity_cache(backend, url=None, ttl=5.0):
+    entity_cache.backend = create_backend(backend, url)
+    entity_cache.ttl = ttl
@@ -0,0 +1,54 @@
+class InvalidFieldsError(ValueError):
+    pass
+
+
+# Parses a `fields=` query parameter ("first_name,address.city") into the
+# list of paths to return, checking each against the model's fields.
+# `hidden` fields are never returned.
+def parse_fields(fields, model, hidden=()):
+    if fields is None:
+        return None
+    paths = [path.strip() for path in fields.split(",") if path.strip()]
+    if not paths:
+        raise InvalidFieldsError("fields must name at least one field")
+    allowed = {field.db_field for field in model._fields.values()}
+    allowed -= set(hidden)
+    paths = ["_id" if path == "id" else path for path in paths]
+    for path in paths:
+        if path.split(".")[0] not in allowed:
+            raise InvalidFieldsError(f"Unknown field: {path}")
+    return paths
+
+
+# Inclusion projection for `paths`, plus `extra` paths the query itself
+# needs (e.g. its sort keys). Paths nested under another one are dropped,
+# since MongoDB rejects overlapping projections.
+def fields_projection(paths, extra=()):
+    wanted = sorted(set(paths) | set(extra))
+    projection = {
+        path: 1
+        for path in wanted
+        if not any(path.startswith(other + ".") for other in wanted)
+    }
+    if "_id" not in projection:
+        projection["_id"] = 0
+    return projection
+
+
+# Copies only `paths` out of a raw document, for results that were read with
+# extra paths
+def pick(document, paths):
+    picked = {}
+    for path in paths:
+        keys = path.split(".")
+        value = document
+        for key in keys:
+            if not isinstance(value, dict) or key not in value:
+                break
+            value = value[key]
+        else:
+            target = picked
+            for key in keys[:-1]:
+                target = target.setdefault(key, {})
+            target[keys[-1]] = value
+    return picked
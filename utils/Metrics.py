@@ -0,0 +1,306 @@
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from flask import Response, current_app, g, request
+from pymongo import monitoring
+from utils.Cache import caches
+from utils.StructuredLogging import dropped_records
+
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CHECKOUT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+
+
+# The counters written by one thread. Each thread only ever writes to its own
+# shard, so recording takes no lock; a scrape adds the shards up. A shard is
+# handed to a new thread once its thread has exited, which keeps their number
+# at the peak number of threads.
+class Shard:
+    def __init__(self):
+        self.latency = {}
+        self.in_flight = {}
+        self.responses = {}
+        self.checked_out = 0
+        self.connections = 0
+        self.checkout_wait = Histogram(CHECKOUT_BUCKETS)
+        self.checkout_failures = 0
+
+
+# Lives in a thread's locals so that the thread's exit can be observed
+class Owner:
+    pass
+
+
+class Registry:
+    def __init__(self):
+        self.shards = []
+        self.free = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def shard(self):
+        shard = getattr(self.local, "shard", None)
+        if shard is None:
+            with self.lock:
+                shard = self.free.pop() if self.free else Shard()
+                if shard not in self.shards:
+                    self.shards.append(shard)
+            self.local.shard = shard
+            # Released when the thread's locals are cleared on thread exit
+            self.local.owner = owner = Owner()
+            weakref.finalize(owner, self.release, shard)
+        return shard
+
+    def release(self, shard):
+        with self.lock:
+            self.free.append(shard)
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.shards)
+
+
+registry = Registry()
+
+
+def resource_name():
+    view = current_app.view_functions.get(request.endpoint)
+    return getattr(view, "view_class", view).__name__ if view else "<unmatched>"
+
+
+def begin_request():
+    key = (resource_name(), request.method)
+    shard = registry.shard()
+    shard.in_flight[key] = shard.in_flight.get(key, 0) + 1
+    g.metrics = [key, time.perf_counter(), False]
+
+
+def record(status):
+    key, started, recorded = g.metrics
+    if recorded:
+        return
+    g.metrics[2] = True
+    shard = registry.shard()
+    histogram = shard.latency.get(key)
+    if histogram is None:
+        histogram = shard.latency[key] = Histogram(LATENCY_BUCKETS)
+    histogram.observe(time.perf_counter() - started)
+    shard.in_flight[key] -= 1
+    counter = (*key, str(status))
+    shard.responses[counter] = shard.responses.get(counter, 0) + 1
+
+
+def end_request(response):
+    if "metrics" in g:
+        record(response.status_code)
+    return response
+
+
+# Requests that raised never reach after_request
+def teardown_request(exception=None):
+    if "metrics" in g:
+        record(500)
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    def connection_created(self, event):
+        registry.shard().connections += 1
+
+    def connection_closed(self, event):
+        registry.shard().connections -= 1
+
+    def connection_checked_out(self, event):
+        shard = registry.shard()
+        shard.checked_out += 1
+        if event.duration is not None:
+            shard.checkout_wait.observe(event.duration)
+
+    def connection_checked_in(self, event):
+        registry.shard().checked_out -= 1
+
+    def connection_check_out_failed(self, event):
+        registry.shard().checkout_failures += 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+
+def sample(name, value, **labels):
+    if not labels:
+        return f"{name} {value}"
+    pairs = ",".join(f'{label}="{text}"' for label, text in labels.items())
+    return f"{name}{{{pairs}}} {value}"
+
+
+def histogram_samples(name, histogram, **labels):
+    lines = []
+    cumulative = 0
+    for bound, count in zip((*histogram.buckets, "+Inf"), histogram.counts):
+        cumulative += count
+        lines.append(sample(f"{name}_bucket", cumulative, **labels, le=bound))
+    lines.append(sample(f"{name}_sum", histogram.sum, **labels))
+    lines.append(sample(f"{name}_count", cumulative, **labels))
+    return lines
+
+
+# Renders every shard's counters in the Prometheus text exposition format
+def render():
+    shards = registry.snapshot()
+    latency, in_flight, responses = {}, {}, {}
+    checkout_wait = Histogram(CHECKOUT_BUCKETS)
+    for shard in shards:
+        for key, histogram in list(shard.latency.items()):
+            latency.setdefault(key, Histogram(LATENCY_BUCKETS)).merge(histogram)
+        for key, value in list(shard.in_flight.items()):
+            in_flight[key] = in_flight.get(key, 0) + value
+        for key, value in list(shard.responses.items()):
+            responses[key] = responses.get(key, 0) + value
+        checkout_wait.merge(shard.checkout_wait)
+
+    lines = [
+        "# HELP http_request_duration_seconds Request latency",
+        "# TYPE http_request_duration_seconds histogram",
+    ]
+    for (resource, method), histogram in sorted(latency.items()):
+        lines += histogram_samples(
+            "http_request_duration_seconds",
+            histogram,
+            resource=resource,
+            method=method,
+        )
+    lines += [
+        "# HELP http_requests_in_flight Requests being served",
+        "# TYPE http_requests_in_flight gauge",
+    ]
+    for (resource, method), value in sorted(in_flight.items()):
+        lines.append(
+            sample("http_requests_in_flight", value, resource=resource, method=method)
+        )
+    lines += [
+        "# HELP http_responses_total Responses by status code",
+        "# TYPE http_responses_total counter",
+    ]
+    for (resource, method, status), value in sorted(responses.items()):
+        lines.append(
+            sample(
+                "http_responses_total",
+                value,
+                resource=resource,
+                method=method,
+                status=status,
+            )
+        )
+    lines += [
+        "# HELP mongodb_pool_connections Open MongoDB connections",
+        "# TYPE mongodb_pool_connections gauge",
+        sample("mongodb_pool_connections", sum(s.connections for s in shards)),
+        "# HELP mongodb_pool_checked_out_connections Connections in use",
+        "# TYPE mongodb_pool_checked_out_connections gauge",
+        sample(
+            "mongodb_pool_checked_out_connections",
+            sum(s.checked_out for s in shards),
+        ),
+        "# HELP mongodb_pool_checkout_failures_total Failed connection checkouts",
+        "# TYPE mongodb_pool_checkout_failures_total counter",
+        sample(
+            "mongodb_pool_checkout_failures_total",
+            sum(s.checkout_failures for s in shards),
+        ),
+        "# HELP mongodb_pool_checkout_wait_seconds Time spent waiting for a connection",
+        "# TYPE mongodb_pool_checkout_wait_seconds histogram",
+    ]
+    lines += histogram_samples("mongodb_pool_checkout_wait_seconds", checkout_wait)
+    lines += cache_samples()
+    lines += [
+        "# HELP log_records_dropped_total Log records dropped on a full log queue",
+        "# TYPE log_records_dropped_total counter",
+        sample("log_records_dropped_total", dropped_records()),
+    ]
+    return "\n".join(lines) + "\n"
+
+
+CACHE_RESULTS = (("hit", "hits"), ("miss", "misses"), ("coalesced", "coalesced"))
+
+
+# Lookups of every in-process cache: a hit, a miss that loaded, or a lookup
+# that waited for a load of the same key already running
+def cache_samples():
+    lines = [
+        "# HELP cache_requests_total Cache lookups by result",
+        "# TYPE cache_requests_total counter",
+    ]
+    evictions = [
+        "# HELP cache_evictions_total Entries dropped by reason",
+        "# TYPE cache_evictions_total counter",
+    ]
+    entries = [
+        "# HELP cache_entries Entries held in this process",
+        "# TYPE cache_entries gauge",
+    ]
+    for name, cache in sorted(caches.items()):
+        stats = cache.stats()
+        for result, key in CACHE_RESULTS:
+            lines.append(
+                sample("cache_requests_total", stats[key], cache=name, result=result)
+            )
+        for reason, value in stats["evictions"].items():
+            evictions.append(
+                sample("cache_evictions_total", value, cache=name, reason=reason)
+            )
+        if stats["entries"] is not None:
+            entries.append(sample("cache_entries", stats["entries"], cache=name))
+    return lines + evictions + entries
+
+
+def metrics_response():
+    return Response(render(), mimetype="text/plain; version=0.0.4")
+
+
+pool_listener = None
+
+
+# Registers the pool listener, once per process, and the app's request
+# hooks. Like the query stats, this must run before the MongoClient is
+# created.
+def init_metrics(app):
+    global pool_listener
+    if not app.config.get("METRICS", True):
+        return
+    if pool_listener is None:
+        pool_listener = PoolMetricsListener()
+        monitoring.register(pool_listener)
+    app.before_request(begin_request)
+    app.after_request(end_request)
+    app.teardown_request(teardown_request)
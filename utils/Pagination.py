@@ -0,0 +1,88 @@
+import base64
+from bson import json_util
+from bson.json_util import CANONICAL_JSON_OPTIONS
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+class InvalidPageError(ValueError):
+    pass
+
+
+# Largest pagesize a list endpoint serves
+MAX_PAGESIZE = 100
+
+
+# page and pagesize from a query string: page at least 1, pagesize between 1
+# and MAX_PAGESIZE. pymongo reads a limit of 0 as no limit at all, so a
+# pagesize of 0 must never reach a query.
+def page_arguments(args, default_pagesize=10):
+    try:
+        page = int(args.get("page", 1))
+        pagesize = int(args.get("pagesize", default_pagesize))
+    except (TypeError, ValueError):
+        raise InvalidPageError("page and pagesize must be integers") from None
+    if page < 1 or not 1 <= pagesize <= MAX_PAGESIZE:
+        raise InvalidPageError(
+            f"page must be at least 1 and pagesize between 1 and {MAX_PAGESIZE}"
+        )
+    return page, pagesize
+
+
+# Cursors are the sort-key values of the last item on a page, encoded as
+# canonical extended JSON so datetimes, floats and ObjectIds round-trip
+def encode_cursor(values):
+    raw = json_util.dumps(values, json_options=CANONICAL_JSON_OPTIONS)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, sort):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json_util.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursorError(f"Invalid cursor: {cursor}") from e
+    if not isinstance(values, list) or len(values) != len(sort):
+        raise InvalidCursorError(f"Invalid cursor: {cursor}")
+    return values
+
+
+def get_path(document, path):
+    for key in path.split("."):
+        if document is None:
+            return None
+        document = document.get(key)
+    return document
+
+
+# Restricts a query to the documents that sort strictly after the cursor.
+# `sort` is a pymongo-style list of (path, direction) ending in _id.
+def apply_cursor(query, sort, cursor):
+    if not cursor:
+        return query
+    values = decode_cursor(cursor, sort)
+    clauses = []
+    for i, (path, direction) in enumerate(sort):
+        clause = {prev: value for (prev, _), value in zip(sort[:i], values[:i])}
+        clause[path] = {"$gt" if direction > 0 else "$lt": values[i]}
+        clauses.append(clause)
+    keyset = {"$or": clauses}
+    return {"$and": [query, keyset]} if query else keyset
+
+
+# `documents` is expected to hold up to pagesize + 1 raw documents; the extra
+# one only signals that another page exists
+def cursor_page(documents, sort, pagesize, item=lambda document: document):
+    documents = list(documents)
+    next_cursor = None
+    if len(documents) > pagesize:
+        documents = documents[:pagesize]
+        next_cursor = encode_cursor(
+            [get_path(documents[-1], path) for path, _ in sort]
+        )
+    return {
+        "items": [item(document) for document in documents],
+        "next_cursor": next_cursor,
+    }
@@ -0,0 +1,165 @@
+import contextvars
+import logging
+import threading
+import bson
+from flask import current_app, g, request
+from pymongo import monitoring
+
+
+logger = logging.getLogger(__name__)
+
+# Statistics of the request being served by the current thread, or None
+# outside of a request
+current = contextvars.ContextVar("query_stats", default=None)
+
+
+# Replaces every value with "?" so that queries differing only in their
+# parameters have the same shape. Lists are reduced to their first element,
+# so an $in over 3 ids and one over 30 ids match as well.
+def shape(value):
+    if isinstance(value, dict):
+        return {key: shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [shape(item) for item in value[:1]]
+    return "?"
+
+
+def query_shape(command_name, command):
+    target = command.get(command_name)
+    if not isinstance(target, str):
+        target = command.get("collection")
+    body = {
+        key: value
+        for key, value in command.items()
+        if key not in (command_name, "lsid", "$db", "$clusterTime")
+    }
+    return f"{command_name} {target} {shape(body)}"
+
+
+class RequestQueryStats:
+    def __init__(self, repeat_limit, count_bytes=False):
+        self.repeat_limit = repeat_limit
+        self.count_bytes = count_bytes
+        self.queries = 0
+        self.bytes = 0
+        self.micros = 0
+        self.shapes = {}
+
+
+# Accounts every command a request sends to MongoDB. pymongo publishes
+# command events on the thread that runs the command, so the request's
+# statistics are found through a context variable.
+class QueryStatsListener(monitoring.CommandListener):
+    def started(self, event):
+        stats = current.get()
+        if stats is None:
+            return
+        stats.queries += 1
+        key = query_shape(event.command_name, event.command)
+        repeats = stats.shapes.get(key, 0) + 1
+        stats.shapes[key] = repeats
+        if repeats == stats.repeat_limit + 1:
+            logger.warning(
+                "%s %s repeats a query more than %d times: %s",
+                request.method,
+                request.path,
+                stats.repeat_limit,
+                key,
+            )
+
+    def succeeded(self, event):
+        stats = current.get()
+        if stats is None:
+            return
+        stats.micros += event.duration_micros
+        if stats.count_bytes:
+            stats.bytes += len(bson.encode(event.reply))
+
+    def failed(self, event):
+        stats = current.get()
+        if stats is not None:
+            stats.micros += event.duration_micros
+
+
+TOTALS = ["requests", "queries", "max_queries", "bytes", "micros"]
+
+
+# Totals per endpoint ("GET /donors/<string:donor_id>") since startup
+class EndpointSummary:
+    def __init__(self):
+        self.endpoints = {}
+        self.lock = threading.Lock()
+
+    def add(self, endpoint, stats):
+        with self.lock:
+            totals = self.endpoints.setdefault(endpoint, dict.fromkeys(TOTALS, 0))
+            totals["requests"] += 1
+            totals["queries"] += stats.queries
+            totals["max_queries"] = max(totals["max_queries"], stats.queries)
+            totals["bytes"] += stats.bytes
+            totals["micros"] += stats.micros
+
+    def report(self):
+        with self.lock:
+            endpoints = {name: dict(totals) for name, totals in self.endpoints.items()}
+        return {
+            name: {
+                "requests": totals["requests"],
+                "queries": totals["queries"],
+                "queries_per_request": totals["queries"] / totals["requests"],
+                "max_queries": totals["max_queries"],
+                "bytes": totals["bytes"],
+                "db_time_ms": totals["micros"] / 1000,
+            }
+            for name, totals in sorted(endpoints.items())
+        }
+
+
+summary = EndpointSummary()
+
+
+def begin_request():
+    stats = RequestQueryStats(
+        current_app.config.get("QUERY_REPEAT_LIMIT", 5),
+        current_app.config.get("QUERY_STATS_BYTES", False),
+    )
+    g.query_stats_token = current.set(stats)
+
+
+def end_request(response):
+    stats = current.get()
+    if stats is None:
+        return response
+    rule = request.url_rule.rule if request.url_rule else "<unmatched>"
+    summary.add(f"{request.method} {rule}", stats)
+    if current_app.config.get("QUERY_STATS_HEADERS", current_app.debug):
+        response.headers["X-DB-Queries"] = str(stats.queries)
+        if stats.count_bytes:
+            response.headers["X-DB-Bytes"] = str(stats.bytes)
+        response.headers["X-DB-Time-Ms"] = f"{stats.micros / 1000:.3f}"
+    return response
+
+
+def reset_request(exception=None):
+    token = g.pop("query_stats_token", None)
+    if token is not None:
+        current.reset(token)
+
+
+listener = None
+
+
+# Registers the command listener, once per process, and the app's request
+# hooks. Must run before the MongoClient is created: pymongo only applies
+# listeners registered earlier. QUERY_STATS left as None follows app.debug.
+def init_query_stats(app):
+    global listener
+    enabled = app.config.get("QUERY_STATS")
+    if not (app.debug if enabled is None else enabled):
+        return
+    if listener is None:
+        listener = QueryStatsListener()
+        monitoring.register(listener)
+    app.before_request(begin_request)
+    app.after_request(end_request)
+    app.teardown_request(reset_request)
@@ -0,0 +1,77 @@
+from utils.Pagination import cursor_page
+from utils.Updates import STAMP_PROJECTION
+
+
+# A list read described apart from the driver that runs it, so that the
+# pymongo services and the async read endpoints share one definition of each
+# query. Either `pipeline` is aggregated, or `query` is found with
+# `projection`, `sort`, `skip` and `limit`. With `page_sort` set the result
+# is a cursor page of `pagesize` items, otherwise a list; `item` maps each
+# document to what is returned. `then` is a plan whose documents follow
+# these ones, read only when this plan returns fewer than `limit`.
+class ReadPlan:
+    def __init__(
+        self,
+        model,
+        query=None,
+        projection=None,
+        sort=None,
+        skip=0,
+        limit=0,
+        pipeline=None,
+        page_sort=None,
+        pagesize=None,
+        item=None,
+        then=None,
+    ):
+        self.model = model
+        self.query = query
+        self.projection = projection
+        self.sort = sort
+        self.skip = skip
+        self.limit = limit
+        self.pipeline = pipeline
+        self.page_sort = page_sort
+        self.pagesize = pagesize
+        self.item = item or (lambda document: document)
+        self.then = then
+
+    def cursor(self, collection):
+        if self.pipeline is not None:
+            return collection.aggregate(self.pipeline)
+        documents = collection.find(self.query, self.projection)
+        if self.sort:
+            documents = documents.sort(self.sort)
+        return documents.skip(self.skip).limit(self.limit)
+
+    # The same find reading only the version stamps of the documents, which
+    # is all an ETag needs. Not available for aggregation plans.
+    def stamps(self):
+        if self.pipeline is not None:
+            raise ValueError("Version stamps are only read for find plans")
+        return ReadPlan(
+            self.model, self.query, STAMP_PROJECTION, self.sort, self.skip, self.limit
+        )
+
+    def result(self, documents):
+        if self.page_sort is not None:
+            return cursor_page(documents, self.page_sort, self.pagesize, self.item)
+        return [self.item(document) for document in documents]
+
+
+def run_plan(plan):
+    collection = plan.model._get_collection()
+    documents = list(plan.cursor(collection))
+    if plan.then is not None and len(documents) < plan.limit:
+        documents += list(plan.then.cursor(collection))
+    return plan.result(documents[: plan.limit] if plan.then else documents)
+
+
+# Runs the plan on an asyncio driver database (motor), whose collections
+# take the same arguments as pymongo's
+async def run_plan_async(plan, database):
+    collection = database[plan.model._get_collection_name()]
+    documents = await plan.cursor(collection).to_list(length=None)
+    if plan.then is not None and len(documents) < plan.limit:
+        documents += await plan.then.cursor(collection).to_list(length=None)
+    return plan.result(documents[: plan.limit] if plan.then else documents)
@@ -0,0 +1,199 @@
+import re
+import unicodedata
+from pymongo import UpdateOne
+from utils.Fields import fields_projection, pick
+from utils.Pagination import apply_cursor, decode_cursor
+from utils.ReadPlans import ReadPlan
+
+
+# Fields maintained for search only; they are never returned by the API
+SEARCH_FIELDS = ("search_tokens", "email_lower")
+SEARCH_PROJECTION = {field: 0 for field in SEARCH_FIELDS}
+
+# Shortest and longest word prefix stored as a token. Query words longer
+# than MAX_PREFIX are cut to it, which can only widen a match.
+MIN_PREFIX = 1
+MAX_PREFIX = 12
+
+# Marks the token of a complete word, so exact matches can rank first
+EXACT = "="
+
+# Relevance is computed over at most this many matching documents, the first
+# ones in _id order; a one-letter query on a large collection is not sorted
+# in full. The matches past the window are still returned, after the ranked
+# ones and in _id order, with BEYOND_WINDOW as their relevance.
+SEARCH_WINDOW = 1000
+BEYOND_WINDOW = -1
+
+
+# Lower-cased, accent-free words of a value: "José-Luis" -> ["jose", "luis"]
+def normalize_words(value):
+    if not value:
+        return []
+    value = unicodedata.normalize("NFKD", value)
+    value = "".join(c for c in value if not unicodedata.combining(c))
+    return re.findall(r"[0-9a-z]+", value.casefold())
+
+
+# Every prefix of every word of the values, plus one exact token per word
+def search_tokens(*values):
+    tokens = set()
+    for value in values:
+        for word in normalize_words(value):
+            tokens.add(EXACT + word)
+            for length in range(MIN_PREFIX, min(len(word), MAX_PREFIX) + 1):
+                tokens.add(word[:length])
+    return sorted(tokens)
+
+
+# Filter matching documents that have a word starting with each query word,
+# or None when no name is given. A name with nothing to search by ("!!",
+# or a script the tokens do not cover) matches no document.
+def name_filter(name):
+    if not name or not name.strip():
+        return None
+    words = normalize_words(name)
+    if not words:
+        return {"search_tokens": {"$in": []}}
+    prefixes = sorted({word[:MAX_PREFIX] for word in words})
+    if len(prefixes) == 1:
+        return {"search_tokens": prefixes[0]}
+    return {"search_tokens": {"$all": prefixes}}
+
+
+def email_filter(email):
+    return {"email_lower": {"$regex": "^" + re.escape(email.strip().lower())}}
+
+
+# Counts the query words a document has as complete words
+def relevance(name):
+    exact = sorted({EXACT + word for word in normalize_words(name)})
+    return {
+        "$size": {
+            "$filter": {
+                "input": exact,
+                "as": "token",
+                "cond": {"$in": ["$$token", "$search_tokens"]},
+            }
+        }
+    }
+
+
+RELEVANCE_SORT = [("relevance", -1), ("_id", 1)]
+
+
+# Plans a name search ordered by relevance, then by _id. `query` must
+# already contain the name filter. Paged like the other list queries: by page
+# and pagesize, or by cursor when one is given. `fields` limits the returned
+# paths as in utils.Fields.
+#
+# Only the first SEARCH_WINDOW matches are ranked. The rest are read after
+# them, in _id order, by a second query that skips the window on the index
+# and only runs when the ranked page comes up short; a cursor already past
+# the window reads on from its _id alone.
+def relevance_plan(model, query, name, page, pagesize, cursor=None, fields=None):
+    matches = [{"$match": query}, {"$sort": {"_id": 1}}]
+    ranked = [
+        *matches,
+        {"$limit": SEARCH_WINDOW},
+        {"$addFields": {"relevance": relevance(name)}},
+    ]
+    if cursor is None:
+        skip = (max(page, 1) - 1) * pagesize
+        project = {
+            "$project": (
+                fields_projection(fields)
+                if fields
+                else {**SEARCH_PROJECTION, "relevance": 0}
+            )
+        }
+        beyond = ReadPlan(
+            model,
+            pipeline=[
+                *matches,
+                {"$skip": max(skip, SEARCH_WINDOW)},
+                {"$limit": pagesize},
+                project,
+            ],
+        )
+        if skip >= SEARCH_WINDOW:
+            return beyond
+        ranked += [
+            {"$sort": dict(RELEVANCE_SORT)},
+            {"$skip": skip},
+            {"$limit": pagesize},
+            project,
+        ]
+        return ReadPlan(model, pipeline=ranked, limit=pagesize, then=beyond)
+    project = {
+        "$project": (
+            fields_projection(fields, [path for path, _ in RELEVANCE_SORT])
+            if fields
+            else SEARCH_PROJECTION
+        )
+    }
+    unranked = {"$addFields": {"relevance": BEYOND_WINDOW}}
+    if fields:
+        item = lambda document: pick(document, fields)
+    else:
+        item = lambda document: {
+            key: value for key, value in document.items() if key != "relevance"
+        }
+    page = {"page_sort": RELEVANCE_SORT, "pagesize": pagesize, "item": item}
+    after = decode_cursor(cursor, RELEVANCE_SORT) if cursor else None
+    if after and after[0] == BEYOND_WINDOW:
+        pipeline = [
+            {"$match": {"$and": [query, {"_id": {"$gt": after[1]}}]}},
+            {"$sort": {"_id": 1}},
+            {"$limit": pagesize + 1},
+            unranked,
+            project,
+        ]
+        return ReadPlan(model, pipeline=pipeline, **page)
+    beyond = ReadPlan(
+        model,
+        pipeline=[
+            *matches,
+            {"$skip": SEARCH_WINDOW},
+            {"$limit": pagesize + 1},
+            unranked,
+            project,
+        ],
+    )
+    if after:
+        ranked.append({"$match": apply_cursor({}, RELEVANCE_SORT, cursor)})
+    ranked += [{"$sort": dict(RELEVANCE_SORT)}, {"$limit": pagesize + 1}, project]
+    return ReadPlan(model, pipeline=ranked, limit=pagesize + 1, then=beyond, **page)
+
+
+def search_keys(document, name_fields):
+    email = document.get("email")
+    return {
+        "search_tokens": search_tokens(*(document.get(f) for f in name_fields)),
+        "email_lower": email.lower() if email else None,
+    }
+
+
+# Recomputes the search keys of every document in `collection`, for data
+# written before they existed. Returns the number of documents changed.
+def rebuild_search_keys(collection, name_fields, batch_size=1000):
+    changed = 0
+    requests = []
+    projection = {field: 1 for field in (*name_fields, "email", *SEARCH_FIELDS)}
+    for document in collection.find({}, projection):
+        keys = search_keys(document, name_fields)
+        if all(document.get(field) == value for field, value in keys.items()):
+            continue
+        requests.append(UpdateOne({"_id": document["_id"]}, {"$set": keys}))
+        if len(requests) == batch_size:
+            changed += collection.bulk_write(requests, ordered=False).modified_count
+            requests = []
+    if requests:
+        changed += collection.bulk_write(requests, ordered=False).modified_count
+    return changed
+
+
+def without_search_fields(document):
+    return {
+        key: value for key, value in document.items() if key not in SEARCH_FIELDS
+    }
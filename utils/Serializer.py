@@ -0,0 +1,75 @@
+import datetime
+import json
+from bson import ObjectId, json_util
+from flask import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+# Same output as json_util's relaxed mode: {"$date": "...Z"} in millisecond
+# precision for dates after the epoch, {"$numberLong"} before it
+def extended_datetime(value):
+    if value.utcoffset() is not None:
+        value = (value - value.utcoffset()).replace(tzinfo=None)
+    if value < EPOCH:
+        return json_util.default(value)
+    millis = value.microsecond // 1000
+    fraction = f".{millis:03d}" if millis else ""
+    return {"$date": f"{value:%Y-%m-%dT%H:%M:%S}{fraction}Z"}
+
+
+def iso_datetime(value):
+    return value.isoformat()
+
+
+def object_id(value):
+    return {"$oid": str(value)}
+
+
+# Converters looked up by exact type. Floats need no entry: both backends
+# write them natively, so they never reach the table. Anything not listed
+# falls back to json_util.
+EXTENDED_JSON = {datetime.datetime: extended_datetime, ObjectId: object_id}
+
+# The listing endpoints have always returned plain ISO dates
+ISO_DATES = {datetime.datetime: iso_datetime, ObjectId: object_id}
+
+
+def converter(table):
+    def default(value):
+        convert = table.get(type(value))
+        if convert is not None:
+            return convert(value)
+        return json_util.default(value)
+
+    return default
+
+
+CONVERTERS = {
+    "extended": converter(EXTENDED_JSON),
+    "iso": converter(ISO_DATES),
+}
+
+
+# Encodes raw documents (from as_pymongo() or a raw pymongo find) to JSON
+# bytes. orjson is used when installed; without it the standard library
+# encoder is used with the same converters.
+def dumps(obj, dates="extended"):
+    default = CONVERTERS[dates]
+    if orjson is not None:
+        return orjson.dumps(
+            obj,
+            default=default,
+            option=orjson.OPT_PASSTHROUGH_DATETIME,
+        )
+    return json.dumps(obj, default=default, separators=(",", ":")).encode("utf-8")
+
+
+def json_response(obj, status=200, dates="extended"):
+    return Response(dumps(obj, dates), status=status, mimetype="application/json")
@@ -0,0 +1,132 @@
+import atexit
+import copy
+import datetime
+import json
+import logging
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+
+# Attributes every LogRecord has; anything else on a record came from
+# `extra=` and is written out as a field of its own
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+# One JSON object per line
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": datetime.datetime.fromtimestamp(
+                record.created, datetime.timezone.utc
+            ).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+# Hands records to the writer thread without ever blocking the request: when
+# the queue is full the record is dropped and counted instead
+class DroppingQueueHandler(QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    # The message and traceback are rendered here, while the arguments still
+    # hold the values they had when the record was logged
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+# Keeps a fraction of the DEBUG records of the loggers in `rates`, and of
+# their children, for debug events too frequent to keep them all
+class SamplingFilter(logging.Filter):
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        name = record.name
+        while name not in self.rates:
+            if not name:
+                return True
+            name = name.rpartition(".")[0]
+        return random.random() < self.rates[name]
+
+
+# Defers building a log argument until the record is actually formatted:
+# logger.debug("donor %s", lazy(lambda: donor.to_mongo().to_dict()))
+class lazy:
+    def __init__(self, function):
+        self.function = function
+
+    def __str__(self):
+        return str(self.function())
+
+
+listener = None
+queue_handler = None
+
+
+# Records dropped so far because the log queue was full, for /metrics
+def dropped_records():
+    return queue_handler.dropped if queue_handler is not None else 0
+
+
+# Routes every logger through a bounded queue to a single writer thread that
+# prints JSON lines to stderr. LOG_LEVELS maps logger names ("" is the root
+# logger) to levels; LOG_SAMPLING maps logger names to the fraction of their
+# DEBUG records that is kept.
+def configure_logging(app):
+    global listener, queue_handler
+    if listener is not None:
+        listener.stop()
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter())
+    log_queue = queue.Queue(app.config.get("LOG_QUEUE_SIZE", 10000))
+    listener = QueueListener(log_queue, handler, respect_handler_level=True)
+
+    dropped = dropped_records()
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.dropped = dropped
+    queue_handler.addFilter(SamplingFilter(app.config.get("LOG_SAMPLING", {})))
+    root = logging.getLogger()
+    for existing in [h for h in root.handlers if isinstance(h, QueueHandler)]:
+        root.removeHandler(existing)
+    root.addHandler(queue_handler)
+    for name, level in app.config.get("LOG_LEVELS", {"": "INFO"}).items():
+        logging.getLogger(name or None).setLevel(level)
+
+    listener.start()
+    return listener
+
+
+# Flushes the records still queued when the process exits
+@atexit.register
+def stop_logging():
+    if listener is not None:
+        listener.stop()
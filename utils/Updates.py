@@ -0,0 +1,48 @@
+from pymongo import ReturnDocument
+
+
+# Donation, Donor and Recipient documents carry a version that every service
+# write increments; the ETags of GET responses are built from it
+VERSION_FIELD = "version"
+
+# Reads just enough of a document to build its ETag
+STAMP_PROJECTION = {"_id": 1, VERSION_FIELD: 1}
+
+
+# Adds the version increment to an update document, or appends a stage doing
+# the same to an update pipeline
+def versioned(update):
+    if isinstance(update, list):
+        version = {"$ifNull": [f"${VERSION_FIELD}", 0]}
+        return update + [{"$set": {VERSION_FIELD: {"$add": [version, 1]}}}]
+    return {**update, "$inc": {**update.get("$inc", {}), VERSION_FIELD: 1}}
+
+
+# Builds a $set document for the supplied fields of `document_class`,
+# validated the same way save() would validate them. Fields whose value is
+# None are left out; `prefix` is the path of an embedded document, e.g.
+# "listing.".
+def set_fields(document_class, values, prefix=""):
+    updates = {}
+    for name, value in values.items():
+        if value is None:
+            continue
+        field = document_class._fields[name]
+        value = field.to_python(value)
+        field._validate(value)
+        updates[prefix + field.db_field] = field.to_mongo(value)
+    return updates
+
+
+# Applies `updates` with one find_one_and_update and returns the projected
+# post-image, or None if nothing matched `query`. With no updates it is a
+# plain read and the version is left as it is.
+def find_and_set(collection, query, updates, projection):
+    if not updates:
+        return collection.find_one(query, projection)
+    return collection.find_one_and_update(
+        query,
+        versioned({"$set": updates}),
+        projection=projection,
+        return_document=ReturnDocument.AFTER,
+    )
@@ -0,0 +1,197 @@
+import datetime
+from flask import request
+from flask_restful import abort
+
+
+# Coercions by field type. Each takes a JSON (or form) value that is not
+# None and returns the converted value or raises ValueError with the message
+# reported for the field.
+def to_str(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise ValueError("Must be a string")
+
+
+def to_int(value):
+    if isinstance(value, bool):
+        raise ValueError("Must be an integer")
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        try:
+            return int(value.strip())
+        except ValueError:
+            pass
+    raise ValueError("Must be an integer")
+
+
+def to_float(value):
+    if isinstance(value, bool):
+        raise ValueError("Must be a number")
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value.strip())
+        except ValueError:
+            pass
+    raise ValueError("Must be a number")
+
+
+def to_bool(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.lower() in ("true", "false"):
+        return value.lower() == "true"
+    raise ValueError("Must be true or false")
+
+
+def to_date(value):
+    try:
+        return datetime.datetime.strptime(value, "%Y-%m-%d")
+    except (TypeError, ValueError):
+        raise ValueError("Must be a date (YYYY-MM-DD)") from None
+
+
+def to_dict(value):
+    if isinstance(value, dict):
+        return value
+    raise ValueError("Must be an object")
+
+
+# Field types accepted by Field
+DATE = "date"
+COERCIONS = {
+    str: to_str,
+    int: to_int,
+    float: to_float,
+    bool: to_bool,
+    dict: to_dict,
+    DATE: to_date,
+}
+
+REQUIRED = object()
+
+
+class Field:
+    def __init__(
+        self,
+        type=str,
+        required=False,
+        default=None,
+        help=None,
+        choices=None,
+        minimum=None,
+        maximum=None,
+    ):
+        if type not in COERCIONS:
+            raise ValueError(f"Unsupported field type: {type!r}")
+        self.type = type
+        self.required = required
+        self.default = default
+        self.help = help
+        self.choices = choices
+        self.minimum = minimum
+        self.maximum = maximum
+
+    # Folds the coercion and the checks into a single function of the value
+    def compile(self):
+        coerce = COERCIONS[self.type]
+        checks = []
+        if self.choices is not None:
+            # Matched without regard to case, returned as spelled in choices
+            options = {str(choice).lower(): choice for choice in self.choices}
+            message = f"Must be one of {list(self.choices)}"
+
+            def choose(value):
+                try:
+                    return options[str(value).lower()]
+                except KeyError:
+                    raise ValueError(message) from None
+
+            checks.append(choose)
+        if self.minimum is not None:
+            minimum, message = self.minimum, f"Must be at least {self.minimum}"
+
+            def at_least(value):
+                if value < minimum:
+                    raise ValueError(message)
+                return value
+
+            checks.append(at_least)
+        if self.maximum is not None:
+            maximum, message = self.maximum, f"Must be at most {self.maximum}"
+
+            def at_most(value):
+                if value > maximum:
+                    raise ValueError(message)
+                return value
+
+            checks.append(at_most)
+        if not checks:
+            return coerce
+
+        def convert(value):
+            value = coerce(value)
+            for check in checks:
+                value = check(value)
+            return value
+
+        return convert
+
+
+# The fields of a request body. The fields are compiled once, when the
+# schema is built; validating a body is then one pass over them, and every
+# field that is missing or invalid is reported, not just the first.
+class Schema:
+    def __init__(self, **fields):
+        self.fields = fields
+        self.compiled = tuple(
+            (
+                name,
+                field.compile(),
+                REQUIRED if field.required else field.default,
+                field.help or f"{name} is required",
+            )
+            for name, field in fields.items()
+        )
+
+    # Returns (values, errors). Values hold every field of the schema, the
+    # default for the ones left out; errors map field names to messages.
+    def validate(self, data):
+        if not isinstance(data, dict):
+            return {}, {"body": "Must be a JSON object"}
+        values, errors = {}, {}
+        for name, convert, default, missing in self.compiled:
+            value = data.get(name)
+            if value is None:
+                if default is REQUIRED:
+                    errors[name] = missing
+                else:
+                    values[name] = default
+                continue
+            try:
+                values[name] = convert(value)
+            except ValueError as e:
+                errors[name] = str(e)
+        return values, errors
+
+    # Validates the body of the current request, aborting with 400 and all
+    # the errors, in the same shape reqparse used, if there are any
+    def parse(self):
+        values, errors = self.validate(request_body())
+        if errors:
+            abort(400, message=errors)
+        return values
+
+
+# The body of the current request, decoded once: JSON, or else form fields
+def request_body():
+    body = request.get_json(silent=True)
+    if body is None:
+        return request.form.to_dict()
+    return body
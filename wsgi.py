@@ -0,0 +1,9 @@
+"""Production WSGI entry point.
+
+    gunicorn -c gunicorn.conf.py
+"""
+from app import create_app
+
+
+# Workers are separate processes, so revoked tokens are shared through MongoDB
+application = create_app({"JWT_REVOCATION_STORE": "mongo"})